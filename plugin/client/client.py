@@ -1,11 +1,43 @@
+import copy
+import os
 from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+import structlog
 from cloudquery.sdk.scheduler import Client as ClientABC
 
+from plugin.lseg.cache import FileCache
+from plugin.lseg.discovery import DISCOVERY_MODES
+from plugin.lseg.sessions import earliest_today, latest_today
+from plugin.lseg.state import StateStore
 from plugin.lseg.client import LSEGClient
+from plugin.metrics import Metrics
+from plugin.tables.aggregates import AggregateStore
+from plugin.tables.instruments import InstrumentFilter
+from plugin.tables.pipeline import FairShare
+
+if TYPE_CHECKING:
+    from plugin.tables.decode_pool import DecodePool
 
 DEFAULT_CONCURRENCY = 10
 DEFAULT_QUEUE_SIZE = 10000
 DEFAULT_RETRY_LIMIT = 3
+DEFAULT_PREFETCH_WINDOW = 8
+DEFAULT_OVERLAP_MINUTES = 2
+DEFAULT_CACHE_MAX_BYTES = 1024**3
+DEFAULT_CACHE_MAX_AGE_DAYS = 7
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_FANOUT_BUFFER = 64
+DEFAULT_TIMEOUT_SECONDS = 60
+DEFAULT_RETRY_BUDGET = 100
+DEFAULT_BATCH_ROWS = 10000
+DEFAULT_BATCH_BYTES = 8 * 1024 * 1024
+DEFAULT_BATCH_MAX_LATENCY_SECONDS = 1.0
+DEFAULT_REQUEST_BURST = 20
+DEFAULT_LATENCY_TOLERANCE = 3.0
+DEFAULT_PUBLICATION_DELAY_SECONDS = 60.0
+DEFAULT_POLL_INTERVAL_SECONDS = 5.0
 
 
 @dataclass
@@ -15,22 +47,270 @@ class Spec:
     base_url: str = field(default="https://dmd.lseg.com/dmd/")
     concurrency: int = field(default=DEFAULT_CONCURRENCY)
     queue_size: int = field(default=DEFAULT_QUEUE_SIZE)
+    prefetch_window: int = field(default=DEFAULT_PREFETCH_WINDOW)
+    state_file: str = field(default=None)
+    overlap_minutes: int = field(default=DEFAULT_OVERLAP_MINUTES)
+    start_date: str = field(default=None)
+    end_date: str = field(default=None)
+    holidays: List[str] = field(default_factory=list)
+    cache_dir: str = field(default=None)
+    cache_max_bytes: int = field(default=DEFAULT_CACHE_MAX_BYTES)
+    cache_max_age_days: int = field(default=DEFAULT_CACHE_MAX_AGE_DAYS)
+    stream: bool = field(default=False)
+    chunk_size: int = field(default=DEFAULT_CHUNK_SIZE)
+    fanout_buffer: int = field(default=DEFAULT_FANOUT_BUFFER)
+    timeout_seconds: float = field(default=DEFAULT_TIMEOUT_SECONDS)
+    keep_alive: bool = field(default=True)
+    http2: bool = field(default=False)
+    retry_limit: int = field(default=DEFAULT_RETRY_LIMIT)
+    retry_budget: int = field(default=DEFAULT_RETRY_BUDGET)
+    backoff_base_seconds: float = field(default=0.5)
+    backoff_max_seconds: float = field(default=30.0)
+    requests_per_second: float = field(default=0.0)
+    request_burst: int = field(default=DEFAULT_REQUEST_BURST)
+    initial_in_flight: int = field(default=None)
+    min_in_flight: int = field(default=1)
+    max_in_flight: int = field(default=None)
+    latency_tolerance: float = field(default=DEFAULT_LATENCY_TOLERANCE)
+    discovery: str = field(default="auto")
+    bulk: bool = field(default=False)
+    decode_workers: int = field(default=0)
+    instruments: Dict[str, Any] = field(default_factory=dict)
+    dedup: bool = field(default=True)
+    batch_rows: int = field(default=DEFAULT_BATCH_ROWS)
+    batch_bytes: int = field(default=DEFAULT_BATCH_BYTES)
+    batch_max_latency_seconds: float = field(default=DEFAULT_BATCH_MAX_LATENCY_SECONDS)
+    tail: bool = field(default=False)
+    publication_delay_seconds: float = field(default=DEFAULT_PUBLICATION_DELAY_SECONDS)
+    poll_interval_seconds: float = field(default=DEFAULT_POLL_INTERVAL_SECONDS)
+    metrics_file: str = field(default=None)
+    metrics_port: int = field(default=None)
 
     def validate(self):
         if self.username is None:
             raise Exception("username must be provided")
         if self.password is None:
             raise Exception("password must be provided")
+        if self.concurrency < 1:
+            raise Exception("concurrency must be at least 1")
+        if self.queue_size < 1:
+            raise Exception("queue_size must be at least 1")
+        if self.prefetch_window < 1:
+            raise Exception("prefetch_window must be at least 1")
+        if self.overlap_minutes < 0:
+            raise Exception("overlap_minutes must not be negative")
+        if self.end_date is not None and self.start_date is None:
+            raise Exception("end_date requires start_date")
+        if self.start_date is not None:
+            end_date = date.fromisoformat(self.end_date or self.start_date)
+            if date.fromisoformat(self.start_date) > end_date:
+                raise Exception("start_date must not be after end_date")
+        for holiday in self.holidays:
+            date.fromisoformat(holiday)
+        if self.cache_max_bytes <= 0:
+            raise Exception("cache_max_bytes must be positive")
+        if self.cache_max_age_days <= 0:
+            raise Exception("cache_max_age_days must be positive")
+        if self.chunk_size <= 0:
+            raise Exception("chunk_size must be positive")
+        if self.fanout_buffer < 1:
+            raise Exception("fanout_buffer must be at least 1")
+        if self.timeout_seconds <= 0:
+            raise Exception("timeout_seconds must be positive")
+        if self.retry_limit < 1:
+            raise Exception("retry_limit must be at least 1")
+        if self.retry_budget < 0:
+            raise Exception("retry_budget must not be negative")
+        if self.requests_per_second < 0:
+            raise Exception("requests_per_second must not be negative")
+        if self.request_burst < 1:
+            raise Exception("request_burst must be at least 1")
+        if self.min_in_flight < 1:
+            raise Exception("min_in_flight must be at least 1")
+        if self.max_in_flight is not None and self.max_in_flight < self.min_in_flight:
+            raise Exception("max_in_flight must not be below min_in_flight")
+        if self.initial_in_flight is not None and self.initial_in_flight < 1:
+            raise Exception("initial_in_flight must be at least 1")
+        if self.latency_tolerance <= 1:
+            raise Exception("latency_tolerance must be greater than 1")
+        if self.discovery not in DISCOVERY_MODES:
+            raise Exception(f"discovery must be one of {', '.join(DISCOVERY_MODES)}")
+        InstrumentFilter.from_spec(self.instruments)
+        if self.decode_workers < 0:
+            raise Exception("decode_workers must not be negative")
+        if self.batch_rows < 1:
+            raise Exception("batch_rows must be at least 1")
+        if self.batch_bytes < 1:
+            raise Exception("batch_bytes must be at least 1")
+        if self.batch_max_latency_seconds < 0:
+            raise Exception("batch_max_latency_seconds must not be negative")
+        if self.publication_delay_seconds < 0:
+            raise Exception("publication_delay_seconds must not be negative")
+        if self.poll_interval_seconds <= 0:
+            raise Exception("poll_interval_seconds must be positive")
+        if self.metrics_port is not None and not 0 < self.metrics_port < 65536:
+            raise Exception("metrics_port must be a valid TCP port")
+
+    def trading_days(self) -> List[date]:
+        # Weekends and configured holidays never have minute files, each feed
+        # skips its own venue's closing days.
+        start = date.fromisoformat(self.start_date)
+        end = date.fromisoformat(self.end_date) if self.end_date else latest_today()
+        holidays = {date.fromisoformat(holiday) for holiday in self.holidays}
+        days = []
+        while start <= end:
+            if start.isoweekday() <= 5 and start not in holidays:
+                days.append(start)
+            start += timedelta(days=1)
+        return days
 
 
 class Client(ClientABC):
-    def __init__(self, spec: Spec) -> None:
+    def __init__(
+        self, spec: Spec, logger=None, decode_pool: Optional["DecodePool"] = None
+    ) -> None:
         self._spec = spec
-        self._client = LSEGClient(spec.username, spec.password, spec.base_url)
+        self._decode_pool = decode_pool
+        self._instruments = InstrumentFilter.from_spec(spec.instruments)
+        self._logger = logger if logger is not None else structlog.get_logger()
+        self._state = StateStore(spec.state_file)
+        # Derived tables resume from checkpoints kept next to the state.
+        self._aggregates = AggregateStore(
+            f"{spec.state_file}.aggregates" if spec.state_file is not None else None
+        )
+        self._cache = None
+        if spec.cache_dir is not None:
+            self._cache = FileCache(
+                spec.cache_dir,
+                max_bytes=spec.cache_max_bytes,
+                max_age_seconds=spec.cache_max_age_days * 24 * 60 * 60,
+            )
+        self._metrics = Metrics()
+        # Decoding is CPU bound: as many blocks at a time as there are cores,
+        # or worker processes when decoding in a pool.
+        self._decode_share = FairShare(
+            spec.decode_workers if decode_pool is not None else os.cpu_count() or 1
+        )
+        self._metrics.gauge("lseg_decode_waiting", self._decode_share.waiting)
+        if spec.metrics_port is not None:
+            self._metrics.serve(spec.metrics_port)
+        self._client = LSEGClient(
+            spec.username,
+            spec.password,
+            spec.base_url,
+            prefetch_window=spec.prefetch_window,
+            state=self._state,
+            overlap_minutes=spec.overlap_minutes,
+            cache=self._cache,
+            stream=spec.stream,
+            chunk_size=spec.chunk_size,
+            fanout_buffer=spec.fanout_buffer,
+            # Every table can have a full prefetch window in flight at once.
+            pool_size=spec.concurrency * spec.prefetch_window,
+            timeout=spec.timeout_seconds,
+            keep_alive=spec.keep_alive,
+            http2=spec.http2,
+            retry_limit=spec.retry_limit,
+            retry_budget=spec.retry_budget,
+            backoff_base=spec.backoff_base_seconds,
+            backoff_max=spec.backoff_max_seconds,
+            requests_per_second=spec.requests_per_second,
+            request_burst=spec.request_burst,
+            # Tables start with one request each and the window grows from
+            # there while DMD keeps up.
+            initial_in_flight=(
+                spec.initial_in_flight
+                if spec.initial_in_flight is not None
+                else spec.concurrency
+            ),
+            min_in_flight=spec.min_in_flight,
+            max_in_flight=spec.max_in_flight,
+            latency_tolerance=spec.latency_tolerance,
+            discovery=spec.discovery,
+            bulk=spec.bulk,
+            holidays=[date.fromisoformat(holiday) for holiday in spec.holidays],
+            publication_delay=spec.publication_delay_seconds,
+            poll_interval=spec.poll_interval_seconds,
+            metrics=self._metrics,
+            logger=self._logger,
+        )
+        self._day = None
 
     def id(self):
+        if self._day is not None:
+            return f"lseg:{self._day.isoformat()}"
         return "lseg"
 
+    @property
+    def day(self) -> Optional[date]:
+        return self._day
+
+    def with_day(self, day: date) -> "Client":
+        client = copy.copy(self)
+        client._day = day
+        return client
+
+    @property
+    def tails(self) -> bool:
+        # Whether resolvers on this client poll all day rather than finish:
+        # with tail, the shard of a day that is still today on some venue.
+        if not self._spec.tail:
+            return False
+        return self._day is None or self._day >= earliest_today()
+
+    def shards(self) -> List["Client"]:
+        # One client per backfill day, the scheduler runs each of them as a
+        # separate table resolver on its concurrency slots.
+        if self._spec.start_date is None:
+            return [self]
+        return [self.with_day(day) for day in self._spec.trading_days()]
+
     @property
     def client(self) -> LSEGClient:
         return self._client
+
+    @property
+    def metrics(self) -> Metrics:
+        return self._metrics
+
+    @property
+    def spec(self) -> Spec:
+        return self._spec
+
+    @property
+    def instruments(self) -> Optional[InstrumentFilter]:
+        return self._instruments
+
+    @property
+    def key_index_dir(self) -> Optional[str]:
+        # Emitted keys are kept next to the state they go with.
+        if self._spec.state_file is None:
+            return None
+        return f"{self._spec.state_file}.keys"
+
+    @property
+    def aggregates(self) -> AggregateStore:
+        return self._aggregates
+
+    @property
+    def decode_share(self) -> FairShare:
+        return self._decode_share
+
+    @property
+    def stage_queue_size(self) -> int:
+        # Every table running on a concurrency slot gets an equal share of
+        # the queue, in decoded batches waiting to be emitted.
+        return max(1, self._spec.queue_size // self._spec.concurrency)
+
+    @property
+    def logger(self):
+        return self._logger
+
+    @property
+    def decode_pool(self) -> Optional["DecodePool"]:
+        return self._decode_pool
+
+    def close(self) -> None:
+        self._client.stop()
+        if self._decode_pool is not None:
+            self._decode_pool.close()
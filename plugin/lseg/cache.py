@@ -0,0 +1,236 @@
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, Optional
+
+# Eviction trims the cache to this fraction of max_bytes so it doesn't run
+# again on the very next write.
+EVICTION_LOW_WATERMARK = 0.9
+
+
+@dataclass
+class CacheEntry:
+    content: bytes
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    closed: bool = False
+
+    def validators(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class FileCache:
+    """Gzip-compressed on-disk cache of minute files keyed by their DMD path.
+
+    Entries for closed minutes are served without touching the network, the
+    rest are revalidated with a conditional request by the caller."""
+
+    def __init__(self, directory: str, max_bytes: int, max_age_seconds: int) -> None:
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = 0
+        for path in self._entry_paths():
+            if self._expired(path):
+                self._remove(path)
+            else:
+                self._size += os.path.getsize(path)
+
+    def _key(self, path: str) -> str:
+        return os.path.join(self._directory, hashlib.sha256(path.encode()).hexdigest())
+
+    def _entry_paths(self):
+        for entry in os.scandir(self._directory):
+            if entry.name.endswith(".csv.gz"):
+                yield entry.path
+
+    def _expired(self, path: str) -> bool:
+        return time.time() - os.path.getmtime(path) > self._max_age_seconds
+
+    def _remove(self, path: str) -> None:
+        for file_path in (path, path[: -len(".csv.gz")] + ".json"):
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+
+    def _drop_expired(self, key: str) -> bool:
+        if not self._expired(key + ".csv.gz"):
+            return False
+        with self._lock:
+            self._size -= os.path.getsize(key + ".csv.gz")
+            self._remove(key + ".csv.gz")
+        return True
+
+    def get(self, path: str) -> Optional[CacheEntry]:
+        key = self._key(path)
+        try:
+            if self._drop_expired(key):
+                return None
+            with open(key + ".json") as f:
+                metadata = json.load(f)
+            with gzip.open(key + ".csv.gz", "rb") as f:
+                content = f.read()
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+        return CacheEntry(content=content, **metadata)
+
+    def open(self, path: str) -> Optional[BinaryIO]:
+        # An entry's content as a stream, for day archives too large to read
+        # into memory. Its metadata isn't read.
+        key = self._key(path)
+        try:
+            if self._drop_expired(key):
+                return None
+            return gzip.open(key + ".csv.gz", "rb")
+        except (FileNotFoundError, OSError):
+            return None
+
+    def put(self, path: str, entry: CacheEntry) -> None:
+        key = self._key(path)
+        with open(key + ".csv.gz.tmp", "wb") as f:
+            f.write(gzip.compress(entry.content))
+        self._commit(key, entry)
+
+    def put_file(self, path: str, content: BinaryIO, entry: CacheEntry) -> None:
+        # Like put, with the content read from a file rather than the entry.
+        key = self._key(path)
+        with gzip.open(key + ".csv.gz.tmp", "wb") as f:
+            shutil.copyfileobj(content, f)
+        self._commit(key, entry)
+
+    def reader(
+        self, path: str, raw: io.RawIOBase, entry: CacheEntry
+    ) -> "CachingReader":
+        return CachingReader(self, self._key(path), raw, entry)
+
+    def _commit(self, key: str, entry: CacheEntry) -> None:
+        with open(key + ".json.tmp", "w") as f:
+            json.dump(
+                {
+                    "etag": entry.etag,
+                    "last_modified": entry.last_modified,
+                    "closed": entry.closed,
+                },
+                f,
+            )
+        with self._lock:
+            if os.path.exists(key + ".csv.gz"):
+                self._size -= os.path.getsize(key + ".csv.gz")
+            os.replace(key + ".json.tmp", key + ".json")
+            os.replace(key + ".csv.gz.tmp", key + ".csv.gz")
+            self._size += os.path.getsize(key + ".csv.gz")
+            if self._size > self._max_bytes:
+                self._evict()
+
+    def touch(self, path: str) -> None:
+        key = self._key(path)
+        try:
+            os.utime(key + ".csv.gz")
+        except FileNotFoundError:
+            pass
+
+    def _evict(self) -> None:
+        # Least recently written (or revalidated) entries go first.
+        paths = sorted(self._entry_paths(), key=os.path.getmtime)
+        target = self._max_bytes * EVICTION_LOW_WATERMARK
+        for path in paths:
+            if self._size <= target:
+                break
+            self._size -= os.path.getsize(path)
+            self._remove(path)
+
+
+class CachingReader(io.RawIOBase):
+    """Passes a streamed response body through while compressing it into the
+    cache, the entry is only committed once the body was read to the end."""
+
+    def __init__(
+        self, cache: FileCache, key: str, raw: io.RawIOBase, entry: CacheEntry
+    ) -> None:
+        self._cache = cache
+        self._key = key
+        self._raw = raw
+        self._entry = entry
+        self._file = gzip.open(key + ".csv.gz.tmp", "wb")
+        self._committed = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        n = self._raw.readinto(buffer)
+        if n:
+            self._file.write(memoryview(buffer)[:n])
+        elif not self._committed:
+            self._file.close()
+            self._cache._commit(self._key, self._entry)
+            self._committed = True
+        return n
+
+    def close(self) -> None:
+        if not self.closed:
+            self._file.close()
+            if not self._committed:
+                os.remove(self._key + ".csv.gz.tmp")
+            self._raw.close()
+        super().close()
+
+
+class SharedFile:
+    """A temporary file several readers go through at once, each at a
+    position of its own. It is deleted once the last of them lets go."""
+
+    def __init__(self, file: BinaryIO) -> None:
+        self._file = file
+        self._lock = threading.Lock()
+        self.size = file.seek(0, io.SEEK_END)
+
+    def reader(self) -> "SharedFileReader":
+        return SharedFileReader(self)
+
+    def read_at(self, position: int, buffer) -> int:
+        with self._lock:
+            self._file.seek(position)
+            return self._file.readinto(buffer)
+
+
+class SharedFileReader(io.RawIOBase):
+    def __init__(self, shared: SharedFile) -> None:
+        self._shared = shared
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._shared.size
+        self._position = offset
+        return offset
+
+    def tell(self) -> int:
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        n = self._shared.read_at(self._position, buffer)
+        self._position += n
+        return n
@@ -1,74 +1,858 @@
-from csv import DictReader
-from datetime import datetime, time, timedelta
-from typing import Generator, Dict, Any
+import html
+import io
+import re
+import shutil
+import tempfile
+import threading
+import zipfile
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+from time import monotonic, sleep
+from typing import (
+    BinaryIO,
+    Callable,
+    Dict,
+    Generator,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
 from urllib.parse import urljoin
 
-from bs4 import BeautifulSoup
+import structlog
 from requests import Session
 
+from plugin.lseg.cache import CacheEntry, FileCache, SharedFile
+from plugin.lseg.discovery import (
+    Memo,
+    archived_minutes,
+    listed_minutes,
+    probe_window,
+    window_minutes,
+)
+from plugin.lseg.feeds import FanOut, get_feed
+from plugin.lseg.retry import (
+    MinuteNotPublished,
+    RetryBudget,
+    RetryPolicy,
+    SessionExpired,
+    is_retryable,
+)
+from plugin.lseg.state import StateStore
+from plugin.lseg.throttle import ConcurrencyController, Throttle, TokenBucket
+from plugin.lseg.transport import new_session
+from plugin.metrics import CountingReader, Metrics
+
+T = TypeVar("T")
+
+INPUT_TAG = re.compile(r"<input\b[^>]*>", re.IGNORECASE)
+ATTRIBUTE = re.compile(r"""([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""")
+
+
+def csrf_token(login_page: str) -> str:
+    # The login form's hidden input, found without parsing the whole page.
+    # The one named _csrf wins if the form has several.
+    hidden = []
+    for tag in INPUT_TAG.finditer(login_page):
+        attributes = {
+            name.lower(): html.unescape(double or single or bare)
+            for name, double, single, bare in ATTRIBUTE.findall(tag[0])
+        }
+        if attributes.get("type", "").lower() == "hidden" and "value" in attributes:
+            hidden.append(attributes)
+    if not hidden:
+        raise Exception("DMD login page has no CSRF token")
+    for attributes in hidden:
+        if attributes.get("name") == "_csrf":
+            return attributes["value"]
+    return hidden[0]["value"]
+
+
+def close_body(future) -> None:
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
 
 class LSEGClient:
     def __init__(
-        self, username: str, password: str, base_url="https://dmd.lseg.com/dmd/",
+        self,
+        username: str,
+        password: str,
+        base_url="https://dmd.lseg.com/dmd/",
+        prefetch_window: int = 1,
+        state: StateStore = None,
+        overlap_minutes: int = 0,
+        cache: FileCache = None,
+        stream: bool = False,
+        chunk_size: int = io.DEFAULT_BUFFER_SIZE,
+        fanout_buffer: int = 64,
+        pool_size: int = 10,
+        timeout: Optional[float] = None,
+        keep_alive: bool = True,
+        http2: bool = False,
+        retry_limit: int = 3,
+        retry_budget: int = 100,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        requests_per_second: float = 0.0,
+        request_burst: int = 1,
+        initial_in_flight: Optional[int] = None,
+        min_in_flight: int = 1,
+        max_in_flight: Optional[int] = None,
+        latency_tolerance: float = 3.0,
+        discovery: str = "none",
+        bulk: bool = False,
+        holidays: Iterable[date] = (),
+        publication_delay: float = 0.0,
+        poll_interval: float = 5.0,
+        metrics: Metrics = None,
+        logger=None,
     ):
         self._base_url = base_url
         self._username = username
         self._password = password
-        self._session = self.__login()
+        self._prefetch_window = max(prefetch_window, 1)
+        self._state = state if state is not None else StateStore()
+        self._overlap = timedelta(minutes=max(overlap_minutes, 0))
+        self._cache = cache
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._fanout = FanOut(fanout_buffer)
+        self._subscribers = Counter()
+        # Where each walk of a shared feed resumed, by feed and day.
+        self._walk_starts: Dict[Tuple[str, date], List[datetime]] = defaultdict(list)
+        self._walks_lock = threading.Lock()
+        self._pool_size = pool_size
+        self._timeout = timeout
+        self._keep_alive = keep_alive
+        self._http2 = http2
+        self._retry = RetryPolicy(retry_limit, backoff_base, backoff_max)
+        self._retry_budget = RetryBudget(retry_budget)
+        self._discovery = discovery
+        self._discovered = Memo()
+        self._bulk = bulk
+        self._holidays = frozenset(holidays)
+        self._listings: Dict[str, Tuple[Optional[str], Optional[str], str]] = {}
+        self._publication_delay = timedelta(seconds=publication_delay)
+        self._poll_interval = poll_interval
+        self._stopped = threading.Event()
+        self._metrics = metrics if metrics is not None else Metrics()
+        self._logger = logger if logger is not None else structlog.get_logger()
+        # The window never gets wider than the connection pool, and starts
+        # wide open unless told otherwise.
+        if max_in_flight is None:
+            max_in_flight = pool_size
+        self._throttle = Throttle(
+            TokenBucket(requests_per_second, request_burst),
+            ConcurrencyController(
+                initial_in_flight if initial_in_flight is not None else max_in_flight,
+                min_in_flight,
+                max_in_flight,
+                latency_tolerance,
+                metrics=self._metrics,
+                logger=self._logger,
+            ),
+        )
+        self._metrics.gauge(
+            "lseg_request_window", lambda: self._throttle.controller.window
+        )
+        self._metrics.gauge(
+            "lseg_requests_in_flight", lambda: self._throttle.controller.in_flight
+        )
+        self._login_lock = threading.Lock()
+        # Logged in on the first request, listing tables or a health check
+        # never touches the network.
+        self._session: Optional[Session] = None
 
     def __login(self):
-        session = Session()
-        login_page = session.get(urljoin(self._base_url, "login.html"))
-        login_soup = BeautifulSoup(login_page.content, "html.parser")
-        csrf_token = login_soup.form.find("input", type="hidden")["value"]
-        result = session.post(
-            urljoin(self._base_url, "login.html"),
-            data={
-                "username": self._username,
-                "password": self._password,
-                "_csrf": csrf_token,
-            },
+        session = new_session(
+            self._pool_size, self._timeout, self._keep_alive, self._http2
         )
-        result.raise_for_status()
+        try:
+            login_page = session.get(urljoin(self._base_url, "login.html"))
+            login_page.raise_for_status()
+            result = session.post(
+                urljoin(self._base_url, "login.html"),
+                data={
+                    "username": self._username,
+                    "password": self._password,
+                    "_csrf": csrf_token(login_page.text),
+                },
+            )
+            result.raise_for_status()
+        except Exception:
+            session.close()
+            raise
         return session
-    
+
+    def session(self) -> Session:
+        session = self._session
+        if session is None:
+            with self._login_lock:
+                if self._session is None:
+                    self._session = self.__login()
+                session = self._session
+        return session
+
+    def relogin(self, expired_session: Session) -> None:
+        # Only the first thread to notice an expired session logs in again,
+        # the others pick up its new session.
+        with self._login_lock:
+            if self._session is expired_session:
+                self._logger.info("lseg session expired, logging in again")
+                self._session = self.__login()
+                expired_session.close()
+
+    @property
+    def chunk_size(self) -> int:
+        return self._chunk_size
+
+    @property
+    def metrics(self) -> Metrics:
+        return self._metrics
+
     def get_file_path(self, file_name: str, cursor):
-        match file_name:
-            case "Turquoise-UK-Pre-Trade":
-                return f"download/pretrade/TQE/FCA/TRQX-pre-{cursor.year}-{cursor.month:02}-{cursor.day:02}T{cursor.hour:02}_{cursor.minute:02}.csv"
-            case "Turquoise-UK-Post-Trade":
-                return f"download/posttrade/TQE/FCA/TRQX-post-{cursor.year}-{cursor.month:02}-{cursor.day:02}T{cursor.hour:02}_{cursor.minute:02}.csv"
-            case "Turqouise-europe-Pre-Trade":
-                return f"download/pretrade/TQE/AFM/TQEX-pre-{cursor.year}-{cursor.month:02}-{cursor.day:02}T{cursor.hour:02}_{cursor.minute:02}.csv"
-            case "Turqouise-europe-Post-Trade":
-                return f"download/posttrade/TQE/AFM/TQEX-post-{cursor.year}-{cursor.month:02}-{cursor.day:02}T{cursor.hour:02}_{cursor.minute:02}.csv"
-            case "LSE-Pre-Trade":
-                return f"download/pretrade/LSE/FCA/XLON-pre-{cursor.year}-{cursor.month:02}-{cursor.day:02}T{cursor.hour:02}_{cursor.minute:02}.csv"
-            case "LSE-Post-Trade":
-                return f"download/posttrade/LSE/FCA/XLON-post-{cursor.year}-{cursor.month:02}-{cursor.day:02}T{cursor.hour:02}_{cursor.minute:02}.csv"
-            case "TRADEcho-UK-Post-Trade":
-                return f"download/posttrade/TEC/FCA/ECHO-post-{cursor.year}-{cursor.month:02}-{cursor.day:02}T{cursor.hour:02}_{cursor.minute:02}.csv"
-            case "TRADEcho-NL-Post-Trade":
-                return f"download/posttrade/TEC/AFM/ECEU-post-{cursor.year}-{cursor.month:02}-{cursor.day:02}T{cursor.hour:02}_{cursor.minute:02}.csv"
-            case _:
-                return f"download/posttrade/LSE/FCA/XLON-post-{cursor.year}-{cursor.month:02}-{cursor.day:02}T{cursor.hour:02}_{cursor.minute:02}.csv"
-
-    def item_iterator(self, file_name: str) -> Generator[Dict[str, Any], None, None]:
-        end = datetime.combine(datetime.now().date(), time(16, 30))
-        cursor = datetime.combine(end.date(), time(8, 0))
-        if cursor.isoweekday() > 5:
+        return get_feed(file_name).file_path(cursor)
+
+    @property
+    def throttle(self) -> Throttle:
+        return self._throttle
+
+    def stop(self) -> None:
+        # Ends tailing walks at their next poll.
+        self._stopped.set()
+
+    def start_sync(self, file_names: List[str]) -> None:
+        # Tables reading the same feed share one download per minute file.
+        self._subscribers = Counter(file_names)
+        self._fanout.clear()
+        with self._walks_lock:
+            self._walk_starts.clear()
+        self._retry_budget.reset()
+        self._discovered.clear()
+        self._logger.info("dmd request limits", **self._throttle.summary())
+
+    def today(self, file_name: str) -> date:
+        # Cursors are on the venue's wall clock, whatever the host's is.
+        return get_feed(file_name).calendar.today()
+
+    def is_closed(self, file_name: str, cursor: datetime) -> bool:
+        # Once the overlap window has passed a minute's expected publication
+        # LSEG won't (re)publish it.
+        now = get_feed(file_name).calendar.now()
+        due = cursor + timedelta(minutes=1) + self._publication_delay
+        return now >= due + self._overlap
+
+    def minute_cursors(
+        self,
+        file_name: str,
+        start: Optional[datetime] = None,
+        day: Optional[date] = None,
+    ) -> Generator[datetime, None, None]:
+        # Every minute of the venue's session that has ended, none on its
+        # closing days.
+        calendar = get_feed(file_name).calendar
+        if day is None:
+            day = calendar.today()
+        session = calendar.session(day, self._holidays)
+        if session is None:
             return
-        while cursor < datetime.now() and cursor <= end:
-            response = self._session.get(
-                urljoin(
-                    self._base_url,
-                    self.get_file_path(file_name, cursor),
+        cursor, end = session
+        if start is not None and start > cursor:
+            cursor = start
+        while cursor < calendar.now() and cursor <= end:
+            yield cursor
+            cursor += timedelta(minutes=1)
+
+    def available_cursors(
+        self,
+        file_name: str,
+        start: Optional[datetime] = None,
+        day: Optional[date] = None,
+    ) -> Iterable[datetime]:
+        if self._discovery == "none":
+            return self.minute_cursors(file_name, start, day)
+        if day is None:
+            day = self.today(file_name)
+        return [
+            cursor
+            for cursor in self.discover(file_name, day, start)
+            if start is None or cursor >= start
+        ]
+
+    def discover(
+        self, file_name: str, day: date, start: Optional[datetime] = None
+    ) -> List[datetime]:
+        # Tables reading the same feed share one discovery per day, and a
+        # directory listing covers every day of a backfill at once. Probing
+        # only needs to cover the minutes after the resume cursor.
+        feed = get_feed(file_name)
+        if self._discovery in ("auto", "listing"):
+            listing = self._discovered.get(
+                feed.directory, lambda: self.list_directory(file_name)
+            )
+            if listing is not None:
+                if day in listing:
+                    return listing[day]
+                # Listings may only reach back so far, a day missing from one
+                # is probed, or walked blindly when only the listing may be used.
+                if self._discovery == "listing":
+                    return list(self.minute_cursors(file_name, start, day))
+            elif self._discovery == "listing":
+                raise Exception(f"DMD has no directory listing for {file_name}")
+        return self._discovered.get(
+            (file_name, day, start), lambda: self.probe_day(file_name, day, start)
+        )
+
+    def list_directory(self, file_name: str) -> Optional[Dict[date, List[datetime]]]:
+        feed = get_feed(file_name)
+        try:
+            listing = self._request(
+                file_name,
+                feed.directory,
+                lambda session: self._list(session, feed.directory),
+            )
+        except Exception as e:
+            self._logger.warning(
+                "listing minute files failed", feed=file_name, error=str(e)
+            )
+            return None
+        if listing is None:
+            return None
+        minutes = listed_minutes(feed, listing)
+        # An index without a single minute file isn't a listing of this feed.
+        if not minutes:
+            return None
+        return minutes
+
+    def _list(self, session: Session, directory: str) -> Optional[str]:
+        # Listings are re-read on every tail poll, an unchanged one costs a
+        # 304 rather than the whole index.
+        previous = self._listings.get(directory)
+        headers = {}
+        if previous is not None:
+            etag, last_modified, _ = previous
+            if etag is not None:
+                headers["If-None-Match"] = etag
+            if last_modified is not None:
+                headers["If-Modified-Since"] = last_modified
+        response = session.get(urljoin(self._base_url, directory), headers=headers)
+        if response.status_code in (401, 403) or response.url.endswith("login.html"):
+            response.close()
+            raise SessionExpired(directory)
+        # A portal without directory listings.
+        if response.status_code in (404, 405):
+            response.close()
+            return None
+        if previous is not None and response.status_code == 304:
+            response.close()
+            return previous[2]
+        response.raise_for_status()
+        self._listings[directory] = (
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+            response.text,
+        )
+        return response.text
+
+    def probe_day(
+        self, file_name: str, day: date, start: Optional[datetime] = None
+    ) -> List[datetime]:
+        # HEAD requests are cheap but there are over 500 of them for a day,
+        # so they run a full pool's worth at a time. Nothing is published on
+        # the venue's closing days.
+        calendar = get_feed(file_name).calendar
+        session = calendar.session(day, self._holidays)
+        if session is None:
+            return []
+        cursors = window_minutes(
+            probe_window(session), start=start, until=calendar.now()
+        )
+        with ThreadPoolExecutor(max_workers=self._pool_size) as executor:
+            published = executor.map(
+                lambda cursor: self.exists(file_name, cursor), cursors
+            )
+            return [cursor for cursor, found in zip(cursors, published) if found]
+
+    def exists(self, file_name: str, cursor: datetime) -> bool:
+        path = self.get_file_path(file_name, cursor)
+        return self._request(file_name, path, lambda session: self._head(session, path))
+
+    def _head(self, session: Session, path: str) -> bool:
+        response = session.head(urljoin(self._base_url, path), allow_redirects=True)
+        response.close()
+        if response.status_code in (401, 403) or response.url.endswith("login.html"):
+            raise SessionExpired(path)
+        if response.status_code == 404:
+            return False
+        response.raise_for_status()
+        return True
+
+    def fetch(self, file_name: str, cursor: datetime) -> BinaryIO:
+        path = self.get_file_path(file_name, cursor)
+        subscribers = self._subscribers[file_name] - self._resumed_after(
+            file_name, cursor
+        )
+        if subscribers > 1:
+            return io.BytesIO(
+                self._fanout.get(
+                    path,
+                    subscribers,
+                    lambda: self.download(file_name, cursor, stream=False).getvalue(),
+                )
+            )
+        return self.download(file_name, cursor, stream=self._stream)
+
+    def download(self, file_name: str, cursor: datetime, stream: bool) -> BinaryIO:
+        # Retries cover everything up to the response headers, and the whole
+        # body unless streaming.
+        path = self.get_file_path(file_name, cursor)
+        entry = self._cache.get(path) if self._cache is not None else None
+        # Closed minutes are served from the cache before any request is
+        # made: no login, no throttle slot and no latency sample.
+        if entry is not None and entry.closed:
+            self._metrics.inc("lseg_minute_files", feed=file_name, source="cache")
+            return io.BytesIO(entry.content)
+        return self._request(
+            file_name,
+            path,
+            lambda session: self._download(
+                session, file_name, path, cursor, stream, entry
+            ),
+        )
+
+    def _request(
+        self,
+        file_name: str,
+        path: str,
+        send: Callable[[Session], T],
+        timed: bool = True,
+    ) -> T:
+        # Logging in (again) is part of the attempt, a login page that fails
+        # is retried like the request itself.
+        attempt = 1
+        expired: Optional[Session] = None
+        while True:
+            try:
+                if expired is not None:
+                    self.relogin(expired)
+                    expired = None
+                session = self.session()
+                with self._throttle.request(file_name, timed):
+                    return send(session)
+            except SessionExpired:
+                if attempt >= self._retry.max_attempts:
+                    raise
+                expired = session
+            except Exception as e:
+                if (
+                    not is_retryable(e)
+                    or attempt >= self._retry.max_attempts
+                    or not self._retry_budget.take()
+                ):
+                    raise
+                delay = self._retry.backoff(attempt)
+                self._metrics.inc("lseg_http_retries", feed=file_name)
+                self._logger.warning(
+                    "retrying request",
+                    path=path,
+                    attempt=attempt,
+                    delay=round(delay, 3),
+                    retry_budget=self._retry_budget.remaining,
+                    error=str(e),
                 )
+                sleep(delay)
+            attempt += 1
+
+    def _download(
+        self,
+        session: Session,
+        file_name: str,
+        path: str,
+        cursor: datetime,
+        stream: bool,
+        entry: Optional[CacheEntry] = None,
+    ) -> BinaryIO:
+        # Returns the minute file as a binary stream. In streaming mode only
+        # the headers have been read, the body comes off the socket in
+        # chunk_size pieces as the caller reads it. A cached entry that
+        # isn't closed yet is revalidated.
+        started = monotonic()
+        response = session.get(
+            urljoin(self._base_url, path),
+            headers=entry.validators() if entry is not None else None,
+            stream=stream,
+        )
+        self._metrics.observe(
+            "lseg_http_request_duration_seconds",
+            monotonic() - started,
+            feed=file_name,
+        )
+        if response.status_code in (401, 403) or response.url.endswith("login.html"):
+            response.close()
+            raise SessionExpired(path)
+        if response.status_code == 404:
+            response.close()
+            raise MinuteNotPublished(path)
+        if entry is not None and response.status_code == 304:
+            response.close()
+            self._cache.touch(path)
+            self._metrics.inc(
+                "lseg_minute_files", feed=file_name, source="not_modified"
             )
+            return io.BytesIO(entry.content)
+        response.raise_for_status()
+        self._metrics.inc("lseg_minute_files", feed=file_name, source="network")
+
+        fresh_entry = CacheEntry(
+            content=b"",
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+            closed=self.is_closed(file_name, cursor),
+        )
+        if not stream:
+            self._metrics.inc(
+                "lseg_bytes_downloaded", len(response.content), feed=file_name
+            )
+            if self._cache is not None:
+                fresh_entry.content = response.content
+                self._cache.put(path, fresh_entry)
+            return io.BytesIO(response.content)
+        response.raw.decode_content = True
+        # Readers may ask for more after the end of the body, which must
+        # return b"" rather than fail on an auto-closed response.
+        response.raw.auto_close = False
+        body = CountingReader(response.raw, self._metrics, file_name)
+        if self._cache is not None:
+            body = self._cache.reader(path, body, fresh_entry)
+        return io.BufferedReader(body, self._chunk_size)
+
+    def file_iterator(
+        self, file_name: str, cursors: Iterable[datetime] = None
+    ) -> Generator[Tuple[datetime, BinaryIO], None, None]:
+        # Keeps up to `prefetch_window` minute files in flight while still
+        # handing them back strictly in cursor order.
+        if cursors is None:
+            cursors = self.available_cursors(file_name)
+        with ThreadPoolExecutor(max_workers=self._prefetch_window) as executor:
+            pending = deque()
+            try:
+                for cursor in cursors:
+                    pending.append(
+                        (cursor, executor.submit(self.fetch, file_name, cursor))
+                    )
+                    if len(pending) < self._prefetch_window:
+                        continue
+                    cursor, future = pending.popleft()
+                    if not (yield from self._yield_minute(file_name, cursor, future)):
+                        return
+                while pending:
+                    cursor, future = pending.popleft()
+                    if not (yield from self._yield_minute(file_name, cursor, future)):
+                        return
+            finally:
+                for _, future in pending:
+                    if not future.cancel():
+                        future.add_done_callback(close_body)
+
+    def archive_iterator(
+        self,
+        file_name: str,
+        day: Optional[date] = None,
+        start: Optional[datetime] = None,
+    ) -> Optional[Generator[Tuple[datetime, BinaryIO], None, None]]:
+        # A closed day comes in one transfer when DMD publishes its archive,
+        # rather than a request per minute file. None when bulk downloads are
+        # off, the day isn't closed yet or there is no archive for it.
+        if not self._bulk:
+            return None
+        if day is None:
+            day = self.today(file_name)
+        window = self.day_window(file_name, day)
+        if window is None or not self.is_closed(file_name, window[1]):
+            return None
+        # A resumed day with nothing left isn't downloaded again. Discovery
+        # is shared per feed, so asking costs at most one listing.
+        path = get_feed(file_name).archive_path(day)
+        subscribers = self._subscribers[file_name]
+        if start is not None and not any(
+            True for _ in self.available_cursors(file_name, start, day)
+        ):
+            self._fanout.release([path])
+            return None
+
+        def download() -> Optional[SharedFile]:
+            # Archives of closed days never change, a cached one is used
+            # without a request. Either way it is spooled to a temporary
+            # file, a day is too large to hold in memory.
+            cached = self._cache.open(path) if self._cache is not None else None
+            if cached is not None:
+                spooled = tempfile.TemporaryFile()
+                with cached:
+                    shutil.copyfileobj(cached, spooled)
+                return SharedFile(spooled)
+            spooled = self._request(
+                file_name,
+                path,
+                lambda session: self._download_archive(session, file_name, path),
+                timed=False,
+            )
+            if spooled is None:
+                return None
+            if self._cache is not None:
+                self._cache.put_file(path, spooled, CacheEntry(b"", closed=True))
+            return SharedFile(spooled)
+
+        if subscribers > 1:
+            spooled = self._fanout.get(path, subscribers, download)
+        else:
+            spooled = download()
+        if spooled is None:
+            self._logger.debug("no day archive published", feed=file_name, day=str(day))
+            return None
+        return self._archive_minutes(file_name, spooled, start)
+
+    def _download_archive(
+        self, session: Session, file_name: str, path: str
+    ) -> Optional[BinaryIO]:
+        started = monotonic()
+        response = session.get(urljoin(self._base_url, path), stream=True)
+        self._metrics.observe(
+            "lseg_http_request_duration_seconds",
+            monotonic() - started,
+            feed=file_name,
+        )
+        if response.status_code in (401, 403) or response.url.endswith("login.html"):
+            response.close()
+            raise SessionExpired(path)
+        if response.status_code == 404:
+            response.close()
+            return None
+        with response:
             response.raise_for_status()
-            csv_file = response.content.decode()
-            reader = DictReader(csv_file.splitlines(), delimiter=";")
-            for row in reader:
-                print(row)
-                yield row
-            cursor += timedelta(minutes=1)
+            spooled = tempfile.TemporaryFile()
+            try:
+                for chunk in response.iter_content(self._chunk_size):
+                    spooled.write(chunk)
+            except BaseException:
+                spooled.close()
+                raise
+        self._metrics.inc("lseg_bytes_downloaded", spooled.tell(), feed=file_name)
+        # Anything else served with a 200, such as a portal page, means there
+        # is no archive and the day comes in minute files.
+        if not zipfile.is_zipfile(spooled):
+            spooled.close()
+            self._logger.warning(
+                "day archive is not a zip file", feed=file_name, path=path
+            )
+            return None
+        spooled.seek(0)
+        return spooled
+
+    def _archive_minutes(
+        self, file_name: str, spooled: SharedFile, start: Optional[datetime]
+    ) -> Generator[Tuple[datetime, BinaryIO], None, None]:
+        # Members are inflated as they are read, nothing is extracted. Every
+        # subscriber reads the spooled file through a reader of its own.
+        with zipfile.ZipFile(spooled.reader()) as archive:
+            for cursor, name in archived_minutes(
+                get_feed(file_name), archive.namelist()
+            ):
+                if start is not None and cursor < start:
+                    continue
+                self._metrics.inc("lseg_minute_files", feed=file_name, source="archive")
+                with archive.open(name) as body:
+                    yield cursor, body
+
+    def _yield_minute(self, file_name: str, cursor: datetime, future):
+        # A missing file for a closed minute means nothing was published in
+        # it. A missing recent one is not out yet, so the walk stops there
+        # and the next sync picks it up.
+        try:
+            body = future.result()
+        except MinuteNotPublished:
+            if self.is_closed(file_name, cursor):
+                self._logger.debug(
+                    "no minute file published",
+                    feed=file_name,
+                    cursor=cursor.isoformat(),
+                )
+                return True
+            return False
+        with body:
+            yield cursor, body
+        return True
+
+    def resume_cursor(
+        self, state_key: str, overlap: timedelta = None
+    ) -> Optional[datetime]:
+        # Re-fetch a few minutes before the last completed one, LSEG sometimes
+        # publishes a minute file late.
+        if overlap is None:
+            overlap = self._overlap
+        last_cursor = self._state.get(state_key)
+        if last_cursor is None:
+            return None
+        return datetime.fromisoformat(last_cursor) + timedelta(minutes=1) - overlap
+
+    def shard_state_key(self, state_key: str, day: Optional[date] = None) -> str:
+        # Backfill shards keep their own cursor.
+        if day is None:
+            return state_key
+        return f"{state_key}/{day.isoformat()}"
+
+    def commit(self, state_key: str, day: Optional[date], cursor: datetime) -> None:
+        self._state.set(self.shard_state_key(state_key, day), cursor.isoformat())
+        self._state.checkpoint()
+
+    def flush_state(self) -> None:
+        self._state.flush()
+
+    def minute_iterator(
+        self,
+        file_name: str,
+        state_key: str = None,
+        day: Optional[date] = None,
+        checkpoint: bool = True,
+        after: Optional[datetime] = None,
+    ) -> Generator[Tuple[datetime, BinaryIO], None, None]:
+        # Each minute is checkpointed once the caller asks for the next one,
+        # unless checkpoint is off and the caller commits minutes itself.
+        # Tail polls pass the last minute they fetched as after, and pick up
+        # right behind it without any overlap.
+        start = None
+        if after is not None:
+            start = after + timedelta(minutes=1)
+        elif state_key is not None:
+            # Past days are closed so there is nothing late to pick up again.
+            overlap = None
+            if day is not None and day < self.today(file_name):
+                overlap = timedelta()
+            start = self.resume_cursor(self.shard_state_key(state_key, day), overlap)
+            if start is not None and self._subscribers[file_name] > 1:
+                self.resume_walk(file_name, start)
+        try:
+            minutes = self.archive_iterator(file_name, day, start)
+            if minutes is None:
+                minutes = self.file_iterator(
+                    file_name, self.available_cursors(file_name, start, day)
+                )
+            for cursor, content in minutes:
+                yield cursor, content
+                if state_key is not None and checkpoint:
+                    self.commit(state_key, day, cursor)
+        finally:
+            if state_key is not None:
+                self._state.flush()
+
+    def resume_walk(self, file_name: str, start: datetime) -> None:
+        # The feed's other tables may fetch the day's minutes before start,
+        # which this walk won't read; they mustn't wait for it in the fan-out.
+        with self._walks_lock:
+            self._walk_starts[(file_name, start.date())].append(start)
+        first = datetime.combine(start.date(), time(0, 0))
+        self._fanout.release(
+            self.get_file_path(file_name, cursor)
+            for cursor in window_minutes((first, start - timedelta(minutes=1)))
+        )
+
+    def _resumed_after(self, file_name: str, cursor: datetime) -> int:
+        # The walks of the feed that resumed after cursor and won't read it.
+        with self._walks_lock:
+            starts = self._walk_starts.get((file_name, cursor.date()), ())
+            return sum(1 for start in starts if start > cursor)
+
+    def minute_walks(
+        self,
+        file_name: str,
+        state_key: str = None,
+        day: Optional[date] = None,
+        checkpoint: bool = True,
+        tail: bool = False,
+    ) -> Generator[Iterable[Tuple[datetime, BinaryIO]], None, None]:
+        # Yields one walk over the minute files published so far. Tailing
+        # today's files, it then sleeps until the next minute is due and
+        # yields a walk over what has been published since, until the day's
+        # last minute or stop(). Callers can flush whatever they hold back
+        # between walks, nothing is fetched while they sleep.
+        walk = TailWalk(self, file_name, state_key, day, checkpoint)
+        yield walk.minutes()
+        if not tail or (day is not None and day != self.today(file_name)):
+            return
+        while self.wait_for_minute(file_name, walk.last_cursor(), day):
+            yield walk.minutes()
+
+    def day_window(
+        self, file_name: str, day: date
+    ) -> Optional[Tuple[datetime, datetime]]:
+        # The minutes a tail may wait for: the session without discovery, the
+        # minutes probed around it, the whole day with a listing. None when
+        # the venue is closed.
+        calendar = get_feed(file_name).calendar
+        session = calendar.session(day, self._holidays)
+        if session is None or self._discovery == "none":
+            return session
+        if self._discovery == "probe":
+            return probe_window(session)
+        return datetime.combine(day, time(0, 0)), datetime.combine(day, time(23, 59))
+
+    def wait_for_minute(
+        self, file_name: str, after: Optional[datetime], day: Optional[date]
+    ) -> bool:
+        # Sleeps until the minute after `after` should be out, or for one poll
+        # interval when it is overdue. False once there are no minutes left
+        # in the day or the client has been stopped.
+        if day is None:
+            day = self.today(file_name)
+        window = self.day_window(file_name, day)
+        if window is None:
+            return False
+        first, last = window
+        cursor = first if after is None else max(after + timedelta(minutes=1), first)
+        if cursor > last:
+            return False
+        due = cursor + timedelta(minutes=1) + self._publication_delay
+        now = get_feed(file_name).calendar.now()
+        delay = max((due - now).total_seconds(), self._poll_interval)
+        if self._stopped.wait(delay):
+            return False
+        # The next walk has to see a fresh listing.
+        self._discovered.forget(get_feed(file_name).directory)
+        return True
+
+
+class TailWalk:
+    """Keeps a tailing feed's cursor in memory between walks, so every walk
+    after the first starts right behind the last minute file fetched."""
+
+    def __init__(
+        self,
+        client: LSEGClient,
+        file_name: str,
+        state_key: Optional[str],
+        day: Optional[date],
+        checkpoint: bool,
+    ) -> None:
+        self._client = client
+        self._file_name = file_name
+        self._state_key = state_key
+        self._day = day
+        self._checkpoint = checkpoint
+        self._after: Optional[datetime] = None
+
+    def last_cursor(self) -> Optional[datetime]:
+        return self._after
+
+    def minutes(self) -> Generator[Tuple[datetime, BinaryIO], None, None]:
+        for cursor, body in self._client.minute_iterator(
+            self._file_name,
+            self._state_key,
+            self._day,
+            self._checkpoint,
+            after=self._after,
+        ):
+            self._after = cursor
+            yield cursor, body
@@ -0,0 +1,95 @@
+import re
+import threading
+from collections import defaultdict
+from concurrent.futures import Future
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple, TypeVar
+
+from plugin.lseg.feeds import Feed
+
+DISCOVERY_MODES = ("auto", "listing", "probe", "none")
+
+T = TypeVar("T")
+
+
+def minute_pattern(feed: Feed) -> "re.Pattern[str]":
+    return re.compile(re.escape(feed.prefix) + r"-(\d{4}-\d{2}-\d{2}T\d{2}_\d{2})\.csv")
+
+
+def listed_minutes(feed: Feed, listing: str) -> Dict[date, List[datetime]]:
+    # Directory listings are plain HTML indexes, every link to one of the
+    # feed's minute files counts whatever the markup around it.
+    days = defaultdict(set)
+    for match in minute_pattern(feed).finditer(listing):
+        cursor = datetime.strptime(match[1], "%Y-%m-%dT%H_%M")
+        days[cursor.date()].add(cursor)
+    return {day: sorted(cursors) for day, cursors in days.items()}
+
+
+def archived_minutes(feed: Feed, names: Iterable[str]) -> List[Tuple[datetime, str]]:
+    # The feed's minute files among an archive's members, in minute order.
+    # Members may sit in a folder of the archive.
+    pattern = minute_pattern(feed)
+    minutes = {}
+    for name in names:
+        match = pattern.fullmatch(name.rsplit("/", 1)[-1])
+        if match is not None:
+            minutes[datetime.strptime(match[1], "%Y-%m-%dT%H_%M")] = name
+    return sorted(minutes.items())
+
+
+# Opening and closing auctions and the trade reports that follow the close
+# are published in minute files outside the continuous session.
+PROBE_MARGIN = timedelta(minutes=15)
+
+
+def probe_window(session: Tuple[datetime, datetime]) -> Tuple[datetime, datetime]:
+    # First and last minute worth a HEAD request on a trading day.
+    first, last = session
+    return first - PROBE_MARGIN, last + PROBE_MARGIN
+
+
+def window_minutes(
+    window: Tuple[datetime, datetime],
+    start: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> List[datetime]:
+    cursor, last = window
+    if start is not None and start > cursor:
+        cursor = start
+    minutes = []
+    while cursor <= last and (until is None or cursor < until):
+        minutes.append(cursor)
+        cursor += timedelta(minutes=1)
+    return minutes
+
+
+class Memo:
+    """Computes each key once until cleared, concurrent callers for the same
+    key wait for the first one."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._futures: Dict[Hashable, Future] = {}
+
+    def get(self, key: Hashable, compute: Callable[[], T]) -> T:
+        with self._lock:
+            future = self._futures.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._futures[key] = future
+        if owner:
+            try:
+                future.set_result(compute())
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+    def forget(self, key: Hashable) -> None:
+        with self._lock:
+            self._futures.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._futures.clear()
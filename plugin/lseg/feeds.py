@@ -0,0 +1,105 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Callable, Dict, Iterable
+
+from plugin.lseg.sessions import CALENDARS, SessionCalendar
+
+
+@dataclass(frozen=True)
+class Feed:
+    name: str
+    venue: str
+    regime: str
+    kind: str
+    prefix: str
+
+    @property
+    def directory(self) -> str:
+        return f"download/{self.kind}/{self.venue}/{self.regime}/"
+
+    @property
+    def calendar(self) -> SessionCalendar:
+        return CALENDARS[self.regime]
+
+    def file_path(self, cursor: datetime) -> str:
+        return f"{self.directory}{self.prefix}-{cursor.year}-{cursor.month:02}-{cursor.day:02}T{cursor.hour:02}_{cursor.minute:02}.csv"
+
+    def archive_path(self, day: date) -> str:
+        # A whole day's minute files in one zip, next to them.
+        return f"{self.directory}{self.prefix}-{day.isoformat()}.zip"
+
+
+FEEDS: Dict[str, Feed] = {
+    feed.name: feed
+    for feed in [
+        Feed("Turquoise-UK-Pre-Trade", "TQE", "FCA", "pretrade", "TRQX-pre"),
+        Feed("Turquoise-UK-Post-Trade", "TQE", "FCA", "posttrade", "TRQX-post"),
+        Feed("Turqouise-europe-Pre-Trade", "TQE", "AFM", "pretrade", "TQEX-pre"),
+        Feed("Turqouise-europe-Post-Trade", "TQE", "AFM", "posttrade", "TQEX-post"),
+        Feed("LSE-Pre-Trade", "LSE", "FCA", "pretrade", "XLON-pre"),
+        Feed("LSE-Post-Trade", "LSE", "FCA", "posttrade", "XLON-post"),
+        Feed("TRADEcho-UK-Post-Trade", "TEC", "FCA", "posttrade", "ECHO-post"),
+        Feed("TRADEcho-NL-Post-Trade", "TEC", "AFM", "posttrade", "ECEU-post"),
+    ]
+}
+
+
+def get_feed(name: str) -> Feed:
+    try:
+        return FEEDS[name]
+    except KeyError:
+        raise ValueError(f"unknown feed {name}") from None
+
+
+class FanOut:
+    """Downloads each minute file of a shared feed once and hands the same
+    content to every table subscribed to that feed.
+
+    Entries are dropped once every subscriber has read them. At most
+    max_entries are kept for subscribers that are lagging or haven't started
+    yet, past that they fall back to downloading the file themselves rather
+    than blocking the others."""
+
+    def __init__(self, max_entries: int) -> None:
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, list] = OrderedDict()
+
+    def get(self, path: str, subscribers: int, fetch: Callable[[], bytes]) -> bytes:
+        with self._lock:
+            entry = self._entries.get(path)
+            owner = entry is None
+            if owner:
+                entry = [Future(), subscribers]
+                self._entries[path] = entry
+                while len(self._entries) > self._max_entries:
+                    self._entries.popitem(last=False)
+            entry[1] -= 1
+            if entry[1] <= 0:
+                self._entries.pop(path, None)
+        future = entry[0]
+        if owner:
+            try:
+                future.set_result(fetch())
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+    def release(self, paths: Iterable[str]) -> None:
+        # A subscriber that won't read these paths: whatever waits for it
+        # there is dropped once the others have read it.
+        with self._lock:
+            for path in paths:
+                entry = self._entries.get(path)
+                if entry is None:
+                    continue
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del self._entries[path]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,67 @@
+import random
+import threading
+
+from requests.exceptions import (
+    ChunkedEncodingError,
+    ConnectionError,
+    HTTPError,
+    Timeout,
+)
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class MinuteNotPublished(Exception):
+    """DMD answered 404, there is no file for this minute (yet)."""
+
+
+class SessionExpired(Exception):
+    """DMD sent us back to the login page."""
+
+
+class RetryBudget:
+    # Shared by every table in a sync so a struggling endpoint can't turn one
+    # sync into thousands of retries.
+    def __init__(self, total: int) -> None:
+        self._total = total
+        self._remaining = total
+        self._lock = threading.Lock()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._remaining = self._total
+
+    def take(self) -> bool:
+        with self._lock:
+            if self._remaining <= 0:
+                return False
+            self._remaining -= 1
+            return True
+
+    @property
+    def remaining(self) -> int:
+        return self._remaining
+
+
+class RetryPolicy:
+    def __init__(
+        self, max_attempts: int, backoff_base: float, backoff_max: float
+    ) -> None:
+        self.max_attempts = max_attempts
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+
+    def backoff(self, attempt: int) -> float:
+        # Exponential backoff with full jitter.
+        return random.uniform(
+            0, min(self._backoff_max, self._backoff_base * 2 ** (attempt - 1))
+        )
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, HTTPError):
+        return (
+            error.response is not None
+            and error.response.status_code in RETRYABLE_STATUS_CODES
+        )
+    return isinstance(error, (ConnectionError, Timeout, ChunkedEncodingError))
@@ -0,0 +1,171 @@
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Callable, Dict, FrozenSet, Iterable, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+
+def easter_sunday(year: int) -> date:
+    # Anonymous Gregorian algorithm.
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def weekday_on_or_after(day: date, weekday: int) -> date:
+    return day + timedelta(days=(weekday - day.weekday()) % 7)
+
+
+def last_weekday(year: int, month: int, weekday: int) -> date:
+    # weekday as in date.weekday(), 0 is Monday.
+    next_month = date(year + month // 12, month % 12 + 1, 1)
+    last = next_month - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def substitute(day: date) -> date:
+    # A holiday on a weekend is taken on the Monday after.
+    if day.weekday() > 4:
+        return weekday_on_or_after(day, 0)
+    return day
+
+
+@lru_cache(maxsize=None)
+def uk_holidays(year: int) -> FrozenSet[date]:
+    # England and Wales bank holidays, the days the London Stock Exchange is
+    # closed. Holidays falling on a weekend move to the next free weekday.
+    easter = easter_sunday(year)
+    holidays = {
+        substitute(date(year, 1, 1)),
+        easter - timedelta(days=2),
+        easter + timedelta(days=1),
+        weekday_on_or_after(date(year, 5, 1), 0),
+        last_weekday(year, 5, 0),
+        last_weekday(year, 8, 0),
+    }
+    christmas = date(year, 12, 25)
+    boxing_day = date(year, 12, 26)
+    if christmas.weekday() == 5:
+        holidays.update({christmas + timedelta(days=2), boxing_day + timedelta(days=2)})
+    elif christmas.weekday() == 6:
+        holidays.update({boxing_day, boxing_day + timedelta(days=1)})
+    elif boxing_day.weekday() == 5:
+        holidays.update({christmas, boxing_day + timedelta(days=2)})
+    else:
+        holidays.update({christmas, boxing_day})
+    return frozenset(holidays)
+
+
+@lru_cache(maxsize=None)
+def uk_half_days(year: int) -> FrozenSet[date]:
+    # Christmas Eve and New Year's Eve close early, on the Friday before when
+    # they fall on a weekend.
+    half_days = set()
+    for day in (date(year, 12, 24), date(year, 12, 31)):
+        if day.weekday() > 4:
+            day -= timedelta(days=day.weekday() - 4)
+        half_days.add(day)
+    return frozenset(half_days)
+
+
+@lru_cache(maxsize=None)
+def eu_holidays(year: int) -> FrozenSet[date]:
+    # The pan-European closing days observed by the AFM-regulated venues;
+    # nothing is moved off a weekend.
+    easter = easter_sunday(year)
+    return frozenset(
+        {
+            date(year, 1, 1),
+            easter - timedelta(days=2),
+            easter + timedelta(days=1),
+            date(year, 5, 1),
+            date(year, 12, 25),
+            date(year, 12, 26),
+        }
+    )
+
+
+@lru_cache(maxsize=None)
+def eu_half_days(year: int) -> FrozenSet[date]:
+    return frozenset({date(year, 12, 24), date(year, 12, 31)})
+
+
+@dataclass(frozen=True)
+class SessionCalendar:
+    """When a venue trades: its timezone, the continuous session and its
+    closing days. Minute files are named after the venue's wall clock."""
+
+    name: str
+    timezone: str
+    open: time
+    close: time
+    half_day_close: time
+    holidays: Callable[[int], FrozenSet[date]]
+    half_days: Callable[[int], FrozenSet[date]]
+
+    def now(self) -> datetime:
+        # Naive, like the cursors it is compared with.
+        return datetime.now(ZoneInfo(self.timezone)).replace(tzinfo=None)
+
+    def today(self) -> date:
+        return self.now().date()
+
+    def is_trading_day(self, day: date, extra_holidays: Iterable[date] = ()) -> bool:
+        return (
+            day.weekday() < 5
+            and day not in self.holidays(day.year)
+            and day not in extra_holidays
+        )
+
+    def session(
+        self, day: date, extra_holidays: Iterable[date] = ()
+    ) -> Optional[Tuple[datetime, datetime]]:
+        # First and last minute of the day's session, None on closing days.
+        if not self.is_trading_day(day, extra_holidays):
+            return None
+        close = self.close
+        if day in self.half_days(day.year):
+            close = self.half_day_close
+        return datetime.combine(day, self.open), datetime.combine(day, close)
+
+
+LONDON = SessionCalendar(
+    name="london",
+    timezone="Europe/London",
+    open=time(8, 0),
+    close=time(16, 30),
+    half_day_close=time(12, 30),
+    holidays=uk_holidays,
+    half_days=uk_half_days,
+)
+
+AMSTERDAM = SessionCalendar(
+    name="amsterdam",
+    timezone="Europe/Amsterdam",
+    open=time(9, 0),
+    close=time(17, 30),
+    half_day_close=time(14, 5),
+    holidays=eu_holidays,
+    half_days=eu_half_days,
+)
+
+# By regulatory regime, which is where a feed's venue sits.
+CALENDARS: Dict[str, SessionCalendar] = {"FCA": LONDON, "AFM": AMSTERDAM}
+
+
+def latest_today() -> date:
+    # The furthest any venue's clock has got, backfills end there by default.
+    return max(calendar.today() for calendar in CALENDARS.values())
+
+
+def earliest_today() -> date:
+    # The day the venue furthest behind is still on.
+    return min(calendar.today() for calendar in CALENDARS.values())
@@ -0,0 +1,45 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+CHECKPOINT_INTERVAL_SECONDS = 10
+
+
+class StateStore:
+    """Per-table sync cursors, kept in memory and optionally persisted to a
+    JSON file so the next sync can resume where this one stopped."""
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self._path = path
+        self._lock = threading.Lock()
+        self._state: Dict[str, str] = {}
+        self._last_flush = time.monotonic()
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self._state = json.load(f)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._state.get(key)
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._state[key] = value
+
+    def checkpoint(self) -> None:
+        # Cheap enough to call after every minute file; only writes the file
+        # every CHECKPOINT_INTERVAL_SECONDS so a crashed sync loses little.
+        if time.monotonic() - self._last_flush >= CHECKPOINT_INTERVAL_SECONDS:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._path is None:
+            return
+        with self._lock:
+            self._last_flush = time.monotonic()
+            tmp_path = f"{self._path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self._state, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self._path)
@@ -0,0 +1,223 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Generator, Optional
+
+import structlog
+from requests.exceptions import HTTPError
+
+from plugin.lseg.retry import MinuteNotPublished, SessionExpired, is_retryable
+from plugin.metrics import Metrics
+
+# Latency is smoothed per feed with this weight for every new response, and
+# judged only once a feed has this many.
+LATENCY_WEIGHT = 0.1
+LATENCY_WARMUP = 5
+# Jitter below this never counts as a spike, however fast the usual response.
+LATENCY_SLACK = 0.1
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    # Seconds DMD asked us to wait in a 429's Retry-After, if it said.
+    if not isinstance(error, HTTPError) or error.response is None:
+        return None
+    if error.response.status_code != 429:
+        return None
+    try:
+        return max(float(error.response.headers.get("Retry-After", "")), 0.0)
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """Requests per second across every table of a sync. Up to burst
+    requests go out back to back, after that they are spaced at rate. A
+    rate of 0 doesn't limit them, but a pause still holds them all back."""
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self._rate = rate
+        self._burst = max(burst, 1)
+        self._tokens = float(self._burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def take(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                delay = self._paused_until - now
+                if delay <= 0:
+                    if not self._rate:
+                        return
+                    self._tokens = min(
+                        self._burst, self._tokens + (now - self._updated) * self._rate
+                    )
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    delay = (1 - self._tokens) / self._rate
+            time.sleep(delay)
+
+
+class ConcurrencyController:
+    """How many DMD requests may be in flight at once, adjusted AIMD-style.
+
+    Until the first backoff the window grows by one per response, doubling
+    every round trip; after it, by one per window's worth of responses. A
+    429, 5xx, timeout or a response much slower than its feed usually
+    answers halves the window. Responses to requests sent before the last
+    backoff don't halve it again, one overload costs one halving."""
+
+    def __init__(
+        self,
+        initial: int,
+        minimum: int,
+        maximum: int,
+        latency_tolerance: float,
+        metrics: Metrics = None,
+        logger=None,
+    ) -> None:
+        self._minimum = max(minimum, 1)
+        self._maximum = max(maximum, self._minimum)
+        self._window = float(min(max(initial, self._minimum), self._maximum))
+        self._threshold = float(self._maximum)
+        self._latency_tolerance = latency_tolerance
+        self._latency: Dict[str, float] = {}
+        self._samples: Dict[str, int] = {}
+        self._in_flight = 0
+        self._epoch = 0
+        self._backoffs = 0
+        self._condition = threading.Condition()
+        self._metrics = metrics if metrics is not None else Metrics()
+        self._logger = logger if logger is not None else structlog.get_logger()
+
+    @property
+    def window(self) -> int:
+        return int(self._window)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def summary(self) -> Dict[str, float]:
+        with self._condition:
+            return {
+                "window": int(self._window),
+                "min_in_flight": self._minimum,
+                "max_in_flight": self._maximum,
+                "backoffs": self._backoffs,
+            }
+
+    def acquire(self) -> int:
+        # Returns the epoch the request was sent in, for release.
+        with self._condition:
+            while self._in_flight >= int(self._window):
+                self._condition.wait()
+            self._in_flight += 1
+            return self._epoch
+
+    def release(
+        self, epoch: int, feed: str, latency: Optional[float], overloaded: bool
+    ) -> None:
+        # latency is None for requests that say nothing about the endpoint's
+        # load, they neither grow nor shrink the window.
+        with self._condition:
+            self._in_flight -= 1
+            reason = "overloaded" if overloaded else None
+            if reason is None and latency is not None and self._spike(feed, latency):
+                reason = "latency"
+            if reason is not None:
+                if epoch == self._epoch:
+                    self._back_off(feed, reason)
+            elif latency is not None:
+                if self._window < self._threshold:
+                    self._window += 1
+                else:
+                    self._window += 1 / self._window
+                self._window = min(self._window, self._maximum)
+            self._condition.notify_all()
+
+    def _spike(self, feed: str, latency: float) -> bool:
+        usual = self._latency.get(feed, latency)
+        samples = self._samples.get(feed, 0)
+        spike = (
+            samples >= LATENCY_WARMUP
+            and latency > usual * self._latency_tolerance
+            and latency - usual > LATENCY_SLACK
+        )
+        # Spikes move the usual latency too, a lasting change is learned.
+        self._latency[feed] = usual + LATENCY_WEIGHT * (latency - usual)
+        self._samples[feed] = samples + 1
+        return spike
+
+    def _back_off(self, feed: str, reason: str) -> None:
+        self._threshold = max(self._window / 2, self._minimum)
+        self._window = self._threshold
+        self._epoch += 1
+        self._backoffs += 1
+        self._metrics.inc("lseg_request_backoffs", feed=feed, reason=reason)
+        self._logger.info(
+            "lowering dmd request window",
+            feed=feed,
+            reason=reason,
+            window=int(self._window),
+        )
+
+
+class Throttle:
+    """The shared token bucket and concurrency window every DMD request
+    passes through."""
+
+    def __init__(
+        self,
+        bucket: TokenBucket,
+        controller: ConcurrencyController,
+    ) -> None:
+        self._bucket = bucket
+        self._controller = controller
+
+    @property
+    def controller(self) -> ConcurrencyController:
+        return self._controller
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "requests_per_second": self._bucket.rate,
+            **self._controller.summary(),
+        }
+
+    @contextmanager
+    def request(self, feed: str, timed: bool = True) -> Generator[None, None, None]:
+        # Untimed requests, like whole-day archives, take as long as their
+        # size rather than the endpoint's load.
+        self._bucket.take()
+        epoch = self._controller.acquire()
+        started = time.monotonic()
+        latency = None
+        overloaded = False
+        try:
+            yield
+            latency = time.monotonic() - started
+        except (MinuteNotPublished, SessionExpired):
+            latency = time.monotonic() - started
+            raise
+        except Exception as e:
+            overloaded = is_retryable(e)
+            delay = retry_after(e)
+            if delay is not None:
+                self._bucket.pause(delay)
+            raise
+        finally:
+            self._controller.release(
+                epoch, feed, latency if timed else None, overloaded
+            )
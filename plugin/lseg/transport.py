@@ -0,0 +1,165 @@
+import http.client
+import io
+import socket
+from typing import Iterator, Optional
+
+from requests import PreparedRequest, Response, Session
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.exceptions import ChunkedEncodingError, ConnectionError, Timeout
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib3.connection import HTTPConnection
+
+KEEP_ALIVE_SOCKET_OPTIONS = HTTPConnection.default_socket_options + [
+    (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+]
+
+
+class TimeoutSession(Session):
+    # requests has no session-wide timeout, without one a stalled download
+    # blocks its table forever.
+    def __init__(self, timeout: float) -> None:
+        super().__init__()
+        self._timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self._timeout)
+        return super().request(method, url, **kwargs)
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = KEEP_ALIVE_SOCKET_OPTIONS
+        super().init_poolmanager(*args, **kwargs)
+
+
+class HTTPXOriginalResponse:
+    # Just enough of http.client.HTTPResponse for requests to pick up the
+    # session cookies set by the login page.
+    def __init__(self, headers) -> None:
+        self.msg = http.client.HTTPMessage()
+        for name, value in headers.multi_items():
+            self.msg[name] = value
+
+
+def requests_error(httpx, error: Exception, reading: bool) -> Exception:
+    # The retry policy and the throttle only know requests' exceptions, an
+    # httpx one would fail the request at once and never shrink the window.
+    if isinstance(error, httpx.TimeoutException):
+        return Timeout(error)
+    if isinstance(error, httpx.TransportError):
+        return ChunkedEncodingError(error) if reading else ConnectionError(error)
+    return error
+
+
+class HTTPXBody(io.RawIOBase):
+    def __init__(self, httpx, response) -> None:
+        self._httpx = httpx
+        self._response = response
+        self._chunks: Iterator[bytes] = response.iter_bytes()
+        self._buffer = b""
+        self._original_response = HTTPXOriginalResponse(response.headers)
+        # httpx decodes gzip itself, these are only set by callers that expect
+        # a urllib3 response.
+        self.decode_content = True
+        self.auto_close = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._buffer:
+            try:
+                chunk = next(self._chunks, None)
+            except Exception as e:
+                raise requests_error(self._httpx, e, reading=True) from e
+            if chunk is None:
+                return 0
+            self._buffer = chunk
+        n = min(len(buffer), len(self._buffer))
+        buffer[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    def close(self) -> None:
+        self._response.close()
+        super().close()
+
+
+class HTTP2Adapter(BaseAdapter):
+    """Sends requests through an HTTP/2 httpx client so that all minute file
+    downloads are multiplexed over a few connections."""
+
+    def __init__(self, pool_size: int, keep_alive: bool) -> None:
+        super().__init__()
+        try:
+            import httpx
+        except ImportError:
+            raise Exception("http2 requires the httpx[http2] package") from None
+        self._httpx = httpx
+        self._client = httpx.Client(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size if keep_alive else 0,
+            ),
+        )
+
+    def send(
+        self,
+        request: PreparedRequest,
+        stream=False,
+        timeout=None,
+        verify=True,
+        cert=None,
+        proxies=None,
+    ) -> Response:
+        if isinstance(timeout, tuple):
+            timeout = self._httpx.Timeout(timeout[1], connect=timeout[0])
+        try:
+            httpx_response = self._client.send(
+                self._client.build_request(
+                    request.method,
+                    request.url,
+                    headers=dict(request.headers),
+                    content=request.body,
+                    timeout=timeout,
+                ),
+                stream=True,
+            )
+        except Exception as e:
+            raise requests_error(self._httpx, e, reading=False) from e
+        response = Response()
+        response.status_code = httpx_response.status_code
+        response.reason = httpx_response.reason_phrase
+        response.headers = CaseInsensitiveDict(httpx_response.headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = HTTPXBody(self._httpx, httpx_response)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self) -> None:
+        self._client.close()
+
+
+def new_session(
+    pool_size: int,
+    timeout: Optional[float],
+    keep_alive: bool = True,
+    http2: bool = False,
+) -> Session:
+    session = TimeoutSession(timeout)
+    session.headers["Accept-Encoding"] = "gzip, deflate"
+    if not keep_alive:
+        session.headers["Connection"] = "close"
+    if http2:
+        adapter = HTTP2Adapter(pool_size, keep_alive)
+    elif keep_alive:
+        adapter = KeepAliveAdapter(pool_maxsize=pool_size, pool_block=True)
+    else:
+        adapter = HTTPAdapter(pool_maxsize=pool_size, pool_block=True)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
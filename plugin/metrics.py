@@ -0,0 +1,218 @@
+import io
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+DESCRIPTIONS = {
+    "lseg_http_request_duration_seconds": "Time until DMD returned the response headers.",
+    "lseg_bytes_downloaded": "Decompressed minute file bytes downloaded from DMD.",
+    "lseg_minute_files": "Minute files downloaded.",
+    "lseg_http_retries": "Minute file requests that were retried.",
+    "lseg_request_backoffs": "Times the DMD request window was halved, by the feed and reason that caused it.",
+    "lseg_request_window": "DMD requests allowed in flight at once.",
+    "lseg_requests_in_flight": "DMD requests in flight.",
+    "lseg_rows_decoded": "Rows decoded from minute files.",
+    "lseg_rows_deduplicated": "Decoded rows dropped because their primary key was already emitted.",
+    "lseg_stage_seconds": "Decode stage time spent waiting on the network, parsing, blocked on a full emit queue and idle between tail polls, and resolver time spent aggregating derived tables and emitting.",
+    "lseg_scheduler_queue_depth": "Messages waiting in the scheduler result queue.",
+    "lseg_scheduler_pending_resolvers": "Table resolvers waiting for a concurrency slot.",
+    "lseg_decode_waiting": "Decode stages waiting for a decode slot.",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metrics:
+    """Thread-safe counters, histograms and gauges for a sync, rendered in
+    the OpenMetrics text format."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = defaultdict(
+            lambda: defaultdict(float)
+        )
+        self._histograms: Dict[str, Dict[Labels, list]] = defaultdict(dict)
+        self._gauges: Dict[str, Callable[[], float]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._counters[name][key] += value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            # One slot per bucket plus +Inf, then sum and count.
+            histogram = self._histograms[name].setdefault(
+                key, [0] * (len(DEFAULT_BUCKETS) + 1) + [0.0, 0]
+            )
+            histogram[bisect_left(DEFAULT_BUCKETS, value)] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def gauge(self, name: str, value: Callable[[], float]) -> None:
+        self._gauges[name] = value
+
+    def counter_value(self, name: str, **labels: str) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(tuple(sorted(labels.items())), 0)
+
+    def table_summaries(self) -> Dict[str, Dict[str, float]]:
+        summaries = defaultdict(lambda: defaultdict(float))
+        with self._lock:
+            for labels, value in self._counters.get("lseg_rows_decoded", {}).items():
+                summaries[dict(labels)["table"]]["rows"] += value
+            for labels, value in self._counters.get(
+                "lseg_rows_deduplicated", {}
+            ).items():
+                summaries[dict(labels)["table"]]["duplicates"] += value
+            for labels, value in self._counters.get("lseg_stage_seconds", {}).items():
+                labels = dict(labels)
+                summary = summaries[labels["table"]]
+                summary[f"{labels['stage']}_seconds"] += value
+                # Time asleep between tail polls says nothing about throughput,
+                # and emitting overlaps the decode stage's time.
+                if labels["stage"] not in ("idle", "emit"):
+                    summary["seconds"] += value
+        for summary in summaries.values():
+            if summary["seconds"] > 0:
+                summary["rows_per_second"] = summary["rows"] / summary["seconds"]
+        return {
+            table: {name: round(value, 3) for name, value in summary.items()}
+            for table, summary in summaries.items()
+        }
+
+    def feed_summaries(self) -> Dict[str, Dict[str, float]]:
+        summaries = defaultdict(lambda: defaultdict(float))
+        with self._lock:
+            for labels, value in self._counters.get(
+                "lseg_bytes_downloaded", {}
+            ).items():
+                summaries[dict(labels)["feed"]]["bytes"] += value
+            for labels, value in self._counters.get("lseg_minute_files", {}).items():
+                labels = dict(labels)
+                summaries[labels["feed"]][f"{labels['source']}_files"] += value
+            for labels, value in self._counters.get("lseg_http_retries", {}).items():
+                summaries[dict(labels)["feed"]]["retries"] += value
+            latencies = self._histograms.get("lseg_http_request_duration_seconds", {})
+            for labels, histogram in latencies.items():
+                summary = summaries[dict(labels)["feed"]]
+                summary["requests"] = histogram[-1]
+                summary["mean_latency_seconds"] = histogram[-2] / histogram[-1]
+        return {
+            feed: {name: round(value, 3) for name, value in summary.items()}
+            for feed, summary in summaries.items()
+        }
+
+    def render(self) -> str:
+        out = io.StringIO()
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                out.write(f"# TYPE {name} counter\n")
+                out.write(f"# HELP {name} {DESCRIPTIONS.get(name, name)}\n")
+                for labels, value in sorted(series.items()):
+                    out.write(f"{name}_total{format_labels(labels)} {value}\n")
+            for name, series in sorted(self._histograms.items()):
+                out.write(f"# TYPE {name} histogram\n")
+                out.write(f"# HELP {name} {DESCRIPTIONS.get(name, name)}\n")
+                for labels, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(
+                        DEFAULT_BUCKETS + ("+Inf",), histogram[:-2]
+                    ):
+                        cumulative += count
+                        bucket = format_labels(labels, f'le="{bound}"')
+                        out.write(f"{name}_bucket{bucket} {cumulative}\n")
+                    out.write(f"{name}_sum{format_labels(labels)} {histogram[-2]}\n")
+                    out.write(f"{name}_count{format_labels(labels)} {histogram[-1]}\n")
+        for name, value in sorted(self._gauges.items()):
+            out.write(f"# TYPE {name} gauge\n")
+            out.write(f"# HELP {name} {DESCRIPTIONS.get(name, name)}\n")
+            out.write(f"{name} {value()}\n")
+        out.write("# EOF\n")
+        return out.getvalue()
+
+    def dump(self, path: str) -> None:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def serve(self, port: int) -> ThreadingHTTPServer:
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header(
+                    "Content-Type",
+                    "application/openmetrics-text; version=1.0.0; charset=utf-8",
+                )
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("", port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+class CountingReader(io.RawIOBase):
+    """Counts the bytes of a streamed response body as the decoder reads it."""
+
+    def __init__(self, raw: io.RawIOBase, metrics: Metrics, feed: str) -> None:
+        self._raw = raw
+        self._metrics = metrics
+        self._feed = feed
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        n = self._raw.readinto(buffer)
+        if n:
+            self._metrics.inc("lseg_bytes_downloaded", n, feed=self._feed)
+        return n
+
+    def close(self) -> None:
+        if not self.closed:
+            self._raw.close()
+        super().close()
+
+
+class StageTimer:
+    """Splits a resolver or decode stage thread's wall time into the stage
+    it was in."""
+
+    def __init__(self, metrics: Metrics, table: str) -> None:
+        self._metrics = metrics
+        self._table = table
+        self._last = time.monotonic()
+
+    def skip(self) -> None:
+        # Starts the next lap without booking the time since the last one.
+        self._last = time.monotonic()
+
+    def lap(self, stage: str) -> None:
+        now = time.monotonic()
+        self._metrics.inc(
+            "lseg_stage_seconds", now - self._last, table=self._table, stage=stage
+        )
+        self._last = now
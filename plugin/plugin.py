@@ -1,4 +1,3 @@
-
 import json
 from typing import List, Generator
 
@@ -6,16 +5,14 @@ import structlog
 from cloudquery.sdk import message
 from cloudquery.sdk import plugin
 from cloudquery.sdk import schema
-from cloudquery.sdk.scheduler import Scheduler, TableResolver
-
-from plugin import tables
-from plugin.client import Client, Spec
+from cloudquery.sdk.scheduler import TableResolver
 
 PLUGIN_NAME = "lseg"
 PLUGIN_VERSION = "0.0.1"
 TEAM_NAME = "cloudquery"
 PLUGIN_KIND = "source"
 
+
 class ExamplePlugin(plugin.Plugin):
     def __init__(self) -> None:
         super().__init__(
@@ -35,25 +32,42 @@ class ExamplePlugin(plugin.Plugin):
     def init(self, spec, no_connection: bool = False):
         if no_connection:
             return
+        # Imported here and in get_tables so that listing tables and health
+        # checks only load what they use.
+        from plugin.client import Client, Spec
+        from plugin.scheduler import Scheduler
+
         self._spec_json = json.loads(spec)
         self._spec = Spec(**self._spec_json)
         self._spec.validate()
+        decode_pool = None
+        if self._spec.decode_workers > 0:
+            from plugin.tables.decode_pool import DecodePool
+
+            decode_pool = DecodePool(self._spec.decode_workers)
+        self._client = Client(self._spec, logger=self._logger, decode_pool=decode_pool)
         self._scheduler = Scheduler(
-            self._spec.concurrency, self._spec.queue_size, logger=self._logger
+            self._spec.concurrency,
+            self._spec.queue_size,
+            logger=self._logger,
+            metrics=self._client.metrics,
         )
-        self._client = Client(self._spec)
 
     def get_tables(self, options: plugin.TableOptions) -> List[plugin.Table]:
+        from plugin import tables
+
         all_tables: List[plugin.Table] = [
-            tables.ECEUPostTrade(),
-            tables.ECHOPostTrade(),
-            tables.TQEXPostTrade(),
-            tables.TQEXPreTrade(),
-            tables.TRQXPostTrade(),
-            tables.TRQXPreTrade(),
-            tables.XLONPostDelayed(),
-            tables.XLONPreTrade(),
+            tables.MappedTable(mapping) for mapping in tables.TABLE_MAPPINGS
         ]
+        # Derived tables decode their source feed's files once more and keep
+        # its figures in memory, so they are only synced when named, never
+        # through a wildcard.
+        named = set(options.tables or [])
+        all_tables.extend(
+            tables.DerivedTable(derived)
+            for derived in tables.DERIVED_MAPPINGS
+            if derived.name in named
+        )
 
         # set parent table relationships
         for table in all_tables:
@@ -68,6 +82,10 @@ class ExamplePlugin(plugin.Plugin):
 
         return schema.filter_dfs(all_tables, options.tables, options.skip_tables)
 
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+
     def sync(
         self, options: plugin.SyncOptions
     ) -> Generator[message.SyncMessage, None, None]:
@@ -80,6 +98,17 @@ class ExamplePlugin(plugin.Plugin):
             )
         ):
             resolvers.append(table.resolver)
-        return self._scheduler.sync(
+        self._client.client.start_sync([resolver.feed for resolver in resolvers])
+        yield from self._scheduler.sync(
             self._client, resolvers, options.deterministic_cq_id
         )
+        metrics = self._client.metrics
+        for table, summary in metrics.table_summaries().items():
+            self._logger.info("table sync finished", table=table, **summary)
+        for feed, summary in metrics.feed_summaries().items():
+            self._logger.info("feed downloads", feed=feed, **summary)
+        self._logger.info(
+            "dmd request window", **self._client.client.throttle.summary()
+        )
+        if self._spec.metrics_file is not None:
+            metrics.dump(self._spec.metrics_file)
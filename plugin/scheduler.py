@@ -0,0 +1,146 @@
+import queue
+import threading
+from concurrent import futures
+from typing import Any, Generator, List
+
+import pyarrow as pa
+from cloudquery.sdk.message import SyncMessage
+from cloudquery.sdk.scheduler import Scheduler as SchedulerBase, TableResolver
+from cloudquery.sdk.scheduler.scheduler import (
+    TableResolverFinished,
+    TableResolverStarted,
+)
+from cloudquery.sdk.scheduler.table_resolver import Client
+from cloudquery.sdk.schema import Resource, Table
+
+from plugin.metrics import Metrics
+
+
+# Sent once every table resolver has been submitted. Until then the sync
+# can't end, even if every resolver so far has finished.
+ALL_SUBMITTED = object()
+
+
+class Progress:
+    """Table resolvers started and finished in a sync, read off the control
+    messages in its result queue."""
+
+    def __init__(self) -> None:
+        self.submitted = False
+        self.started = 0
+        self.finished = 0
+
+    @property
+    def done(self) -> bool:
+        return self.submitted and self.started == self.finished
+
+    def update(self, message: object) -> bool:
+        # False for messages that are meant for the destination.
+        if message is ALL_SUBMITTED:
+            self.submitted = True
+        elif isinstance(message, TableResolverStarted):
+            self.started += 1
+        elif isinstance(message, TableResolverFinished):
+            self.finished += 1
+        else:
+            return False
+        return True
+
+
+def drain(res: queue.Queue, progress: Progress) -> None:
+    while not progress.done:
+        progress.update(res.get())
+
+
+class RecordBatchResource:
+    def __init__(self, table: Table, parent, record: pa.RecordBatch) -> None:
+        self._table = table
+        self._parent = parent
+        self._record = record
+
+    @property
+    def item(self):
+        return self._record
+
+    def to_arrow_record(self) -> pa.RecordBatch:
+        return self._record
+
+
+class Scheduler(SchedulerBase):
+    # Resolvers may yield whole record batches; those are sent as-is instead
+    # of being resolved column by column into a single-row Resource.
+    def __init__(self, *args, metrics: Metrics = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._metrics = metrics if metrics is not None else Metrics()
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+
+    def sync(
+        self, client, resolvers: List[TableResolver], deterministic_cq_id=False
+    ) -> Generator[SyncMessage, None, None]:
+        # As the SDK's, but with the result queue bounded at queue_size: a
+        # destination that stops reading blocks the resolvers on their next
+        # message instead of letting decoded batches pile up in memory.
+        res: queue.Queue = queue.Queue(maxsize=self._queue_size)
+        yield from self._send_migrate_table_messages(resolvers)
+        thread = futures.ThreadPoolExecutor()
+        thread.submit(self._sync, client, resolvers, res, deterministic_cq_id)
+        progress = Progress()
+        try:
+            while not progress.done:
+                message = res.get()
+                if not progress.update(message):
+                    yield message
+        finally:
+            if not progress.done:
+                # Abandoned mid-sync: keep draining so blocked resolvers can
+                # finish rather than wait on the queue forever.
+                threading.Thread(
+                    target=drain, args=(res, progress), name="drain", daemon=True
+                ).start()
+            thread.shutdown(wait=progress.done)
+
+    def _sync(
+        self,
+        client,
+        resolvers: List[TableResolver],
+        res: queue.Queue,
+        deterministic_cq_id=False,
+    ):
+        # Messages resolvers have produced but the plugin hasn't sent yet, and
+        # table resolvers still waiting for a concurrency slot. Tailing ones
+        # run all day, each on a thread of its own: on the pool they would
+        # keep their slots from the tables queued behind them for good.
+        self._metrics.gauge("lseg_scheduler_queue_depth", res.qsize)
+        self._metrics.gauge("lseg_scheduler_pending_resolvers", lambda: self._pending)
+        try:
+            for resolver in resolvers:
+                for shard in resolver.multiplex(client):
+                    res.put(TableResolverStarted())
+                    if getattr(shard, "tails", False):
+                        threading.Thread(
+                            target=self.resolve_table,
+                            args=(resolver, 0, shard, None, res),
+                            name=f"tail-{resolver.table.name}",
+                            daemon=True,
+                        ).start()
+                        continue
+                    with self._pending_lock:
+                        self._pending += 1
+                    self._pools[0].submit(self._resolve_root, resolver, shard, res)
+        finally:
+            res.put(ALL_SUBMITTED)
+
+    def _resolve_root(
+        self, resolver: TableResolver, client: Client, res: queue.Queue
+    ) -> None:
+        with self._pending_lock:
+            self._pending -= 1
+        self.resolve_table(resolver, 0, client, None, res)
+
+    def resolve_resource(
+        self, resolver: TableResolver, client: Client, parent: Resource, item: Any
+    ):
+        if isinstance(item, pa.RecordBatch):
+            return RecordBatchResource(resolver.table, parent, item)
+        return super().resolve_resource(resolver, client, parent, item)
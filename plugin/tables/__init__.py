@@ -1,9 +1,2 @@
-from .xlon_post_delayed import XLONPostDelayed
-from .xlon_pre_delayed import XLONPreTrade
-from .tqex_pre_trade import TQEXPreTrade
-from .tqex_pre_trade import TQEXPreTrade
-from .trqx_post_trade import TRQXPostTrade
-from .trqx_pre_trade import TRQXPreTrade
-from .tqex_post_trade import TQEXPostTrade
-from .echo_post_trade import ECHOPostTrade
-from .eceu_post_trade import ECEUPostTrade
\ No newline at end of file
+from .resolver import DerivedTable, MappedTable
+from .venues import DERIVED_MAPPINGS, TABLE_MAPPINGS
@@ -0,0 +1,449 @@
+import os
+import pickle
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Hashable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from plugin.tables.dedup import KeyIndex
+
+
+def plain(array: pa.Array) -> pa.Array:
+    # Group-by can't take first/last of dictionary columns.
+    if pa.types.is_dictionary(array.type):
+        return array.cast(array.type.value_type)
+    return array
+
+
+def to_mask(array, null: bool) -> np.ndarray:
+    return array.fill_null(null).to_numpy(zero_copy_only=False)
+
+
+def rows_to_batch(rows: List[Dict[str, object]], schema: pa.Schema) -> pa.RecordBatch:
+    arrays = []
+    for field in schema:
+        values = [row[field.name] for row in rows]
+        if pa.types.is_dictionary(field.type):
+            array = pa.array(values, field.type.value_type).dictionary_encode()
+            arrays.append(array.cast(field.type))
+        elif pa.types.is_timestamp(field.type) or pa.types.is_date(field.type):
+            # Times are kept as microseconds since the epoch, in UTC.
+            array = pa.array(values, pa.int64()).cast(pa.timestamp("us", "UTC"))
+            arrays.append(array.cast(field.type))
+        else:
+            arrays.append(pa.array(values, field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class Aggregate(ABC):
+    """State a derived table builds from its source table's batches.
+
+    Rows are upserts: every flush emits the current value of each key that
+    changed since the last one, once, so a destination writing in overwrite
+    mode ends up with the latest."""
+
+    def __init__(self) -> None:
+        self._dirty = set()
+
+    @abstractmethod
+    def add(self, batch: pa.RecordBatch) -> None:
+        pass
+
+    def pending(self) -> int:
+        # Keys changed since the last flush.
+        return len(self._dirty)
+
+    def flush(self, schema: pa.Schema) -> Optional[pa.RecordBatch]:
+        if not self._dirty:
+            return None
+        rows = [self._row(key) for key in sorted(self._dirty)]
+        self._dirty = set()
+        return rows_to_batch(rows, schema)
+
+    @abstractmethod
+    def _row(self, key: Hashable) -> Dict[str, object]:
+        pass
+
+
+@dataclass(frozen=True)
+class TradeFields:
+    """Where a post-trade table keeps what trade statistics are built from."""
+
+    time: str
+    instrument_id: str
+    isin: str
+    currency: str
+    price: str
+    quantity: str
+
+    @property
+    def names(self) -> Tuple[str, ...]:
+        return (
+            self.time,
+            self.instrument_id,
+            self.isin,
+            self.currency,
+            self.price,
+            self.quantity,
+        )
+
+
+@dataclass
+class Bar:
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float
+    notional: float
+    trades: int
+    # Microseconds since the epoch, UTC.
+    first_trade_time: int
+    last_trade_time: int
+    isin: Optional[str]
+    currency: Optional[str]
+
+
+# The column a period's start is emitted in.
+PERIOD_COLUMNS = {"minute": "minute", "day": "trading_day"}
+
+
+class TradeStatistics(Aggregate):
+    """Open, high, low, close, volume, notional and VWAP per instrument and
+    period, where the period is a minute (bars) or the trading day
+    (cumulative VWAP).
+
+    Each batch is reduced with one group-by to a partial result per key,
+    which is then merged into the running one; trades published late are
+    merged into the period they were traded in."""
+
+    def __init__(self, fields: TradeFields, period: str) -> None:
+        if period not in PERIOD_COLUMNS:
+            raise ValueError(f"unknown period {period}")
+        super().__init__()
+        self._fields = fields
+        self._period = period
+        self._state: Dict[Tuple[int, int], Bar] = {}
+
+    def add(self, batch: pa.RecordBatch) -> None:
+        fields = self._fields
+        time = batch.column(fields.time)
+        price = batch.column(fields.price)
+        quantity = pc.cast(batch.column(fields.quantity), pa.float64())
+        valid = pc.and_(
+            pc.and_(pc.is_valid(time), pc.is_valid(batch.column(fields.instrument_id))),
+            pc.and_(pc.is_valid(price), pc.is_valid(quantity)),
+        )
+        table = pa.table(
+            {
+                "instrument_id": batch.column(fields.instrument_id),
+                "period": pc.floor_temporal(time, unit=self._period),
+                "time": time,
+                "price": price,
+                "quantity": quantity,
+                "notional": pc.multiply(price, quantity),
+                "isin": plain(batch.column(fields.isin)),
+                "currency": plain(batch.column(fields.currency)),
+            }
+        ).filter(valid)
+        if not table.num_rows:
+            return
+        # Ordered by trade time, so first and last are the open and close.
+        table = table.sort_by("time")
+        for name in ("period", "time"):
+            table = table.set_column(
+                table.schema.get_field_index(name),
+                name,
+                table.column(name).cast(pa.int64()),
+            )
+        partials = table.group_by(["instrument_id", "period"], use_threads=False)
+        partials = partials.aggregate(
+            [
+                ("price", "first"),
+                ("price", "max"),
+                ("price", "min"),
+                ("price", "last"),
+                ("quantity", "sum"),
+                ("notional", "sum"),
+                ("price", "count"),
+                ("time", "min"),
+                ("time", "max"),
+                ("isin", "last"),
+                ("currency", "last"),
+            ]
+        )
+        for row in partials.to_pylist():
+            self._merge(row)
+
+    def _merge(self, row: Dict[str, object]) -> None:
+        key = (row["instrument_id"], row["period"])
+        bar = self._state.get(key)
+        if bar is None:
+            self._state[key] = Bar(
+                open=row["price_first"],
+                high=row["price_max"],
+                low=row["price_min"],
+                close=row["price_last"],
+                volume=row["quantity_sum"],
+                notional=row["notional_sum"],
+                trades=row["price_count"],
+                first_trade_time=row["time_min"],
+                last_trade_time=row["time_max"],
+                isin=row["isin_last"],
+                currency=row["currency_last"],
+            )
+        else:
+            if row["time_min"] < bar.first_trade_time:
+                bar.open = row["price_first"]
+                bar.first_trade_time = row["time_min"]
+            if row["time_max"] >= bar.last_trade_time:
+                bar.close = row["price_last"]
+                bar.last_trade_time = row["time_max"]
+            bar.high = max(bar.high, row["price_max"])
+            bar.low = min(bar.low, row["price_min"])
+            bar.volume += row["quantity_sum"]
+            bar.notional += row["notional_sum"]
+            bar.trades += row["price_count"]
+            bar.isin = row["isin_last"] or bar.isin
+            bar.currency = row["currency_last"] or bar.currency
+        self._dirty.add(key)
+
+    def _row(self, key: Tuple[int, int]) -> Dict[str, object]:
+        bar = self._state[key]
+        instrument_id, period = key
+        return {
+            PERIOD_COLUMNS[self._period]: period,
+            "instrument_id": instrument_id,
+            "isin": bar.isin,
+            "currency": bar.currency,
+            "open": bar.open,
+            "high": bar.high,
+            "low": bar.low,
+            "close": bar.close,
+            "volume": int(bar.volume),
+            "notional": bar.notional,
+            "vwap": bar.notional / bar.volume if bar.volume else None,
+            "trades": bar.trades,
+            "first_trade_time": bar.first_trade_time,
+            "last_trade_time": bar.last_trade_time,
+        }
+
+
+# Order book messages that take an order off the book; any other message
+# leaves the order at the price and size it carries.
+DELETE_MESSAGES = {"D"}
+BID = "B"
+OFFER = "S"
+
+
+class Top(NamedTuple):
+    # The best price on each side, the size resting at it and how many
+    # orders make that up; None for an empty side.
+    bid_price: Optional[float]
+    bid_size: Optional[float]
+    bid_orders: Optional[int]
+    offer_price: Optional[float]
+    offer_size: Optional[float]
+    offer_orders: Optional[int]
+
+
+class TopOfBook(Aggregate):
+    """Best bid and offer per instrument, kept from an order book of the
+    day's messages keyed by order id.
+
+    Each batch is reduced to the last message per order, which replaces or
+    removes the order on the book, and the top is then recomputed for the
+    instruments the batch touched. Only a changed top is emitted, keyed by
+    the instrument and the time of its last message."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._book = {
+            "order_id": np.empty(0, np.int64),
+            "instrument_id": np.empty(0, np.int64),
+            "bid": np.empty(0, bool),
+            "price": np.empty(0, np.float64),
+            "size": np.empty(0, np.float64),
+        }
+        self._tops: Dict[int, Top] = {}
+        self._latest: Dict[int, dict] = {}
+
+    @property
+    def orders(self) -> int:
+        return len(self._book["order_id"])
+
+    def add(self, batch: pa.RecordBatch) -> None:
+        table = pa.table(
+            {
+                "order_id": batch.column("order_id").cast(pa.int64()),
+                "instrument_id": batch.column("instrument_id").cast(pa.int64()),
+                "time": batch.column("message_timestamp").cast(pa.int64()),
+                "rec_no": batch.column("rec_no").cast(pa.int64()),
+                "message_type": plain(batch.column("message_type")),
+                "side": plain(batch.column("side")),
+                "price": batch.column("price"),
+                "size": batch.column("size"),
+                "isin": batch.column("instrument_identification_code"),
+                "currency": plain(batch.column("currency")),
+            }
+        ).filter(
+            pc.and_(
+                pc.is_valid(batch.column("order_id")),
+                pc.is_valid(batch.column("instrument_id")),
+            )
+        )
+        if not table.num_rows:
+            return
+        table = table.sort_by([("time", "ascending"), ("rec_no", "ascending")])
+        orders = table.group_by("order_id", use_threads=False).aggregate(
+            [
+                ("instrument_id", "last"),
+                ("message_type", "last"),
+                ("side", "last"),
+                ("price", "last"),
+                ("size", "last"),
+            ]
+        )
+        touched = self._apply(orders)
+        instruments = table.group_by("instrument_id", use_threads=False).aggregate(
+            [("time", "max"), ("isin", "last"), ("currency", "last")]
+        )
+        for row in instruments.to_pylist():
+            latest = self._latest.setdefault(row["instrument_id"], {})
+            latest["time"] = row["time_max"]
+            latest["isin"] = row["isin_last"] or latest.get("isin")
+            latest["currency"] = row["currency_last"] or latest.get("currency")
+        touched = np.union1d(touched, instruments.column("instrument_id").to_numpy())
+        for instrument_id, top in self._top(touched).items():
+            if self._tops.get(instrument_id) != top:
+                self._tops[instrument_id] = top
+                self._dirty.add(instrument_id)
+
+    def _apply(self, orders: pa.Table) -> np.ndarray:
+        # Replaces the batch's orders on the book; returns the instruments
+        # of the orders it removed.
+        book = self._book
+        order_ids = orders.column("order_id").to_numpy()
+        replaced = np.isin(book["order_id"], order_ids)
+        removed = book["instrument_id"][replaced]
+        side = orders.column("side_last")
+        price = orders.column("price_last").fill_null(0).to_numpy()
+        size = orders.column("size_last").fill_null(0).to_numpy()
+        deleted = pc.is_in(
+            orders.column("message_type_last"),
+            value_set=pa.array(sorted(DELETE_MESSAGES)),
+        )
+        sided = pc.is_in(side, value_set=pa.array([BID, OFFER]))
+        resting = (
+            ~to_mask(deleted, False) & to_mask(sided, False) & (price > 0) & (size > 0)
+        )
+        keep = ~replaced
+        instrument_ids = orders.column("instrument_id_last").to_numpy()
+        bids = to_mask(pc.equal(side, BID), False)
+        self._book = {
+            "order_id": np.concatenate([book["order_id"][keep], order_ids[resting]]),
+            "instrument_id": np.concatenate(
+                [book["instrument_id"][keep], instrument_ids[resting]]
+            ),
+            "bid": np.concatenate([book["bid"][keep], bids[resting]]),
+            "price": np.concatenate([book["price"][keep], price[resting]]),
+            "size": np.concatenate([book["size"][keep], size[resting]]),
+        }
+        return np.unique(removed)
+
+    def _top(self, instruments: np.ndarray) -> Dict[int, Top]:
+        book = self._book
+        on_book = np.isin(book["instrument_id"], instruments)
+        sides = {int(instrument): {} for instrument in instruments}
+        for side, bid, best in (("bid", True, "max"), ("offer", False, "min")):
+            mask = on_book & (book["bid"] == bid)
+            orders = pa.table(
+                {
+                    "instrument_id": book["instrument_id"][mask],
+                    "price": book["price"][mask],
+                    "size": book["size"][mask],
+                }
+            )
+            prices = orders.group_by("instrument_id").aggregate([("price", best)])
+            at_best = orders.join(prices, "instrument_id").filter(
+                pc.equal(pc.field("price"), pc.field(f"price_{best}"))
+            )
+            levels = at_best.group_by("instrument_id").aggregate(
+                [("price", "max"), ("size", "sum"), ("size", "count")]
+            )
+            for row in levels.to_pylist():
+                sides[row["instrument_id"]][side] = (
+                    row["price_max"],
+                    row["size_sum"],
+                    row["size_count"],
+                )
+        return {
+            instrument: Top(
+                *quotes.get("bid", (None, None, None)),
+                *quotes.get("offer", (None, None, None)),
+            )
+            for instrument, quotes in sides.items()
+        }
+
+    def _row(self, instrument_id: int) -> Dict[str, object]:
+        latest = self._latest.get(instrument_id, {})
+        return {
+            "instrument_id": instrument_id,
+            "as_of": latest.get("time"),
+            "isin": latest.get("isin"),
+            "currency": latest.get("currency"),
+            **self._tops[instrument_id]._asdict(),
+        }
+
+
+class Checkpoint(NamedTuple):
+    # An aggregate and the keys it has seen, built from every minute up to
+    # and including through.
+    through: datetime
+    aggregate: Aggregate
+    index: Optional[KeyIndex]
+
+
+class AggregateStore:
+    """Checkpoints of derived tables by table and day, kept in memory and,
+    next to a state file, pickled so that the next sync resumes them."""
+
+    def __init__(self, directory: Optional[str] = None) -> None:
+        self._directory = directory
+        self._lock = threading.Lock()
+        # Pickled in memory as well, the resolver goes on changing the
+        # aggregate it saved.
+        self._checkpoints: Dict[Tuple[str, str], bytes] = {}
+
+    def _path(self, table: str, day: str) -> str:
+        return os.path.join(self._directory, f"{table}-{day}.pickle")
+
+    def load(self, table: str, day: str) -> Optional[Checkpoint]:
+        if self._directory is None:
+            with self._lock:
+                data = self._checkpoints.get((table, day))
+            return pickle.loads(data) if data is not None else None
+        try:
+            with open(self._path(table, day), "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, table: str, day: str, checkpoint: Checkpoint) -> None:
+        # Saved before the table's cursor is committed past through, so a
+        # crash in between only re-reads minutes the checkpoint skips.
+        data = pickle.dumps(checkpoint, protocol=pickle.HIGHEST_PROTOCOL)
+        if self._directory is None:
+            with self._lock:
+                self._checkpoints[(table, day)] = data
+            return
+        os.makedirs(self._directory, exist_ok=True)
+        path = self._path(table, day)
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(data)
+        os.replace(f"{path}.tmp", path)
@@ -0,0 +1,72 @@
+import time
+from collections import deque
+from datetime import datetime
+from typing import Generator, List, Optional
+
+import pyarrow as pa
+
+
+class RecordBatcher:
+    """Coalesces the record batches of small minute files into insert
+    messages of up to max_rows rows or max_bytes bytes, and splits larger
+    ones. Rows are never held back longer than max_latency seconds once the
+    resolver checks in with flush_due.
+
+    It also tracks which minutes have been emitted in full, so a minute is
+    only checkpointed once none of its rows are waiting in here."""
+
+    def __init__(self, max_rows: int, max_bytes: int, max_latency: float) -> None:
+        self._max_rows = max_rows
+        self._max_bytes = max_bytes
+        self._max_latency = max_latency
+        self._pending: List[pa.RecordBatch] = []
+        self._rows = 0
+        self._bytes = 0
+        self._oldest = None
+        self._added = 0
+        self._emitted = 0
+        self._minutes = deque()
+
+    def add(self, batch: pa.RecordBatch) -> Generator[pa.RecordBatch, None, None]:
+        while batch.num_rows:
+            part = batch.slice(0, self._max_rows - self._rows)
+            batch = batch.slice(part.num_rows)
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append(part)
+            self._rows += part.num_rows
+            self._bytes += part.nbytes
+            self._added += part.num_rows
+            if self._rows >= self._max_rows or self._bytes >= self._max_bytes:
+                yield self._take()
+
+    def minute_done(self, cursor: datetime) -> None:
+        self._minutes.append((cursor, self._added))
+
+    def flush_due(self) -> Generator[pa.RecordBatch, None, None]:
+        if self._pending and time.monotonic() - self._oldest >= self._max_latency:
+            yield self._take()
+
+    def flush(self) -> Generator[pa.RecordBatch, None, None]:
+        if self._pending:
+            yield self._take()
+
+    def emitted_through(self) -> Optional[datetime]:
+        # The last minute whose rows have all been handed out.
+        cursor = None
+        while self._minutes and self._minutes[0][1] <= self._emitted:
+            cursor = self._minutes.popleft()[0]
+        return cursor
+
+    def _take(self) -> pa.RecordBatch:
+        if len(self._pending) == 1:
+            batch = self._pending[0]
+        else:
+            batch = (
+                pa.Table.from_batches(self._pending).combine_chunks().to_batches()[0]
+            )
+        self._emitted += batch.num_rows
+        self._pending = []
+        self._rows = 0
+        self._bytes = 0
+        return batch
@@ -0,0 +1,118 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Dict, Generator, Optional
+
+import pyarrow as pa
+
+from plugin.tables.decoder import CSVDecoder
+from plugin.tables.instruments import InstrumentFilter
+from plugin.tables.mapping import TableMapping
+
+# Minute files and decoded batches are handed between processes as files in
+# shared memory, mapped rather than copied on both sides.
+SHARED_MEMORY_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+# Decoders compiled so far by this worker process, by table name.
+_decoders: Dict[str, CSVDecoder] = {}
+
+
+def shared_path() -> str:
+    return os.path.join(SHARED_MEMORY_DIR, f"lseg-{uuid.uuid4().hex}")
+
+
+def decoder_for(mapping: TableMapping) -> CSVDecoder:
+    decoder = _decoders.get(mapping.name)
+    if decoder is None:
+        # Imported here, only worker processes need to build tables.
+        from plugin.tables.resolver import MappedTable
+
+        decoder = CSVDecoder(
+            MappedTable(mapping),
+            mapping.columns,
+            mapping.row_filter,
+            mapping.instruments,
+        )
+        _decoders[mapping.name] = decoder
+    return decoder
+
+
+def decode_file(
+    mapping: TableMapping,
+    path: str,
+    block_size: int,
+    instruments: Optional[InstrumentFilter] = None,
+) -> Optional[str]:
+    # Runs in a worker: decodes the minute file at path and writes the batches
+    # as an Arrow IPC stream to a new shared memory file.
+    decoder = decoder_for(mapping)
+    with pa.memory_map(path) as source:
+        batches = list(decoder.decode(source, block_size, instruments))
+    if not batches:
+        return None
+    output_path = shared_path()
+    try:
+        with pa.OSFile(output_path, "wb") as sink:
+            with pa.ipc.new_stream(sink, batches[0].schema) as writer:
+                for batch in batches:
+                    writer.write_batch(batch)
+    except BaseException:
+        os.remove(output_path)
+        raise
+    return output_path
+
+
+class DecodePool:
+    """Decodes minute files in worker processes, so parsing and converting
+    scale past the one core the GIL allows a single process."""
+
+    def __init__(self, workers: int) -> None:
+        # Spawned rather than forked, the plugin is full of threads and locks.
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def decode(
+        self,
+        mapping: TableMapping,
+        body: BinaryIO,
+        block_size: int,
+        instruments: Optional[InstrumentFilter] = None,
+    ) -> Generator[pa.RecordBatch, None, None]:
+        # The body is read right away, the batches once the caller asks for
+        # them: waiting for the network and for a worker are kept apart.
+        input_path = shared_path()
+        try:
+            with open(input_path, "wb") as f:
+                shutil.copyfileobj(body, f, block_size)
+        except BaseException:
+            os.remove(input_path)
+            raise
+        return self._decoded(mapping, input_path, block_size, instruments)
+
+    def _decoded(
+        self,
+        mapping: TableMapping,
+        input_path: str,
+        block_size: int,
+        instruments: Optional[InstrumentFilter],
+    ) -> Generator[pa.RecordBatch, None, None]:
+        try:
+            output_path = self._executor.submit(
+                decode_file, mapping, input_path, block_size, instruments
+            ).result()
+        finally:
+            os.remove(input_path)
+        if output_path is None:
+            return
+        # The mapping outlives the file name, and the batches read from it
+        # point straight into the worker's output.
+        source = pa.memory_map(output_path)
+        os.remove(output_path)
+        yield from pa.ipc.open_stream(source)
+
+    def close(self) -> None:
+        self._executor.shutdown(cancel_futures=True)
@@ -0,0 +1,130 @@
+from typing import BinaryIO, Generator, Mapping, Optional, Sequence
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from cloudquery.sdk.schema import Table
+from pyarrow import csv
+
+from plugin.tables.instruments import InstrumentFilter
+from plugin.tables.mapping import ColumnMapping, RowFilter
+
+PARSE_OPTIONS = csv.ParseOptions(delimiter=";")
+TIMESTAMP_TYPE = pa.timestamp("us", "UTC")
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+
+def read_type(data_type: pa.DataType) -> pa.DataType:
+    # Values are read into wide types first and cast to the column type once
+    # the whole file is decoded, so range checks and filters see raw values.
+    if pa.types.is_timestamp(data_type):
+        return pa.string()
+    if pa.types.is_integer(data_type):
+        return pa.int64()
+    if pa.types.is_floating(data_type):
+        return pa.float64()
+    return data_type
+
+
+def to_timestamp(array: pa.Array) -> pa.Array:
+    # Post-trade feeds carry a zone offset, pre-trade feeds are naive UTC.
+    try:
+        return pc.cast(array, TIMESTAMP_TYPE)
+    except pa.ArrowInvalid:
+        return pc.cast(pc.cast(array, pa.timestamp("us")), TIMESTAMP_TYPE)
+
+
+class CSVDecoder:
+    """Decodes a table's minute files according to its column mappings.
+
+    The mappings are compiled once: the CSV reader only converts the mapped
+    fields, straight into wide Arrow types, and each batch then goes through
+    a fixed list of column steps with no per-row work. Instrument filters
+    run on the raw batch, before any of it is converted."""
+
+    def __init__(
+        self,
+        table: Table,
+        columns: Sequence[ColumnMapping],
+        row_filter: Optional[RowFilter] = None,
+        instruments: Mapping[str, str] = {},
+    ) -> None:
+        self._schema = table.to_arrow_schema()
+        mappings = {column.name: column for column in columns}
+        self._steps = [
+            (
+                field.name,
+                mappings[field.name].source,
+                pa.types.is_timestamp(field.type),
+                mappings[field.name].fill_null,
+            )
+            for field in self._schema
+        ]
+        self._row_filter = row_filter
+        self._instrument_sources = {
+            key: mappings[name].source for key, name in instruments.items()
+        }
+        self._convert_options = csv.ConvertOptions(
+            column_types={
+                mappings[field.name].source: read_type(field.type)
+                for field in self._schema
+            },
+            include_columns=[mappings[field.name].source for field in self._schema],
+            include_missing_columns=True,
+            true_values=["1", "true", "True"],
+            false_values=["0", "false", "False"],
+            strings_can_be_null=True,
+        )
+
+    def decode(
+        self,
+        source: BinaryIO,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        instruments: Optional[InstrumentFilter] = None,
+    ) -> Generator[pa.RecordBatch, None, None]:
+        # Reads block_size bytes at a time, so a batch is yielded as soon as
+        # its block has arrived rather than after the whole file.
+        try:
+            reader = csv.open_csv(
+                source,
+                read_options=csv.ReadOptions(block_size=block_size),
+                parse_options=PARSE_OPTIONS,
+                convert_options=self._convert_options,
+            )
+        except pa.ArrowInvalid as e:
+            if str(e) == "Empty CSV file":
+                return
+            raise
+        for batch in reader:
+            if instruments is not None:
+                batch = self.select_instruments(batch, instruments)
+            if batch.num_rows == 0:
+                continue
+            yield self.convert(batch)
+
+    def select_instruments(
+        self, batch: pa.RecordBatch, instruments: InstrumentFilter
+    ) -> pa.RecordBatch:
+        mask = instruments.mask(
+            {
+                key: batch.column(source)
+                for key, source in self._instrument_sources.items()
+            }
+        )
+        if mask is None:
+            return batch
+        return batch.filter(mask)
+
+    def convert(self, batch: pa.RecordBatch) -> pa.RecordBatch:
+        columns = {}
+        for name, source, is_timestamp, fill_null in self._steps:
+            column = batch.column(source)
+            if is_timestamp:
+                column = to_timestamp(column)
+            if fill_null is not None:
+                column = column.fill_null(fill_null)
+            columns[name] = column
+        if self._row_filter is not None:
+            mask = self._row_filter(columns)
+            columns = {name: column.filter(mask) for name, column in columns.items()}
+        arrays = [columns[field.name].cast(field.type) for field in self._schema]
+        return pa.RecordBatch.from_arrays(arrays, schema=self._schema)
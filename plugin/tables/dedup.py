@@ -0,0 +1,125 @@
+import glob
+import os
+from typing import List, Optional, Sequence
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Multiplier folding one more key column into a row's hash.
+FOLD = np.uint64(0x9E3779B97F4A7C15)
+
+
+def mix(values: np.ndarray) -> np.ndarray:
+    # splitmix64 finaliser, spreads sequential ids over the whole range.
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xBF58476D1CE4E5B9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def key_hashes(batch: pa.RecordBatch, names: Sequence[str]) -> np.ndarray:
+    # One 64-bit hash per row over its primary key columns. Keys are integers
+    # and timestamps, their bits are hashed as they are.
+    hashes = np.zeros(batch.num_rows, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for name in names:
+            column = batch.column(name)
+            if not (
+                pa.types.is_integer(column.type) or pa.types.is_temporal(column.type)
+            ):
+                raise TypeError(f"can't hash key column {name} of type {column.type}")
+            # Nulls hash like 0, rows with a null key are left out of the
+            # index by keyed_rows.
+            values = pc.fill_null(column.cast(pa.int64(), safe=False), 0)
+            hashes = mix(hashes * FOLD + values.to_numpy().view(np.uint64))
+    return hashes
+
+
+def keyed_rows(batch: pa.RecordBatch, names: Sequence[str]) -> Optional[np.ndarray]:
+    # Mask of the rows whose key columns are all set, None when no key is
+    # null. A row without a whole key can't be told apart from another one.
+    mask = None
+    for name in names:
+        column = batch.column(name)
+        if column.null_count:
+            valid = column.is_valid().to_numpy(zero_copy_only=False)
+            mask = valid if mask is None else mask & valid
+    return mask
+
+
+class KeyIndex:
+    """The primary keys a table has emitted, as 64-bit hashes. Two keys
+    whose hashes collide count as one, so the index is exact only up to
+    hash collisions.
+
+    Hashes are kept in sorted runs that are merged whenever one grows as big
+    as the one before it, so a lookup is a binary search in each of at most
+    log2(n) runs and a trading day of keys stays a few flat arrays."""
+
+    def __init__(self, hashes: Optional[np.ndarray] = None) -> None:
+        self._runs: List[np.ndarray] = []
+        if hashes is not None and len(hashes):
+            self._runs.append(np.unique(hashes))
+
+    def __len__(self) -> int:
+        return sum(len(run) for run in self._runs)
+
+    def new_rows(self, hashes: np.ndarray) -> np.ndarray:
+        # Mask of the rows whose key hasn't been seen, here or in an earlier
+        # batch; they are recorded as seen.
+        unique, first = np.unique(hashes, return_index=True)
+        seen = np.zeros(len(unique), dtype=bool)
+        for run in self._runs:
+            positions = np.minimum(np.searchsorted(run, unique), len(run) - 1)
+            seen |= run[positions] == unique
+        mask = np.zeros(len(hashes), dtype=bool)
+        mask[first[~seen]] = True
+        fresh = unique[~seen]
+        if len(fresh):
+            self._add(fresh)
+        return mask
+
+    def _add(self, hashes: np.ndarray) -> None:
+        self._runs.append(hashes)
+        while len(self._runs) > 1 and len(self._runs[-2]) <= len(self._runs[-1]):
+            merged = np.concatenate(self._runs[-2:])
+            merged.sort()
+            self._runs[-2:] = [merged]
+
+    def hashes(self) -> np.ndarray:
+        if not self._runs:
+            return np.empty(0, dtype=np.uint64)
+        if len(self._runs) > 1:
+            merged = np.concatenate(self._runs)
+            merged.sort()
+            self._runs = [merged]
+        return self._runs[0]
+
+
+def index_path(directory: str, table: str, day: str) -> str:
+    return os.path.join(directory, f"{table}-{day}.npy")
+
+
+def load_index(directory: Optional[str], table: str, day: str) -> KeyIndex:
+    if directory is None:
+        return KeyIndex()
+    path = index_path(directory, table, day)
+    if not os.path.exists(path):
+        return KeyIndex()
+    return KeyIndex(np.load(path))
+
+
+def save_index(directory: str, table: str, day: str, index: KeyIndex) -> None:
+    # Only the latest day is kept per table, it is the only one resumed with
+    # an overlap.
+    os.makedirs(directory, exist_ok=True)
+    path = index_path(directory, table, day)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, index.hashes())
+    os.replace(tmp_path, path)
+    for stale in glob.glob(os.path.join(glob.escape(directory), f"{table}-*.npy")):
+        if stale != path:
+            os.remove(stale)
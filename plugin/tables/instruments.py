@@ -0,0 +1,110 @@
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+def id_ranges(values) -> Tuple[Tuple[int, int], ...]:
+    # Single ids and [first, last] ranges, merged into sorted disjoint ranges.
+    ranges = []
+    for value in values:
+        if isinstance(value, int):
+            first = last = value
+        elif isinstance(value, (list, tuple)) and len(value) == 2:
+            first, last = (int(bound) for bound in value)
+        else:
+            raise Exception(
+                f"instrument_ids entries must be ids or [first, last], got {value!r}"
+            )
+        if first > last:
+            raise Exception(f"instrument_ids range {value!r} is empty")
+        ranges.append((first, last))
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return tuple(merged)
+
+
+@dataclass(frozen=True)
+class InstrumentFilter:
+    """The instruments a sync keeps. Each criterion matches any of its
+    values, rows have to match every criterion their table carries."""
+
+    isins: FrozenSet[str] = frozenset()
+    instrument_ids: Tuple[Tuple[int, int], ...] = ()
+    currencies: FrozenSet[str] = frozenset()
+    mics: FrozenSet[str] = frozenset()
+
+    @classmethod
+    def from_spec(cls, spec: Dict[str, Any]) -> Optional["InstrumentFilter"]:
+        unknown = set(spec) - {"isins", "instrument_ids", "currencies", "mics"}
+        if unknown:
+            raise Exception(f"unknown instrument filters: {', '.join(sorted(unknown))}")
+        for name, values in spec.items():
+            if not isinstance(values, list):
+                raise Exception(f"instruments.{name} must be a list")
+        instruments = cls(
+            isins=frozenset(spec.get("isins", ())),
+            instrument_ids=id_ranges(spec.get("instrument_ids", ())),
+            currencies=frozenset(spec.get("currencies", ())),
+            mics=frozenset(spec.get("mics", ())),
+        )
+        if not any(
+            (
+                instruments.isins,
+                instruments.instrument_ids,
+                instruments.currencies,
+                instruments.mics,
+            )
+        ):
+            return None
+        return instruments
+
+    @cached_property
+    def _value_sets(self) -> Dict[str, pa.Array]:
+        # Built once per sync rather than per batch.
+        value_sets = {
+            "isin": self.isins,
+            "currency": self.currencies,
+            "mic": self.mics,
+        }
+        return {
+            key: pa.array(sorted(values), pa.string())
+            for key, values in value_sets.items()
+            if values
+        }
+
+    @cached_property
+    def _id_bounds(self) -> Tuple[np.ndarray, np.ndarray]:
+        firsts, lasts = zip(*self.instrument_ids)
+        return np.array(firsts, dtype=np.int64), np.array(lasts, dtype=np.int64)
+
+    def mask(self, columns: Dict[str, pa.Array]) -> Optional[pa.Array]:
+        # columns are the table's raw values by instrument key, as read from
+        # the CSV; None when no criterion applies to the table.
+        masks = []
+        for key, value_set in self._value_sets.items():
+            if key in columns:
+                masks.append(pc.is_in(columns[key], value_set=value_set))
+        if self.instrument_ids and "instrument_id" in columns:
+            masks.append(self._id_mask(columns["instrument_id"]))
+        if not masks:
+            return None
+        mask = masks[0]
+        for other in masks[1:]:
+            mask = pc.and_kleene(mask, other)
+        return mask
+
+    def _id_mask(self, ids: pa.Array) -> pa.Array:
+        # The range starting at or before each id has to reach it.
+        firsts, lasts = self._id_bounds
+        values = pc.fill_null(ids, int(firsts[0]) - 1).to_numpy()
+        positions = np.searchsorted(firsts, values, side="right") - 1
+        inside = (positions >= 0) & (values <= lasts[np.maximum(positions, 0)])
+        return pa.array(inside)
@@ -0,0 +1,101 @@
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+import pyarrow as pa
+from cloudquery.sdk.schema import Column
+
+RowFilter = Callable[[Dict[str, pa.Array]], pa.Array]
+
+
+@dataclass(frozen=True)
+class ColumnMapping:
+    """A table column, the CSV field it is read from and what an empty value
+    in that field becomes (null unless fill_null is set)."""
+
+    name: str
+    source: str
+    type: pa.DataType
+    fill_null: Any = None
+    primary_key: bool = False
+
+    def column(self, unique: bool = False) -> Column:
+        return Column(
+            self.name,
+            self.type,
+            primary_key=self.primary_key,
+            unique=unique,
+        )
+
+
+@dataclass(frozen=True)
+class TableMapping:
+    """Everything that differs between the minute file tables: the feed they
+    read and how its fields map onto columns. Adding a venue is a matter of
+    adding one of these to TABLE_MAPPINGS.
+
+    instruments names the columns holding the instrument keys (isin,
+    instrument_id, currency, mic) that instrument filters select on."""
+
+    name: str
+    title: str
+    feed: str
+    columns: Tuple[ColumnMapping, ...]
+    row_filter: Optional[RowFilter] = None
+    instruments: Mapping[str, str] = field(default_factory=dict)
+
+    @property
+    def primary_key(self) -> Tuple[str, ...]:
+        return tuple(column.name for column in self.columns if column.primary_key)
+
+    def schema_columns(self) -> List[Column]:
+        # A column is only unique on its own when it is the whole key.
+        single_key = len(self.primary_key) == 1
+        return [
+            column.column(unique=single_key and column.primary_key)
+            for column in self.columns
+        ]
+
+
+def select(
+    columns: Iterable[ColumnMapping], exclude: Iterable[str] = ()
+) -> Tuple[ColumnMapping, ...]:
+    excluded = set(exclude)
+    return tuple(column for column in columns if column.name not in excluded)
+
+
+@dataclass(frozen=True)
+class DerivedMapping:
+    """A table computed from another table's rows as they are decoded rather
+    than read from a feed of its own.
+
+    aggregate builds the state for one day of the source table, columns are
+    the derived table's own and source_columns those of the source table the
+    aggregate (and the source's row filter) reads."""
+
+    name: str
+    title: str
+    source: TableMapping
+    source_columns: Tuple[str, ...]
+    columns: Tuple[Column, ...]
+    aggregate: Callable[[], Any]
+
+    @property
+    def feed(self) -> str:
+        return self.source.feed
+
+    @property
+    def decoded(self) -> TableMapping:
+        # Only what the aggregate reads is decoded, plus the instrument
+        # columns filters select on and the key rows are deduplicated by.
+        needed = (
+            set(self.source_columns)
+            | set(self.source.instruments.values())
+            | set(self.source.primary_key)
+        )
+        return replace(
+            self.source,
+            name=self.name,
+            columns=tuple(
+                column for column in self.source.columns if column.name in needed
+            ),
+        )
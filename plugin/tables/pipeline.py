@@ -0,0 +1,154 @@
+import io
+import queue
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import BinaryIO, Deque, Generator, Generic, Iterator, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Marks the end of a stage's items in its queue.
+_DONE = object()
+
+
+class FairShare:
+    """Decode slots shared by every table of a sync.
+
+    A table queues for a slot before each block it decodes, and waiting
+    tables are served round-robin, so a feed with large files (XLON
+    pre-trade) gets one turn per round like every other and can't keep the
+    slots to itself."""
+
+    def __init__(self, slots: int) -> None:
+        self._lock = threading.Lock()
+        self._free = max(slots, 1)
+        self._waiting: "OrderedDict[str, Deque[threading.Event]]" = OrderedDict()
+
+    @contextmanager
+    def turn(self, table: str) -> Generator[None, None, None]:
+        self.acquire(table)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def acquire(self, table: str) -> None:
+        with self._lock:
+            # Released slots are handed straight to a waiter, a free one
+            # means nobody is waiting.
+            if self._free:
+                self._free -= 1
+                return
+            granted = threading.Event()
+            self._waiting.setdefault(table, deque()).append(granted)
+        granted.wait()
+
+    def release(self) -> None:
+        with self._lock:
+            if not self._waiting:
+                self._free += 1
+                return
+            table, waiters = self._waiting.popitem(last=False)
+            granted = waiters.popleft()
+            # The table's other waiters go to the back of the round.
+            if waiters:
+                self._waiting[table] = waiters
+            granted.set()
+
+    def waiting(self) -> int:
+        with self._lock:
+            return sum(len(waiters) for waiters in self._waiting.values())
+
+
+class ReadAhead(io.RawIOBase):
+    """A body read a block ahead of its decoder.
+
+    fill is called before a decode slot is taken, so the slot's holder
+    parses a block already in memory rather than waiting for the network.
+    Arrow reads from a thread of its own, hence the lock."""
+
+    def __init__(self, body: BinaryIO, block_size: int) -> None:
+        self._body = body
+        self._block_size = block_size
+        self._lock = threading.Lock()
+        self._buffer = bytearray()
+        self._eof = False
+
+    def fill(self) -> None:
+        with self._lock:
+            self._fill()
+
+    def _fill(self) -> None:
+        while not self._eof and len(self._buffer) < self._block_size:
+            chunk = self._body.read(self._block_size - len(self._buffer))
+            if chunk:
+                self._buffer += chunk
+            else:
+                self._eof = True
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        with self._lock:
+            # A decoder reading past the filled block waits for the next one.
+            if not self._buffer:
+                self._fill()
+            n = min(len(buffer), len(self._buffer))
+            buffer[:n] = self._buffer[:n]
+            del self._buffer[:n]
+            return n
+
+
+class Stage(Generic[T]):
+    """Runs an iterator in its own thread, at most `size` items ahead of the
+    thread consuming them.
+
+    A full queue blocks the producer, so a destination that stops reading
+    holds back the scheduler's result queue, then the emit stage, then this
+    one, and nothing upstream reads further ahead than its queue allows.
+    Errors are raised again in the consuming thread."""
+
+    def __init__(self, source: Generator[T, None, None], size: int, name: str) -> None:
+        self._source = source
+        self._queue: "queue.Queue[Tuple[bool, object]]" = queue.Queue(max(size, 1))
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def __iter__(self) -> Iterator[T]:
+        try:
+            while True:
+                ok, item = self._queue.get()
+                if not ok:
+                    raise item
+                if item is _DONE:
+                    return
+                yield item
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        # The producer isn't joined, it may be waiting on the network or a
+        # tail poll; it stops at its next item and cleans up on its own.
+        self._stopped.set()
+
+    def _run(self) -> None:
+        try:
+            for item in self._source:
+                if not self._put((True, item)):
+                    return
+            self._put((True, _DONE))
+        except BaseException as e:
+            self._put((False, e))
+        finally:
+            self._source.close()
+
+    def _put(self, item: Tuple[bool, object]) -> bool:
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
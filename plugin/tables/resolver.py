@@ -0,0 +1,334 @@
+import time
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Generator, List, Optional, Tuple
+
+import pyarrow as pa
+from cloudquery.sdk.scheduler import TableResolver
+from cloudquery.sdk.schema import Table
+from cloudquery.sdk.schema.resource import Resource
+
+from plugin.lseg.state import CHECKPOINT_INTERVAL_SECONDS
+from plugin.metrics import StageTimer
+from plugin.tables.aggregates import Aggregate, Checkpoint
+from plugin.tables.batcher import RecordBatcher
+from plugin.tables.dedup import (
+    KeyIndex,
+    key_hashes,
+    keyed_rows,
+    load_index,
+    save_index,
+)
+from plugin.tables.decoder import CSVDecoder
+from plugin.tables.mapping import DerivedMapping, TableMapping
+from plugin.tables.pipeline import ReadAhead, Stage
+
+if TYPE_CHECKING:
+    from plugin.client import Client
+
+# What the decode stage hands to the emit stage.
+BATCH = "batch"
+MINUTE = "minute"
+WALK = "walk"
+
+
+class MinuteFileResolver(TableResolver):
+    def __init__(self, table: Table, feed: str, decoder: CSVDecoder) -> None:
+        super().__init__(table=table)
+        self._feed = feed
+        self._decoder = decoder
+        self._key_columns = list(table.primary_keys)
+
+    @property
+    def feed(self) -> str:
+        return self._feed
+
+    def multiplex(self, client: "Client") -> List["Client"]:
+        return client.shards()
+
+    def resolve(
+        self, client: "Client", parent_resource: Resource = None
+    ) -> Generator[pa.RecordBatch, None, None]:
+        # Fetching runs ahead in the prefetch window and decoding in a stage
+        # thread of its own; this thread only batches, emits and commits.
+        batcher = RecordBatcher(
+            client.spec.batch_rows,
+            client.spec.batch_bytes,
+            client.spec.batch_max_latency_seconds,
+        )
+        # Keys are tracked per day. Only today's are persisted, past days
+        # resume without an overlap to deduplicate.
+        today = client.client.today(self._feed)
+        day = (client.day or today).isoformat()
+        persist = client.key_index_dir is not None and day == today.isoformat()
+        index = None
+        if client.spec.dedup:
+            index = load_index(
+                client.key_index_dir if persist else None, self.table.name, day
+            )
+        stage = Stage(
+            self._decoded(client, index, state_key=self.table.name),
+            client.stage_queue_size,
+            name=f"decode-{self.table.name}-{day}",
+        )
+        timer = StageTimer(client.metrics, self.table.name)
+        for kind, value in stage:
+            if kind == BATCH:
+                ready_batches = batcher.add(value)
+            elif kind == MINUTE:
+                batcher.minute_done(value)
+                ready_batches = batcher.flush_due()
+            else:
+                # Tailing sleeps between walks, nothing may wait in the
+                # batcher meanwhile.
+                ready_batches = batcher.flush()
+            for ready in ready_batches:
+                timer.skip()
+                yield ready
+                timer.lap("emit")
+            if kind != BATCH:
+                self._commit(client, batcher)
+        client.client.flush_state()
+        if index is not None and persist:
+            save_index(client.key_index_dir, self.table.name, day, index)
+
+    def _decoded(
+        self,
+        client: "Client",
+        index: Optional[KeyIndex],
+        state_key: Optional[str],
+        after: Optional[datetime] = None,
+    ) -> Generator[Tuple[str, Any], None, None]:
+        # The decode stage: walks the minute files and hands on their
+        # batches, a marker once a minute is complete and one after each
+        # walk. Minutes up to after are fetched, so the feed's other tables
+        # get them from the fan-out, but not decoded. Each lap is booked
+        # against the stage it just finished.
+        timer = StageTimer(client.metrics, self.table.name)
+        for walk in client.client.minute_walks(
+            self._feed,
+            state_key=state_key,
+            day=client.day,
+            checkpoint=False,
+            tail=client.spec.tail,
+        ):
+            timer.lap("idle")
+            for cursor, body in walk:
+                timer.lap("network")
+                if after is not None and cursor <= after:
+                    body.close()
+                    continue
+                rows = 0
+                ahead = None
+                if client.decode_pool is not None:
+                    # Reads the whole body into the workers' input here.
+                    batches = client.decode_pool.decode(
+                        self.table.mapping,
+                        body,
+                        client.client.chunk_size,
+                        client.instruments,
+                    )
+                else:
+                    ahead = ReadAhead(body, client.client.chunk_size)
+                    batches = self._decoder.decode(
+                        ahead, client.client.chunk_size, client.instruments
+                    )
+                while True:
+                    # A streamed body's next block arrives before the slot is
+                    # taken, the slot is held for parsing and converting only.
+                    if ahead is not None:
+                        ahead.fill()
+                    timer.lap("network")
+                    with client.decode_share.turn(self.table.name):
+                        batch = next(batches, None)
+                        if batch is not None:
+                            rows += batch.num_rows
+                            if index is not None:
+                                batch = self._dedup(client, index, batch)
+                    timer.lap("parse")
+                    if batch is None:
+                        break
+                    yield BATCH, batch
+                    timer.lap("backpressure")
+                client.metrics.inc("lseg_rows_decoded", rows, table=self.table.name)
+                client.logger.debug(
+                    "decoded minute file",
+                    table=self.table.name,
+                    cursor=cursor.isoformat(),
+                    rows=rows,
+                )
+                yield MINUTE, cursor
+                timer.lap("backpressure")
+            yield WALK, None
+            timer.lap("backpressure")
+
+    def _dedup(
+        self, client: "Client", index: KeyIndex, batch: pa.RecordBatch
+    ) -> pa.RecordBatch:
+        # Overlapping re-fetches and repeated rows are dropped before they
+        # are ever serialised. Rows with a null key are always kept.
+        hashes = key_hashes(batch, self._key_columns)
+        keyed = keyed_rows(batch, self._key_columns)
+        if keyed is None:
+            mask = index.new_rows(hashes)
+        else:
+            mask = ~keyed
+            mask[keyed] = index.new_rows(hashes[keyed])
+        duplicates = len(mask) - int(mask.sum())
+        if not duplicates:
+            return batch
+        client.metrics.inc("lseg_rows_deduplicated", duplicates, table=self.table.name)
+        return batch.filter(pa.array(mask))
+
+    def _commit(self, client: "Client", batcher: RecordBatcher) -> None:
+        # Minutes are only checkpointed once all of their rows have left the
+        # batcher, rows still waiting in it are fetched again after a crash.
+        cursor = batcher.emitted_through()
+        if cursor is not None:
+            client.client.commit(self.table.name, client.day, cursor)
+
+
+class AggregateResolver(MinuteFileResolver):
+    """Resolves a derived table from its source feed's minute files, which
+    it shares with the source table's resolver through the fan-out."""
+
+    def __init__(
+        self, table: Table, derived: DerivedMapping, decoder: CSVDecoder
+    ) -> None:
+        super().__init__(table=table, feed=derived.feed, decoder=decoder)
+        self._derived = derived
+        self._key_columns = list(derived.source.primary_key)
+
+    def resolve(
+        self, client: "Client", parent_resource: Resource = None
+    ) -> Generator[pa.RecordBatch, None, None]:
+        # The aggregate resumes from its checkpoint and the walk from the
+        # table's cursor, like the source table's, so both read the same
+        # minutes through the fan-out. Without a checkpoint the day is built
+        # from its first minute. Changed rows are flushed as often as the
+        # batcher would flush source rows.
+        today = client.client.today(self._feed)
+        day = (client.day or today).isoformat()
+        checkpoint = client.aggregates.load(self.table.name, day)
+        through = None
+        aggregate = self._derived.aggregate()
+        index = KeyIndex() if client.spec.dedup else None
+        if checkpoint is not None:
+            through = checkpoint.through
+            aggregate = checkpoint.aggregate
+            if index is not None and checkpoint.index is not None:
+                index = checkpoint.index
+        schema = self.table.to_arrow_schema()
+        stage = Stage(
+            self._decoded(
+                client,
+                index,
+                state_key=self.table.name if checkpoint is not None else None,
+                after=through,
+            ),
+            client.stage_queue_size,
+            name=f"aggregate-{self.table.name}-{day}",
+        )
+        timer = StageTimer(client.metrics, self.table.name)
+        flushed = saved = time.monotonic()
+        for kind, value in stage:
+            if kind == BATCH:
+                timer.skip()
+                aggregate.add(value)
+                timer.lap("aggregate")
+                continue
+            if kind == MINUTE:
+                through = value
+                if (
+                    aggregate.pending() < client.spec.batch_rows
+                    and time.monotonic() - flushed
+                    < client.spec.batch_max_latency_seconds
+                ):
+                    continue
+            batch = aggregate.flush(schema)
+            flushed = time.monotonic()
+            if batch is not None:
+                timer.skip()
+                yield batch
+                timer.lap("emit")
+            if kind == WALK or flushed - saved >= CHECKPOINT_INTERVAL_SECONDS:
+                self._checkpoint(client, day, through, aggregate, index)
+                saved = flushed
+        self._checkpoint(client, day, through, aggregate, index)
+        client.client.flush_state()
+
+    def _checkpoint(
+        self,
+        client: "Client",
+        day: str,
+        through: Optional[datetime],
+        aggregate: Aggregate,
+        index: Optional[KeyIndex],
+    ) -> None:
+        if through is None:
+            return
+        client.aggregates.save(
+            self.table.name, day, Checkpoint(through, aggregate, index)
+        )
+        client.client.commit(self.table.name, client.day, through)
+
+
+class MappedTable(Table):
+    def __init__(self, mapping: TableMapping) -> None:
+        super().__init__(
+            name=mapping.name,
+            title=mapping.title,
+            is_incremental=True,
+            columns=mapping.schema_columns(),
+        )
+        self._mapping = mapping
+
+    @property
+    def mapping(self) -> TableMapping:
+        return self._mapping
+
+    @property
+    def resolver(self):
+        return MinuteFileResolver(
+            self,
+            self._mapping.feed,
+            CSVDecoder(
+                self,
+                self._mapping.columns,
+                self._mapping.row_filter,
+                self._mapping.instruments,
+            ),
+        )
+
+
+class DerivedTable(Table):
+    def __init__(self, derived: DerivedMapping) -> None:
+        super().__init__(
+            name=derived.name,
+            title=derived.title,
+            columns=list(derived.columns),
+        )
+        self._derived = derived
+
+    @property
+    def derived(self) -> DerivedMapping:
+        return self._derived
+
+    @property
+    def mapping(self) -> TableMapping:
+        # What the decode stage reads: the source feed's columns the
+        # aggregate needs, decoded under this table's name.
+        return self._derived.decoded
+
+    @property
+    def resolver(self):
+        mapping = self.mapping
+        return AggregateResolver(
+            self,
+            self._derived,
+            CSVDecoder(
+                MappedTable(mapping),
+                mapping.columns,
+                mapping.row_filter,
+                mapping.instruments,
+            ),
+        )
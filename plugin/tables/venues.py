@@ -0,0 +1,381 @@
+from dataclasses import replace
+from datetime import datetime
+from functools import partial
+from typing import Dict, Tuple
+from zoneinfo import ZoneInfo
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from cloudquery.sdk.schema import Column
+
+from plugin.tables.aggregates import TopOfBook, TradeFields, TradeStatistics
+from plugin.tables.mapping import ColumnMapping, DerivedMapping, TableMapping, select
+
+UTC = pa.timestamp("us", "UTC")
+# Codes, currencies, MICs and flags: a handful of distinct values repeated on
+# every row, stored once per batch and referenced by index.
+CODE = pa.dictionary(pa.int32(), pa.string())
+
+# MiFID II post-trade transparency fields, each venue publishes a subset.
+POST_TRADE_COLUMNS = (
+    ColumnMapping("distribution_time", "distributionTime", pa.timestamp("us")),
+    ColumnMapping("source_venue", "sourceVenue", pa.uint8()),
+    ColumnMapping("instrument_id", "instrumentId", pa.uint64()),
+    ColumnMapping(
+        "transaction_identification_code",
+        "transactionIdentificationCode",
+        pa.uint64(),
+        primary_key=True,
+    ),
+    ColumnMapping("mifid_price", "mifidPrice", pa.float64()),
+    ColumnMapping("mifid_quantity", "mifidQuantity", pa.uint64()),
+    ColumnMapping("trading_date_and_time", "tradingDateAndTime", pa.timestamp("us")),
+    ColumnMapping(
+        "instrument_identification_code_type",
+        "instrumentIdentificationCodeType",
+        CODE,
+    ),
+    ColumnMapping(
+        "instrument_identification_code", "instrumentIdentificationCode", pa.string()
+    ),
+    ColumnMapping("price_notation", "priceNotation", CODE),
+    ColumnMapping("price_currency", "priceCurrency", CODE),
+    ColumnMapping("notional_amount", "notionalAmount", pa.float64()),
+    ColumnMapping("notional_currency", "notionalCurrency", CODE),
+    ColumnMapping("venue_of_execution", "venueOfExecution", CODE),
+    ColumnMapping(
+        "publication_date_and_time", "publicationDateAndTime", pa.timestamp("us")
+    ),
+    ColumnMapping("transaction_to_be_cleared", "transactionToBeCleared", pa.bool_()),
+    ColumnMapping("measurement_unit", "measurementUnit", CODE),
+    ColumnMapping(
+        "quantity_in_measurement_unit", "quantityInMeasurementUnit", pa.float64()
+    ),
+    ColumnMapping("type", "type", CODE),
+    ColumnMapping("venue_of_publication", "venueOfPublication", CODE),
+    ColumnMapping("mifid_flags", "mifidFlags", CODE),
+    ColumnMapping(
+        "total_number_of_transactions", "totalNumberOfTransactions", pa.uint64()
+    ),
+    ColumnMapping(
+        "third_country_trading_venue_of_execution",
+        "thirdCountryTradingVenueOfExecution",
+        CODE,
+    ),
+    ColumnMapping("missing_price", "missingPrice", pa.float64()),
+)
+
+POST_TRADE_INSTRUMENTS = {
+    "isin": "instrument_identification_code",
+    "instrument_id": "instrument_id",
+    "currency": "price_currency",
+    "mic": "venue_of_execution",
+}
+
+# Order book messages of the Millennium pre-trade feeds. Instruments and
+# orders recur on every message about them, a message is identified by its
+# timestamp and record number.
+ORDER_COLUMNS = (
+    ColumnMapping("message_timestamp", "Message_Timestamp", UTC, primary_key=True),
+    ColumnMapping("rec_no", "RecNo", pa.uint64(), primary_key=True),
+    ColumnMapping("market_data_group", "Market_Data_Group", pa.uint8()),
+    ColumnMapping("dss_id", "DSS_ID", pa.uint64()),
+    ColumnMapping("message_type", "Message_Type", CODE),
+    ColumnMapping("order_id", "Order_ID", pa.uint64()),
+    ColumnMapping("instrument_id", "Instrument_ID", pa.uint64()),
+    ColumnMapping(
+        "instrument_identification_code",
+        "Instrument_Identification_Code",
+        pa.string(),
+    ),
+    ColumnMapping("currency", "Currency", CODE),
+    ColumnMapping("source_venue", "Source_Venue", pa.uint8()),
+    ColumnMapping("order_book_type", "Order_Book_Type", pa.uint8()),
+    ColumnMapping("side", "Side", CODE),
+    ColumnMapping("size", "Size", pa.float64()),
+    ColumnMapping("price", "Price", pa.float64()),
+    ColumnMapping("old_price", "Old_Price", pa.float64()),
+    ColumnMapping("old_size", "Old_Size", pa.float64()),
+)
+
+ORDER_INSTRUMENTS = {
+    "isin": "instrument_identification_code",
+    "instrument_id": "instrument_id",
+    "currency": "currency",
+}
+
+# LSE publishes the same messages with signed ids and blank sizes and prices
+# for zero.
+XLON_ORDER_TYPES = {
+    "rec_no": pa.int64(),
+    "market_data_group": pa.int32(),
+    "dss_id": pa.int64(),
+    "order_id": pa.int64(),
+    "instrument_id": pa.int64(),
+    "source_venue": pa.int32(),
+    "order_book_type": pa.int32(),
+}
+XLON_FILL_NULL = {"size": 0.0, "price": 0.0, "old_price": 0.0, "old_size": 0.0}
+XLON_ORDER_COLUMNS = tuple(
+    replace(
+        column,
+        type=XLON_ORDER_TYPES.get(column.name, column.type),
+        fill_null=XLON_FILL_NULL.get(column.name),
+    )
+    for column in ORDER_COLUMNS
+)
+
+# Best bid and offer quotes of Turquoise Europe, one per instrument at a
+# time.
+QUOTE_COLUMNS = (
+    ColumnMapping(
+        "distribution_time", "distributionTime", pa.timestamp("us"), primary_key=True
+    ),
+    ColumnMapping("instrument_id", "instrumentId", pa.uint64(), primary_key=True),
+    ColumnMapping("source_venue", "sourceVenue", pa.uint8()),
+    ColumnMapping("bid_market_size", "bidMarketSize", pa.float64()),
+    ColumnMapping("bid_limit_price", "bidLimitPrice", pa.float64()),
+    ColumnMapping("bid_yield", "bidYield", pa.float64()),
+    ColumnMapping("bid_limit_size", "bidLimitSize", pa.float64()),
+    ColumnMapping("offer_market_size", "offerMarketSize", pa.float64()),
+    ColumnMapping("offer_limit_price", "offerLimitPrice", pa.float64()),
+    ColumnMapping("offer_yield", "offerYield", pa.float64()),
+    ColumnMapping("offer_limit_size", "offerLimitSize", pa.float64()),
+    ColumnMapping("order_book_type", "orderBookType", pa.uint8()),
+    ColumnMapping(
+        "instrument_identification_code", "instrumentIdentificationCode", pa.string()
+    ),
+)
+
+QUOTE_INSTRUMENTS = {
+    "isin": "instrument_identification_code",
+    "instrument_id": "instrument_id",
+}
+
+XLON_POST_DELAYED_COLUMNS = (
+    ColumnMapping("distribution_timestamp", "distributionTime", UTC),
+    ColumnMapping("trading_timestamp", "tradingDateAndTime", UTC),
+    ColumnMapping(
+        "transaction_id", "transactionIdentificationCode", pa.uint64(), primary_key=True
+    ),
+    ColumnMapping("instrument_id", "instrumentId", pa.uint64()),
+    ColumnMapping("isin_instrument_code", "instrumentIdentificationCode", pa.string()),
+    ColumnMapping("currency", "priceCurrency", CODE),
+    ColumnMapping("price", "mifidPrice", pa.float64()),
+    ColumnMapping("quantity", "mifidQuantity", pa.uint64()),
+)
+
+
+XLON_POST_DELAYED_INSTRUMENTS = {
+    "isin": "isin_instrument_code",
+    "instrument_id": "instrument_id",
+    "currency": "currency",
+}
+
+
+def valid_trades(columns: Dict[str, pa.Array]) -> pa.Array:
+    now = pa.scalar(datetime.now(tz=ZoneInfo("UTC")), UTC)
+    return pc.and_(
+        pc.and_(
+            # trade has impossible datetime (it happened in the future)
+            pc.less_equal(columns["trading_timestamp"], now),
+            # trade must have a positive quantity
+            pc.greater_equal(columns["quantity"], 0),
+        ),
+        # trade must have an instrument code and a currency
+        pc.and_(
+            pc.is_valid(columns["isin_instrument_code"]),
+            pc.is_valid(columns["currency"]),
+        ),
+    )
+
+
+ECEU_POST_TRADE = TableMapping(
+    name="eceu_post_trade",
+    title="ECEU Post-Trade Data",
+    feed="TRADEcho-NL-Post-Trade",
+    columns=POST_TRADE_COLUMNS,
+    instruments=POST_TRADE_INSTRUMENTS,
+)
+
+ECHO_POST_TRADE = TableMapping(
+    name="echo_post_trade",
+    title="ECHO Post-Trade Data",
+    feed="TRADEcho-UK-Post-Trade",
+    columns=select(
+        POST_TRADE_COLUMNS,
+        exclude=["third_country_trading_venue_of_execution", "missing_price"],
+    ),
+    instruments=POST_TRADE_INSTRUMENTS,
+)
+
+TQEX_POST_TRADE = TableMapping(
+    name="tqex_post_trade",
+    title="TQEX Post-Trade Data",
+    feed="Turqouise-europe-Post-Trade",
+    columns=select(
+        POST_TRADE_COLUMNS,
+        exclude=[
+            "venue_of_publication",
+            "total_number_of_transactions",
+            "third_country_trading_venue_of_execution",
+            "missing_price",
+        ],
+    ),
+    instruments=POST_TRADE_INSTRUMENTS,
+)
+
+TQEX_PRE_TRADE = TableMapping(
+    name="tqex_pre_trade",
+    title="TQEX Pre-Trade Data",
+    feed="Turqouise-europe-Pre-Trade",
+    columns=QUOTE_COLUMNS,
+    instruments=QUOTE_INSTRUMENTS,
+)
+
+TRQX_POST_TRADE = TableMapping(
+    name="trqx_post_trade",
+    title="TRQX Post-Trade Data",
+    feed="Turquoise-UK-Post-Trade",
+    columns=TQEX_POST_TRADE.columns,
+    instruments=POST_TRADE_INSTRUMENTS,
+)
+
+TRQX_PRE_TRADE = TableMapping(
+    name="trqx_pre_trade",
+    title="TRQX Trade Data",
+    feed="Turquoise-UK-Pre-Trade",
+    columns=ORDER_COLUMNS,
+    instruments=ORDER_INSTRUMENTS,
+)
+
+XLON_POST_DELAYED = TableMapping(
+    name="xlon_post_delayed",
+    title="LSE Post-trade Delayed",
+    feed="LSE-Post-Trade",
+    columns=XLON_POST_DELAYED_COLUMNS,
+    row_filter=valid_trades,
+    instruments=XLON_POST_DELAYED_INSTRUMENTS,
+)
+
+XLON_PRE_TRADE = TableMapping(
+    name="xlon_pre_trade",
+    title="LSE Pre-Trade Data",
+    feed="LSE-Pre-Trade",
+    columns=XLON_ORDER_COLUMNS,
+    instruments=ORDER_INSTRUMENTS,
+)
+
+TABLE_MAPPINGS = (
+    ECEU_POST_TRADE,
+    ECHO_POST_TRADE,
+    TQEX_POST_TRADE,
+    TQEX_PRE_TRADE,
+    TRQX_POST_TRADE,
+    TRQX_PRE_TRADE,
+    XLON_POST_DELAYED,
+    XLON_PRE_TRADE,
+)
+
+XLON_TRADES = TradeFields(
+    time="trading_timestamp",
+    instrument_id="instrument_id",
+    isin="isin_instrument_code",
+    currency="currency",
+    price="price",
+    quantity="quantity",
+)
+
+TRQX_TRADES = TradeFields(
+    time="trading_date_and_time",
+    instrument_id="instrument_id",
+    isin="instrument_identification_code",
+    currency="price_currency",
+    price="mifid_price",
+    quantity="mifid_quantity",
+)
+
+# Derived rows are keyed by instrument and period, several per key are
+# upserts of the same row.
+TRADE_STATISTICS_COLUMNS = (
+    Column("volume", pa.uint64()),
+    Column("notional", pa.float64()),
+    Column("vwap", pa.float64()),
+    Column("trades", pa.uint64()),
+    Column("first_trade_time", UTC),
+    Column("last_trade_time", UTC),
+)
+
+
+def statistics_columns(period: Column, bars: bool) -> Tuple[Column, ...]:
+    ohlc = (
+        tuple(Column(name, pa.float64()) for name in ("open", "high", "low", "close"))
+        if bars
+        else ()
+    )
+    return (
+        period,
+        Column("instrument_id", pa.uint64(), primary_key=True),
+        Column("isin", pa.string()),
+        Column("currency", CODE),
+        *ohlc,
+        *TRADE_STATISTICS_COLUMNS,
+    )
+
+
+XLON_MINUTE_BARS = DerivedMapping(
+    name="xlon_minute_bars",
+    title="LSE Minute Bars",
+    source=XLON_POST_DELAYED,
+    source_columns=XLON_TRADES.names,
+    columns=statistics_columns(Column("minute", UTC, primary_key=True), bars=True),
+    aggregate=partial(TradeStatistics, XLON_TRADES, "minute"),
+)
+
+TRQX_VWAP = DerivedMapping(
+    name="trqx_vwap",
+    title="TRQX Daily VWAP",
+    source=TRQX_POST_TRADE,
+    source_columns=TRQX_TRADES.names,
+    columns=statistics_columns(
+        Column("trading_day", pa.date32(), primary_key=True), bars=False
+    ),
+    aggregate=partial(TradeStatistics, TRQX_TRADES, "day"),
+)
+
+XLON_TOP_OF_BOOK = DerivedMapping(
+    name="xlon_top_of_book",
+    title="LSE Top of Book",
+    source=XLON_PRE_TRADE,
+    source_columns=(
+        "message_timestamp",
+        "rec_no",
+        "message_type",
+        "order_id",
+        "instrument_id",
+        "instrument_identification_code",
+        "currency",
+        "side",
+        "size",
+        "price",
+    ),
+    columns=(
+        Column("instrument_id", pa.int64(), primary_key=True),
+        Column("as_of", UTC, primary_key=True),
+        Column("isin", pa.string()),
+        Column("currency", CODE),
+        Column("bid_price", pa.float64()),
+        Column("bid_size", pa.float64()),
+        Column("bid_orders", pa.uint64()),
+        Column("offer_price", pa.float64()),
+        Column("offer_size", pa.float64()),
+        Column("offer_orders", pa.uint64()),
+    ),
+    aggregate=TopOfBook,
+)
+
+DERIVED_MAPPINGS = (
+    TRQX_VWAP,
+    XLON_MINUTE_BARS,
+    XLON_TOP_OF_BOOK,
+)
@@ -0,0 +1,10 @@
+import pytest
+
+from tests.dmd_server import DMDServer
+from tests.harness import MINUTES, SYNC_DAY
+
+
+@pytest.fixture
+def dmd_server():
+    with DMDServer(days=[SYNC_DAY], minutes=MINUTES) as server:
+        yield server
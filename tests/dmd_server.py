@@ -0,0 +1,541 @@
+import gzip
+import hashlib
+import io
+import random
+import re
+import secrets
+import threading
+import time
+import zipfile
+from collections import Counter
+from datetime import date, datetime
+from datetime import time as dt_time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterable, List, Optional
+from zoneinfo import ZoneInfo
+
+from plugin.lseg.feeds import FEEDS
+
+TRADE_HEADER = [
+    "distributionTime",
+    "sourceVenue",
+    "instrumentId",
+    "transactionIdentificationCode",
+    "mifidPrice",
+    "mifidQuantity",
+    "tradingDateAndTime",
+    "instrumentIdentificationCodeType",
+    "instrumentIdentificationCode",
+    "priceNotation",
+    "priceCurrency",
+    "notionalAmount",
+    "notionalCurrency",
+    "venueOfExecution",
+    "publicationDateAndTime",
+    "transactionToBeCleared",
+    "measurementUnit",
+    "quantityInMeasurementUnit",
+    "type",
+    "venueOfPublication",
+    "mifidFlags",
+    "totalNumberOfTransactions",
+    "thirdCountryTradingVenueOfExecution",
+    "missingPrice",
+]
+
+ORDER_HEADER = [
+    "Message_Timestamp",
+    "RecNo",
+    "Market_Data_Group",
+    "DSS_ID",
+    "Message_Type",
+    "Order_ID",
+    "Instrument_ID",
+    "Instrument_Identification_Code",
+    "Currency",
+    "Source_Venue",
+    "Order_Book_Type",
+    "Side",
+    "Size",
+    "Price",
+    "Old_Price",
+    "Old_Size",
+]
+
+QUOTE_HEADER = [
+    "distributionTime",
+    "instrumentId",
+    "sourceVenue",
+    "bidMarketSize",
+    "bidLimitPrice",
+    "bidYield",
+    "bidLimitSize",
+    "offerMarketSize",
+    "offerLimitPrice",
+    "offerYield",
+    "offerLimitSize",
+    "orderBookType",
+    "instrumentIdentificationCode",
+]
+
+DIRECTORIES = {
+    "pretrade/TQE/FCA": "TRQX-pre",
+    "posttrade/TQE/FCA": "TRQX-post",
+    "pretrade/TQE/AFM": "TQEX-pre",
+    "posttrade/TQE/AFM": "TQEX-post",
+    "pretrade/LSE/FCA": "XLON-pre",
+    "posttrade/LSE/FCA": "XLON-post",
+    "posttrade/TEC/FCA": "ECHO-post",
+    "posttrade/TEC/AFM": "ECEU-post",
+}
+
+DIRECTORY_PATH = re.compile(r"/download/(?P<directory>\w+/\w+/\w+)/$")
+
+DOWNLOAD_PATH = re.compile(
+    r"/download/(?P<kind>pretrade|posttrade)/(?P<venue>\w+)/(?P<regime>\w+)/"
+    r"(?P<prefix>\w+-(?:pre|post))-(?P<minute>\d{4}-\d{2}-\d{2}T\d{2}_\d{2})\.csv$"
+)
+
+ARCHIVE_PATH = re.compile(
+    r"/download/(?P<directory>\w+/\w+/\w+)/"
+    r"(?P<prefix>\w+-(?:pre|post))-(?P<day>\d{4}-\d{2}-\d{2})\.zip$"
+)
+
+INSTRUMENTS = 200
+
+# Minute files are named after their venue's wall clock.
+CALENDARS = {feed.prefix: feed.calendar for feed in FEEDS.values()}
+
+
+def isin(instrument: int) -> str:
+    return f"GB00{instrument:08}"
+
+
+def currency(instrument: int) -> str:
+    # Every fourth instrument trades in euros.
+    return "EUR" if instrument % 4 == 0 else "GBP"
+
+
+def trade_rows(rng: random.Random, minute: datetime, rows: int) -> List[list]:
+    out = []
+    for i in range(rows):
+        instrument = rng.randrange(INSTRUMENTS)
+        traded = minute + timedelta(microseconds=i * 60_000_000 // rows)
+        price = round(rng.uniform(1, 500), 4)
+        quantity = rng.randrange(1, 10_000)
+        out.append(
+            [
+                (traded + timedelta(milliseconds=5)).isoformat() + "Z",
+                1,
+                instrument,
+                rng.randrange(1 << 63),
+                price,
+                quantity,
+                traded.isoformat() + "Z",
+                "ISIN",
+                isin(instrument),
+                "MONE",
+                currency(instrument),
+                round(price * quantity, 2),
+                currency(instrument),
+                "XLON",
+                (traded + timedelta(milliseconds=5)).isoformat() + "Z",
+                0,
+                "",
+                "",
+                "",
+                "XLON",
+                "ALGO",
+                1,
+                "",
+                "",
+            ]
+        )
+    return out
+
+
+def order_rows(rng: random.Random, minute: datetime, rows: int) -> List[list]:
+    out = []
+    for i in range(rows):
+        instrument = rng.randrange(INSTRUMENTS)
+        stamp = minute + timedelta(microseconds=i * 60_000_000 // rows)
+        out.append(
+            [
+                stamp.isoformat(sep=" "),
+                i,
+                1,
+                2,
+                rng.choice("ADM"),
+                rng.randrange(1 << 40),
+                instrument,
+                isin(instrument),
+                currency(instrument),
+                1,
+                1,
+                rng.choice("BS"),
+                rng.randrange(1, 10_000),
+                round(rng.uniform(1, 500), 4),
+                "",
+                "",
+            ]
+        )
+    return out
+
+
+def quote_rows(rng: random.Random, minute: datetime, rows: int) -> List[list]:
+    out = []
+    for i in range(rows):
+        instrument = rng.randrange(INSTRUMENTS)
+        stamp = minute + timedelta(microseconds=i * 60_000_000 // rows)
+        bid = round(rng.uniform(1, 500), 4)
+        out.append(
+            [
+                stamp.isoformat() + "Z",
+                instrument,
+                1,
+                rng.randrange(1, 10_000),
+                bid,
+                "",
+                rng.randrange(1, 10_000),
+                rng.randrange(1, 10_000),
+                round(bid * 1.001, 4),
+                "",
+                rng.randrange(1, 10_000),
+                1,
+                isin(instrument),
+            ]
+        )
+    return out
+
+
+def minute_file(prefix: str, minute: datetime, rows: int) -> bytes:
+    # Seeded by file so every request for the same minute gets the same body.
+    rng = random.Random(f"{prefix}/{minute.isoformat()}")
+    # Timestamps inside the file are UTC.
+    minute = (
+        minute.replace(tzinfo=ZoneInfo(CALENDARS[prefix].timezone))
+        .astimezone(ZoneInfo("UTC"))
+        .replace(tzinfo=None)
+    )
+    if prefix == "TQEX-pre":
+        header, body = QUOTE_HEADER, quote_rows(rng, minute, rows)
+    elif prefix.endswith("-pre"):
+        header, body = ORDER_HEADER, order_rows(rng, minute, rows)
+    else:
+        header, body = TRADE_HEADER, trade_rows(rng, minute, rows)
+    lines = [";".join(header)]
+    lines.extend(";".join(str(value) for value in row) for row in body)
+    return ("\n".join(lines) + "\n").encode()
+
+
+class FixtureHTTPServer(ThreadingHTTPServer):
+    # Every table opens a full prefetch window of connections at once.
+    request_queue_size = 256
+    daemon_threads = True
+
+
+class DMDServer:
+    """Local stand-in for the DMD portal: a login.html form with a CSRF token,
+    directory listings and synthetic minute files for every feed under
+    download/.
+
+    Minute files are published on the given days for `minutes` minutes from
+    session_start, or each venue's session open when it isn't set, plus any
+    extra_minutes outside the session. Directory listings leave out the
+    unlisted_days, like an index that only reaches back so far. rows sets
+    the rows per minute file, latency delays every download, and gzip
+    compresses bodies for clients that accept it. With archives, every day
+    is also published as one zip of its minute files, and with archive_pages
+    its archive path answers with an HTML page instead. Downloads beyond
+    max_in_flight at once are turned away with a 429. The next `errors`
+    downloads get a 503 and the next `drops` have their connection closed
+    unanswered, login_errors and login_drops do the same to the login page,
+    and every session ends once `expire_after` minute files were downloaded.
+    Requests of ended sessions are sent to the login page, or answered with
+    expired_status when it is set. requests counts each kind of request,
+    every request of any kind under "http" and every connection opened under
+    "connection"."""
+
+    def __init__(
+        self,
+        username: str = "user",
+        password: str = "password",
+        days: Iterable[date] = (),
+        session_start: Optional[dt_time] = None,
+        minutes: int = 511,
+        extra_minutes: Iterable[dt_time] = (),
+        listing: bool = True,
+        unlisted_days: Iterable[date] = (),
+        rows: int = 100,
+        latency: float = 0.0,
+        gzip: bool = False,
+        archives: bool = False,
+        archive_pages: bool = False,
+        max_in_flight: Optional[int] = None,
+    ) -> None:
+        self.username = username
+        self.password = password
+        self.days = set(days)
+        self.session_start = session_start
+        self.minutes = minutes
+        self.extra_minutes = set(extra_minutes)
+        self.listing = listing
+        self.unlisted_days = set(unlisted_days)
+        self.rows = rows
+        self.latency = latency
+        self.gzip = gzip
+        self.archives = archives
+        self.archive_pages = archive_pages
+        self.max_in_flight = max_in_flight
+        self.errors = 0
+        self.drops = 0
+        self.login_errors = 0
+        self.login_drops = 0
+        self.expire_after: Optional[int] = None
+        self.expired_status: Optional[int] = None
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = Counter()
+        self._csrf = secrets.token_hex(16)
+        self._sessions = set()
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/dmd/"
+
+    @property
+    def downloads(self) -> int:
+        return self.requests["download"]
+
+    def first_minute(self, prefix: str, day: date) -> datetime:
+        return datetime.combine(day, self.session_start or CALENDARS[prefix].open)
+
+    def published(self, prefix: str, minute: datetime) -> bool:
+        if minute.date() not in self.days:
+            return False
+        if minute.time() in self.extra_minutes:
+            return True
+        first = self.first_minute(prefix, minute.date())
+        return first <= minute < first + timedelta(minutes=self.minutes)
+
+    def published_minutes(self, prefix: str) -> List[datetime]:
+        minutes = []
+        for day in sorted(self.days):
+            first = self.first_minute(prefix, day)
+            minutes.extend(first + timedelta(minutes=i) for i in range(self.minutes))
+            minutes.extend(datetime.combine(day, t) for t in self.extra_minutes)
+        return sorted(minutes)
+
+    def directory_index(self, prefix: str) -> bytes:
+        links = "".join(
+            f"<a href='{name}'>{name}</a><br/>"
+            for name in (
+                f"{prefix}-{minute:%Y-%m-%dT%H_%M}.csv"
+                for minute in self.published_minutes(prefix)
+                if minute.date() not in self.unlisted_days
+            )
+        )
+        return f"<html><body>{links}</body></html>".encode()
+
+    def day_archive(self, prefix: str, day: date) -> bytes:
+        out = io.BytesIO()
+        with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as archive:
+            for minute in self.published_minutes(prefix):
+                if minute.date() == day:
+                    archive.writestr(
+                        f"{prefix}/{prefix}-{minute:%Y-%m-%dT%H_%M}.csv",
+                        minute_file(prefix, minute, self.rows),
+                    )
+        return out.getvalue()
+
+    def count(self, request: str) -> None:
+        with self._lock:
+            self.requests[request] += 1
+
+    def take_fault(self, login: bool = False) -> Optional[str]:
+        with self._lock:
+            if login and self.login_errors:
+                self.login_errors -= 1
+                self.requests["failed"] += 1
+                return "error"
+            if login and self.login_drops:
+                self.login_drops -= 1
+                self.requests["dropped"] += 1
+                return "drop"
+            if not login and self.errors:
+                self.errors -= 1
+                self.requests["failed"] += 1
+                return "error"
+            if not login and self.drops:
+                self.drops -= 1
+                self.requests["dropped"] += 1
+                return "drop"
+            return None
+
+    def expire_sessions(self) -> None:
+        with self._lock:
+            if self.expire_after is not None and self.downloads >= self.expire_after:
+                self.expire_after = None
+                self._sessions.clear()
+
+    def start(self) -> "DMDServer":
+        dmd = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                dmd.count("connection")
+                super().setup()
+
+            def do_GET(self):
+                self.respond(head=False)
+
+            def do_HEAD(self):
+                self.respond(head=True)
+
+            def respond(self, head: bool):
+                dmd.count("http")
+                if self.path.endswith("/login.html"):
+                    dmd.count("login")
+                    if self.fail(dmd.take_fault(login=True)):
+                        return
+                    return self.send(200, dmd.login_page())
+                dmd.expire_sessions()
+                if self.session() not in dmd._sessions:
+                    if dmd.expired_status is not None:
+                        return self.send(dmd.expired_status)
+                    return self.send(302, headers={"Location": "/dmd/login.html"})
+                directory = DIRECTORY_PATH.search(self.path)
+                if directory is not None:
+                    dmd.count("listing")
+                    if not dmd.listing:
+                        return self.send(404)
+                    prefix = DIRECTORIES[directory["directory"]]
+                    return self.send_versioned(dmd.directory_index(prefix))
+                archive = ARCHIVE_PATH.search(self.path)
+                if archive is not None:
+                    day = date.fromisoformat(archive["day"])
+                    if dmd.archive_pages:
+                        dmd.count("archive")
+                        return self.send(200, b"<html><body>Not found</body></html>")
+                    if not dmd.archives or day not in dmd.days:
+                        return self.send(404)
+                    dmd.count("archive")
+                    return self.send_versioned(
+                        dmd.day_archive(archive["prefix"], day), "application/zip"
+                    )
+                match = DOWNLOAD_PATH.search(self.path)
+                if match is None:
+                    return self.send(404)
+                minute = datetime.strptime(match["minute"], "%Y-%m-%dT%H_%M")
+                if not dmd.published(match["prefix"], minute):
+                    dmd.count("not_found")
+                    return self.send(404)
+                if head:
+                    dmd.count("head")
+                    return self.send(200, head=True)
+                if self.fail(dmd.take_fault()):
+                    return
+                with dmd._lock:
+                    if dmd.max_in_flight and dmd.in_flight >= dmd.max_in_flight:
+                        dmd.requests["throttled"] += 1
+                        return self.send(429, headers={"Retry-After": "0"})
+                    dmd.in_flight += 1
+                    dmd.peak_in_flight = max(dmd.peak_in_flight, dmd.in_flight)
+                try:
+                    dmd.count("download")
+                    if dmd.latency:
+                        time.sleep(dmd.latency)
+                    self.send_versioned(
+                        minute_file(match["prefix"], minute, dmd.rows), "text/csv"
+                    )
+                finally:
+                    with dmd._lock:
+                        dmd.in_flight -= 1
+
+            def fail(self, fault: Optional[str]) -> bool:
+                if fault == "error":
+                    self.send(503)
+                elif fault == "drop":
+                    self.close_connection = True
+                return fault is not None
+
+            def send_versioned(self, body: bytes, content_type="text/html") -> None:
+                # Tagged by content, a matching If-None-Match gets a 304.
+                etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+                if self.headers.get("If-None-Match") == etag:
+                    dmd.count("not_modified")
+                    return self.send(304, headers={"ETag": etag})
+                headers = {"ETag": etag, "Content-Type": content_type}
+                if dmd.gzip and "gzip" in self.headers.get("Accept-Encoding", ""):
+                    body = gzip.compress(body, compresslevel=1)
+                    headers["Content-Encoding"] = "gzip"
+                self.send(200, body, headers)
+
+            def do_POST(self):
+                dmd.count("http")
+                length = int(self.headers.get("Content-Length", 0))
+                form = dict(
+                    field.split("=", 1)
+                    for field in self.rfile.read(length).decode().split("&")
+                    if "=" in field
+                )
+                if (
+                    form.get("username") != dmd.username
+                    or form.get("password") != dmd.password
+                    or form.get("_csrf") != dmd._csrf
+                ):
+                    return self.send(403)
+                session = secrets.token_hex(16)
+                dmd.count("signed_in")
+                dmd._sessions.add(session)
+                self.send(200, b"ok", {"Set-Cookie": f"SESSION={session}; Path=/"})
+
+            def session(self) -> str:
+                for cookie in self.headers.get("Cookie", "").split(";"):
+                    name, _, value = cookie.strip().partition("=")
+                    if name == "SESSION":
+                        return value
+                return ""
+
+            def send(
+                self, status: int, body: bytes = b"", headers=None, head=False
+            ) -> None:
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if not head:
+                    self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = FixtureHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def login_page(self) -> bytes:
+        return (
+            "<html><body><form method='post' action='login.html'>"
+            "<input type='text' name='username'/>"
+            "<input type='password' name='password'/>"
+            f"<input type='hidden' name='_csrf' value='{self._csrf}'/>"
+            "</form></body></html>"
+        ).encode()
+
+    def __enter__(self) -> "DMDServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
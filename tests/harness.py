@@ -0,0 +1,56 @@
+import json
+import logging
+from collections import Counter, defaultdict
+from datetime import date
+from typing import Dict, List
+
+import structlog
+from cloudquery.sdk import plugin
+from cloudquery.sdk.message import SyncInsertMessage
+
+from plugin import ExamplePlugin
+from tests.dmd_server import DMDServer
+
+# Syncs backfill a fixed day so every run downloads the same files, the
+# fixture server only publishes the first MINUTES minutes of its session.
+SYNC_DAY = date(2024, 2, 20)
+MINUTES = 30
+
+
+def new_plugin(server: DMDServer, **spec) -> ExamplePlugin:
+    lseg = ExamplePlugin()
+    lseg.set_logger(
+        structlog.wrap_logger(
+            None, wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING)
+        )
+    )
+    lseg.init(
+        json.dumps(
+            {
+                "username": server.username,
+                "password": server.password,
+                "base_url": server.base_url,
+                "start_date": SYNC_DAY.isoformat(),
+                "end_date": SYNC_DAY.isoformat(),
+                **spec,
+            }
+        )
+    )
+    return lseg
+
+
+def sync_batches(lseg: ExamplePlugin, tables: List[str] = None) -> Dict[str, List[int]]:
+    # Rows of every insert message, by table.
+    batches = defaultdict(list)
+    options = plugin.SyncOptions(tables=tables or ["*"], skip_tables=[])
+    for message in lseg.sync(options):
+        if isinstance(message, SyncInsertMessage):
+            table = message.record.schema.metadata[b"cq:table_name"].decode()
+            batches[table].append(message.record.num_rows)
+    return batches
+
+
+def sync_rows(lseg: ExamplePlugin, tables: List[str] = None) -> Counter:
+    return Counter(
+        {table: sum(rows) for table, rows in sync_batches(lseg, tables).items()}
+    )
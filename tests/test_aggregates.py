@@ -0,0 +1,206 @@
+from datetime import date, datetime, timezone
+
+import pyarrow as pa
+import pytest
+from cloudquery.sdk import plugin
+from cloudquery.sdk.message import SyncInsertMessage
+
+from plugin.tables import DERIVED_MAPPINGS, TABLE_MAPPINGS, DerivedTable
+from plugin.tables.aggregates import Aggregate, TopOfBook, TradeStatistics
+from plugin.tables.venues import XLON_TRADES
+from tests.harness import MINUTES, new_plugin, sync_rows
+
+DERIVED = {derived.name: DerivedTable(derived) for derived in DERIVED_MAPPINGS}
+RAW_TABLES = [mapping.name for mapping in TABLE_MAPPINGS]
+CODE = pa.dictionary(pa.int32(), pa.string())
+
+
+def at(minute: int, second: int = 0) -> datetime:
+    return datetime(2024, 2, 20, 8, minute, second, tzinfo=timezone.utc)
+
+
+def trades(rows) -> pa.RecordBatch:
+    # (time, instrument, price, quantity) per trade.
+    times, instruments, prices, quantities = zip(*rows)
+    return pa.RecordBatch.from_pydict(
+        {
+            "trading_timestamp": pa.array(times, pa.timestamp("us", "UTC")),
+            "instrument_id": pa.array(instruments, pa.uint64()),
+            "isin_instrument_code": [f"GB{i:010}" for i in instruments],
+            "currency": pa.array(["GBP"] * len(rows)).dictionary_encode().cast(CODE),
+            "price": pa.array(prices, pa.float64()),
+            "quantity": pa.array(quantities, pa.uint64()),
+        }
+    )
+
+
+def orders(rows) -> pa.RecordBatch:
+    # (time, rec_no, message type, order, instrument, side, price, size).
+    columns = list(zip(*rows))
+    return pa.RecordBatch.from_pydict(
+        {
+            "message_timestamp": pa.array(columns[0], pa.timestamp("us", "UTC")),
+            "rec_no": pa.array(columns[1], pa.int64()),
+            "message_type": pa.array(columns[2]).dictionary_encode().cast(CODE),
+            "order_id": pa.array(columns[3], pa.int64()),
+            "instrument_id": pa.array(columns[4], pa.int64()),
+            "instrument_identification_code": [f"GB{i:010}" for i in columns[4]],
+            "currency": pa.array(["GBP"] * len(rows)).dictionary_encode().cast(CODE),
+            "side": pa.array(columns[5]).dictionary_encode().cast(CODE),
+            "price": pa.array(columns[6], pa.float64()),
+            "size": pa.array(columns[7], pa.float64()),
+        }
+    )
+
+
+def test_aggregates_implement_add_and_row():
+    with pytest.raises(TypeError):
+        Aggregate()
+
+
+def test_minute_bars_merge_batches_and_late_trades():
+    schema = DERIVED["xlon_minute_bars"].to_arrow_schema()
+    bars = TradeStatistics(XLON_TRADES, "minute")
+    bars.add(trades([(at(0, 10), 1, 10.0, 100), (at(0, 50), 1, 12.0, 100)]))
+    bars.add(trades([(at(1, 5), 1, 11.0, 50), (at(0, 30), 1, 9.0, 200)]))
+    # A late trade inside the first minute's range moves neither open nor
+    # close.
+    rows = {row["minute"].minute: row for row in bars.flush(schema).to_pylist()}
+    first = rows[0]
+    assert (first["open"], first["high"], first["low"], first["close"]) == (
+        10.0,
+        12.0,
+        9.0,
+        12.0,
+    )
+    assert first["volume"] == 400
+    assert first["trades"] == 3
+    assert first["vwap"] == (1000 + 1200 + 1800) / 400
+    assert first["first_trade_time"] == at(0, 10)
+    assert first["currency"] == "GBP"
+    assert rows[1]["vwap"] == 11.0
+    assert bars.flush(schema) is None
+    # Only the bar that changed is emitted again.
+    bars.add(trades([(at(1, 40), 1, 13.0, 50)]))
+    (row,) = bars.flush(schema).to_pylist()
+    assert (row["minute"], row["close"], row["vwap"]) == (at(1), 13.0, 12.0)
+
+
+def test_daily_vwap_accumulates_over_the_day():
+    schema = DERIVED["trqx_vwap"].to_arrow_schema()
+    vwap = TradeStatistics(XLON_TRADES, "day")
+    vwap.add(trades([(at(0), 1, 10.0, 100), (at(0), 2, 5.0, 10)]))
+    vwap.add(trades([(at(30), 1, 20.0, 300)]))
+    rows = {row["instrument_id"]: row for row in vwap.flush(schema).to_pylist()}
+    assert rows[1]["trading_day"] == date(2024, 2, 20)
+    assert rows[1]["vwap"] == (1000 + 6000) / 400
+    assert rows[2]["trades"] == 1
+
+
+def test_top_of_book_follows_adds_amends_and_deletes():
+    schema = DERIVED["xlon_top_of_book"].to_arrow_schema()
+    book = TopOfBook()
+    book.add(
+        orders(
+            [
+                (at(0, 1), 1, "A", 1, 7, "B", 10.0, 100.0),
+                (at(0, 2), 2, "A", 2, 7, "B", 10.0, 50.0),
+                (at(0, 3), 3, "A", 3, 7, "S", 11.0, 20.0),
+                (at(0, 4), 4, "A", 4, 7, "B", 9.0, 500.0),
+            ]
+        )
+    )
+    (top,) = book.flush(schema).to_pylist()
+    assert top["as_of"] == at(0, 4)
+    assert (top["bid_price"], top["bid_size"], top["bid_orders"]) == (10.0, 150.0, 2)
+    assert (top["offer_price"], top["offer_size"], top["offer_orders"]) == (
+        11.0,
+        20.0,
+        1,
+    )
+    # Order 1 is amended and deleted in one batch, order 3 is deleted.
+    book.add(
+        orders(
+            [
+                (at(0, 5), 5, "M", 1, 7, "B", 10.0, 70.0),
+                (at(0, 5), 6, "D", 1, 7, "B", 10.0, 70.0),
+                (at(0, 6), 7, "D", 3, 7, "S", 11.0, 20.0),
+            ]
+        )
+    )
+    (top,) = book.flush(schema).to_pylist()
+    assert (top["bid_price"], top["bid_size"], top["bid_orders"]) == (10.0, 50.0, 1)
+    assert top["offer_price"] is None
+    assert book.orders == 2
+    # An order behind the best bid leaves the top as it was.
+    book.add(orders([(at(0, 7), 8, "A", 5, 7, "B", 8.0, 10.0)]))
+    assert book.flush(schema) is None
+
+
+def test_derived_tables_are_only_synced_by_name(dmd_server):
+    lseg = new_plugin(dmd_server)
+    tables = lseg.get_tables(plugin.TableOptions(tables=["*"], skip_tables=[]))
+    assert sorted(table.name for table in tables) == sorted(RAW_TABLES)
+    named = lseg.get_tables(
+        plugin.TableOptions(tables=["xlon_*", "trqx_vwap"], skip_tables=[])
+    )
+    assert sorted(table.name for table in named) == [
+        "trqx_vwap",
+        "xlon_post_delayed",
+        "xlon_pre_trade",
+    ]
+
+
+def test_derived_tables_sync_alongside_their_sources(dmd_server):
+    derived = list(DERIVED)
+    rows = sync_rows(new_plugin(dmd_server), RAW_TABLES + derived)
+    assert all(rows[table] == MINUTES * dmd_server.rows for table in RAW_TABLES)
+    # A row per changed key and flush, never more than the source rows.
+    assert all(0 < rows[table] <= MINUTES * dmd_server.rows for table in derived)
+    # The derived tables read the files their sources downloaded.
+    assert dmd_server.requests["download"] == MINUTES * len(RAW_TABLES)
+
+
+def test_derived_table_syncs_without_its_source(dmd_server):
+    rows = sync_rows(new_plugin(dmd_server), ["xlon_minute_bars"])
+    assert set(rows) == {"xlon_minute_bars"}
+    assert dmd_server.requests["download"] == MINUTES
+
+
+def test_derived_table_added_later_leaves_nothing_in_the_fanout(dmd_server, tmp_path):
+    spec = {"state_file": str(tmp_path / "state.json")}
+    sync_rows(new_plugin(dmd_server, **spec), ["xlon_post_delayed"])
+    dmd_server.requests.clear()
+    lseg = new_plugin(dmd_server, **spec)
+    rows = sync_rows(lseg, ["xlon_post_delayed", "xlon_minute_bars"])
+    assert set(rows) == {"xlon_minute_bars"}
+    # Only the derived table walks the day, nobody waits for its source.
+    assert dmd_server.downloads == MINUTES
+    assert not lseg._client.client._fanout._entries
+
+
+def vwaps(lseg, tables) -> dict:
+    # The latest VWAP emitted per instrument.
+    latest = {}
+    for message in lseg.sync(plugin.SyncOptions(tables=tables, skip_tables=[])):
+        if isinstance(message, SyncInsertMessage):
+            if message.record.schema.metadata[b"cq:table_name"] == b"trqx_vwap":
+                for row in message.record.to_pylist():
+                    latest[row["instrument_id"]] = row["vwap"]
+    return latest
+
+
+def test_derived_tables_resume_from_their_checkpoint(dmd_server, tmp_path):
+    tables = ["trqx_post_trade", "trqx_vwap"]
+    spec = {"state_file": str(tmp_path / "state.json")}
+    dmd_server.minutes = MINUTES - 5
+    vwaps(new_plugin(dmd_server, **spec), tables)
+    dmd_server.minutes = MINUTES
+    dmd_server.requests.clear()
+    resumed = vwaps(new_plugin(dmd_server, **spec), tables)
+    # Both tables picked up where they stopped and shared the new minutes.
+    assert dmd_server.downloads == 5
+    # And the figures cover the whole day, as a sync from scratch has them.
+    full = vwaps(new_plugin(dmd_server), ["trqx_vwap"])
+    assert resumed
+    assert resumed == pytest.approx({key: full[key] for key in resumed})
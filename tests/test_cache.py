@@ -0,0 +1,82 @@
+import io
+import os
+import time
+
+from plugin.lseg.cache import EVICTION_LOW_WATERMARK, CacheEntry, FileCache
+from tests.harness import MINUTES, new_plugin, sync_rows
+
+TABLE = "xlon_post_delayed"
+
+
+def entry_sizes(directory: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(directory, name))
+        for name in os.listdir(directory)
+        if name.endswith(".csv.gz")
+    )
+
+
+def test_entries_round_trip_with_their_metadata(tmp_path):
+    cache = FileCache(str(tmp_path), max_bytes=1 << 20, max_age_seconds=3600)
+    entry = CacheEntry(b"a;b\n1;2\n", '"v1"', "Tue, 20 Feb 2024 08:01:00 GMT", True)
+    cache.put("download/a.csv", entry)
+    assert cache.get("download/a.csv") == entry
+    assert cache.get("download/b.csv") is None
+    # A new cache over the same directory picks the entry up.
+    reopened = FileCache(str(tmp_path), max_bytes=1 << 20, max_age_seconds=3600)
+    assert reopened.get("download/a.csv") == entry
+    assert reopened._size == entry_sizes(str(tmp_path))
+
+
+def test_expired_entries_are_dropped(tmp_path):
+    cache = FileCache(str(tmp_path), max_bytes=1 << 20, max_age_seconds=60)
+    cache.put("download/a.csv", CacheEntry(b"a;b\n", closed=True))
+    old = time.time() - 120
+    for name in os.listdir(tmp_path):
+        os.utime(tmp_path / name, (old, old))
+    assert cache.get("download/a.csv") is None
+    assert entry_sizes(str(tmp_path)) == 0
+
+
+def test_eviction_trims_to_the_low_watermark(tmp_path):
+    # Random bytes don't compress, every entry takes a little over 1 KiB.
+    cache = FileCache(str(tmp_path), max_bytes=10 * 1024, max_age_seconds=3600)
+    for i in range(10):
+        cache.put(f"download/{i}.csv", CacheEntry(os.urandom(1024)))
+        # Written one second apart, oldest first.
+        stamp = time.time() - 100 + i
+        key = cache._key(f"download/{i}.csv") + ".csv.gz"
+        os.utime(key, (stamp, stamp))
+    size = entry_sizes(str(tmp_path))
+    assert size == cache._size
+    assert size <= 10 * 1024 * EVICTION_LOW_WATERMARK
+    kept = [i for i in range(10) if cache.get(f"download/{i}.csv") is not None]
+    # The least recently written went first.
+    assert kept == list(range(10 - len(kept), 10))
+    assert 0 < len(kept) < 10
+
+
+def test_streamed_entries_are_committed_at_the_end_only(tmp_path):
+    cache = FileCache(str(tmp_path), max_bytes=1 << 20, max_age_seconds=3600)
+    content = b"a;b\n" * 1000
+    partial = cache.reader("download/a.csv", io.BytesIO(content), CacheEntry(b""))
+    partial.read(100)
+    partial.close()
+    assert cache.get("download/a.csv") is None
+    assert os.listdir(tmp_path) == []
+    full = cache.reader("download/a.csv", io.BytesIO(content), CacheEntry(b"", '"v1"'))
+    assert full.read() == content
+    full.close()
+    assert cache.get("download/a.csv") == CacheEntry(content, '"v1"')
+
+
+def test_open_minutes_are_revalidated(dmd_server, tmp_path):
+    # With an overlap longer than the time since the sync day no minute is
+    # closed, every cached one is sent with its ETag.
+    spec = {"cache_dir": str(tmp_path), "overlap_minutes": 10_000_000}
+    for _ in range(2):
+        rows = sync_rows(new_plugin(dmd_server, **spec), [TABLE])
+        assert rows[TABLE] == MINUTES * dmd_server.rows
+    # The second sync asked again and got a 304 for every minute.
+    assert dmd_server.downloads == 2 * MINUTES
+    assert dmd_server.requests["not_modified"] == MINUTES
@@ -0,0 +1,83 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pyarrow as pa
+
+from plugin.metrics import Metrics
+from plugin.tables import TABLE_MAPPINGS
+from plugin.tables.dedup import (
+    KeyIndex,
+    key_hashes,
+    keyed_rows,
+    load_index,
+    save_index,
+)
+from plugin.tables.resolver import MappedTable
+
+
+def test_key_index_drops_seen_keys():
+    index = KeyIndex()
+    assert index.new_rows(np.array([3, 1, 3, 2], dtype=np.uint64)).tolist() == [
+        True,
+        True,
+        False,
+        True,
+    ]
+    # Enough batches to merge runs a few times.
+    for start in range(0, 1000, 10):
+        index.new_rows(np.arange(start, start + 10, dtype=np.uint64))
+    assert len(index) == 1000
+    assert not index.new_rows(np.arange(1000, dtype=np.uint64)).any()
+    assert index.new_rows(np.array([1000], dtype=np.uint64)).all()
+
+
+def test_key_hashes_cover_every_key_column():
+    batch = pa.RecordBatch.from_pydict(
+        {
+            "timestamp": pa.array([1, 1, 2], pa.timestamp("us", "UTC")),
+            "rec_no": pa.array([0, 1, 0], pa.uint64()),
+        }
+    )
+    assert len(set(key_hashes(batch, ["timestamp", "rec_no"]).tolist())) == 3
+    assert len(set(key_hashes(batch, ["timestamp"]).tolist())) == 2
+
+
+def test_rows_with_null_keys_are_not_keyed():
+    batch = pa.RecordBatch.from_pydict(
+        {
+            "timestamp": pa.array([1, None, 2, 3], pa.timestamp("us", "UTC")),
+            "rec_no": pa.array([0, 0, None, 0], pa.uint64()),
+        }
+    )
+    assert keyed_rows(batch, ["timestamp", "rec_no"]).tolist() == [
+        True,
+        False,
+        False,
+        True,
+    ]
+    assert keyed_rows(batch.slice(3), ["timestamp", "rec_no"]) is None
+
+
+def test_saved_index_keeps_the_latest_day_only(tmp_path):
+    index = KeyIndex(np.array([1, 2], dtype=np.uint64))
+    save_index(str(tmp_path), "table", "2024-02-20", index)
+    save_index(str(tmp_path), "table", "2024-02-21", index)
+    assert len(load_index(str(tmp_path), "table", "2024-02-20")) == 0
+    assert len(load_index(str(tmp_path), "table", "2024-02-21")) == 2
+
+
+def test_rows_without_a_key_are_always_emitted():
+    table = MappedTable(
+        next(m for m in TABLE_MAPPINGS if m.name == "xlon_post_delayed")
+    )
+    resolver = table.resolver
+    client = SimpleNamespace(metrics=Metrics())
+    index = KeyIndex()
+    batch = pa.RecordBatch.from_pydict(
+        {"transaction_id": pa.array([1, None, None, 1, 0], pa.uint64())}
+    )
+    kept = resolver._dedup(client, index, batch)
+    # Null ids don't collide with each other, or with id 0.
+    assert kept.column(0).to_pylist() == [1, None, None, 0]
+    assert len(index) == 2
+    assert resolver._dedup(client, index, batch).column(0).to_pylist() == [None, None]
@@ -0,0 +1,67 @@
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from plugin.lseg.feeds import FanOut
+
+
+class Fetcher:
+    def __init__(self) -> None:
+        self.calls = Counter()
+
+    def __call__(self, path: str):
+        def fetch() -> bytes:
+            self.calls[path] += 1
+            return path.encode()
+
+        return fetch
+
+
+def test_subscribers_share_one_download():
+    fanout = FanOut(8)
+    release = threading.Event()
+    calls = []
+
+    def fetch() -> bytes:
+        calls.append(1)
+        release.wait(5)
+        return b"minute"
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        results = [executor.submit(fanout.get, "a.csv", 3, fetch) for _ in range(3)]
+        release.set()
+        assert [result.result(5) for result in results] == [b"minute"] * 3
+    assert len(calls) == 1
+    # Dropped once the last subscriber has read it.
+    assert not fanout._entries
+
+
+def test_lagging_subscribers_download_evicted_files_again():
+    fanout = FanOut(2)
+    fetcher = Fetcher()
+    for path in ("a.csv", "b.csv", "c.csv"):
+        assert fanout.get(path, 2, fetcher(path)) == path.encode()
+    # Only the two most recent files wait for their second subscriber.
+    assert list(fanout._entries) == ["b.csv", "c.csv"]
+    for path in ("c.csv", "b.csv", "a.csv"):
+        assert fanout.get(path, 2, fetcher(path)) == path.encode()
+    assert fetcher.calls == Counter({"a.csv": 2, "b.csv": 1, "c.csv": 1})
+
+
+def test_download_errors_reach_every_subscriber():
+    fanout = FanOut(8)
+    calls = []
+
+    def fetch() -> bytes:
+        calls.append(1)
+        raise ConnectionError("dropped")
+
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            fanout.get("a.csv", 2, fetch)
+    assert len(calls) == 1
+    assert not fanout._entries
+    # A later sync downloads the file afresh.
+    assert fanout.get("a.csv", 1, lambda: b"minute") == b"minute"
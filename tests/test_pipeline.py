@@ -0,0 +1,144 @@
+import io
+import threading
+import time
+
+import pytest
+from cloudquery.sdk import plugin
+from cloudquery.sdk.message import SyncInsertMessage
+
+from plugin.tables.pipeline import FairShare, ReadAhead, Stage
+from tests.harness import MINUTES, new_plugin
+
+
+def wait_for(condition, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_fair_share_serves_tables_round_robin():
+    share = FairShare(1)
+    share.acquire("holder")
+    turns = []
+
+    def decode(table):
+        with share.turn(table):
+            turns.append(table)
+
+    # A heavy table queues three blocks before the others queue one each.
+    threads = []
+    for table in ["xlon", "xlon", "xlon", "trqx", "echo"]:
+        thread = threading.Thread(target=decode, args=(table,))
+        thread.start()
+        threads.append(thread)
+        wait_for(lambda: share.waiting() == len(threads))
+    share.release()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert turns == ["xlon", "trqx", "echo", "xlon", "xlon"]
+    assert share.waiting() == 0
+
+
+class Trickle(io.RawIOBase):
+    # A body that arrives ten bytes per read.
+    def __init__(self, content: bytes) -> None:
+        self._content = io.BytesIO(content)
+        self.reads = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        self.reads += 1
+        return self._content.readinto(memoryview(buffer)[:10])
+
+
+def test_read_ahead_buffers_a_block_before_it_is_read():
+    content = b"a;b\n1;2\n" * 20
+    body = Trickle(content)
+    ahead = ReadAhead(body, 64)
+    ahead.fill()
+    assert body.reads == 7
+    # The filled block is read without touching the body.
+    assert ahead.read(64) == content[:64]
+    assert body.reads == 7
+    assert ahead.read() == content[64:]
+
+
+def test_stage_runs_ahead_only_as_far_as_its_queue():
+    produced = []
+
+    def source():
+        for item in range(10):
+            produced.append(item)
+            yield item
+
+    items = iter(Stage(source(), 2, name="test"))
+    assert next(items) == 0
+    # One item handed out, two queued and one blocked on the full queue.
+    wait_for(lambda: len(produced) == 4)
+    time.sleep(0.1)
+    assert len(produced) == 4
+    assert list(items) == list(range(1, 10))
+
+
+def test_stage_raises_producer_errors_and_closes_its_source():
+    closed = threading.Event()
+
+    def source():
+        try:
+            yield 1
+            raise ValueError("bad minute file")
+        finally:
+            closed.set()
+
+    items = iter(Stage(source(), 1, name="test"))
+    assert next(items) == 1
+    with pytest.raises(ValueError):
+        next(items)
+    assert closed.wait(timeout=10)
+
+
+def test_closed_stage_stops_its_producer():
+    closed = threading.Event()
+
+    def source():
+        try:
+            while True:
+                yield 1
+        finally:
+            closed.set()
+
+    items = iter(Stage(source(), 1, name="test"))
+    assert next(items) == 1
+    items.close()
+    assert closed.wait(timeout=10)
+
+
+def test_slow_destination_holds_back_decoding(dmd_server):
+    lseg = new_plugin(
+        dmd_server, concurrency=1, queue_size=2, batch_rows=dmd_server.rows
+    )
+    metrics = lseg._client.metrics
+    messages = lseg.sync(
+        plugin.SyncOptions(tables=["xlon_post_delayed"], skip_tables=[])
+    )
+    rows = 0
+    for message in messages:
+        if isinstance(message, SyncInsertMessage):
+            rows += message.record.num_rows
+            break
+    # The destination stops reading: the scheduler, decode and prefetch
+    # queues fill up and decoding stops well short of the day.
+    time.sleep(1.0)
+    decoded = metrics.counter_value("lseg_rows_decoded", table="xlon_post_delayed")
+    time.sleep(0.5)
+    assert (
+        metrics.counter_value("lseg_rows_decoded", table="xlon_post_delayed") == decoded
+    )
+    assert decoded < MINUTES * dmd_server.rows / 2
+    for message in messages:
+        if isinstance(message, SyncInsertMessage):
+            rows += message.record.num_rows
+    assert rows == MINUTES * dmd_server.rows
@@ -0,0 +1,61 @@
+import pytest
+
+from tests.harness import MINUTES, new_plugin, sync_rows
+
+TABLE = "xlon_post_delayed"
+FEED = "LSE-Post-Trade"
+
+
+def retried(lseg) -> float:
+    return lseg._client.metrics.counter_value("lseg_http_retries", feed=FEED)
+
+
+def test_transient_server_errors_are_retried(dmd_server):
+    dmd_server.errors = 3
+    lseg = new_plugin(dmd_server, backoff_base_seconds=0.01)
+    rows = sync_rows(lseg, [TABLE])
+    assert rows[TABLE] == MINUTES * dmd_server.rows
+    assert dmd_server.requests["failed"] == 3
+    assert retried(lseg) == 3
+
+
+def test_dropped_connections_are_retried(dmd_server):
+    dmd_server.drops = 2
+    lseg = new_plugin(dmd_server, backoff_base_seconds=0.01)
+    rows = sync_rows(lseg, [TABLE])
+    assert rows[TABLE] == MINUTES * dmd_server.rows
+    assert dmd_server.requests["dropped"] == 2
+    assert retried(lseg) == 2
+
+
+def test_expired_session_logs_in_once_more(dmd_server):
+    dmd_server.expire_after = MINUTES // 2
+    lseg = new_plugin(dmd_server)
+    rows = sync_rows(lseg, [TABLE])
+    assert rows[TABLE] == MINUTES * dmd_server.rows
+    # Every request in flight saw the expiry, only one of them logged in.
+    assert dmd_server.requests["signed_in"] == 2
+    assert retried(lseg) == 0
+
+
+@pytest.mark.parametrize("fault", ["login_errors", "login_drops"])
+def test_failed_login_page_is_retried(dmd_server, fault):
+    setattr(dmd_server, fault, 1)
+    lseg = new_plugin(dmd_server, backoff_base_seconds=0.01)
+    rows = sync_rows(lseg, [TABLE])
+    assert rows[TABLE] == MINUTES * dmd_server.rows
+    assert dmd_server.requests["signed_in"] == 1
+    assert retried(lseg) == 1
+
+
+@pytest.mark.parametrize("status", [401, 403])
+def test_listing_refused_to_an_expired_session_logs_in_again(dmd_server, status):
+    # The session ends before its first request, the directory listing.
+    dmd_server.expire_after = 0
+    dmd_server.expired_status = status
+    lseg = new_plugin(dmd_server)
+    rows = sync_rows(lseg, [TABLE])
+    assert rows[TABLE] == MINUTES * dmd_server.rows
+    assert dmd_server.requests["signed_in"] == 2
+    # The minutes came from the listing, none was probed.
+    assert dmd_server.requests["head"] == 0
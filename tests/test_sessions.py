@@ -0,0 +1,70 @@
+from datetime import date, datetime
+
+import pytest
+
+from plugin.lseg.sessions import AMSTERDAM, LONDON, easter_sunday, uk_holidays
+from tests.dmd_server import DMDServer
+from tests.harness import new_plugin, sync_rows
+
+LONDON_TABLES = {
+    "echo_post_trade",
+    "trqx_post_trade",
+    "trqx_pre_trade",
+    "xlon_post_delayed",
+    "xlon_pre_trade",
+}
+AMSTERDAM_TABLES = {"eceu_post_trade", "tqex_post_trade", "tqex_pre_trade"}
+
+
+@pytest.mark.parametrize(
+    "year, easter", [(2019, date(2019, 4, 21)), (2024, date(2024, 3, 31))]
+)
+def test_easter_sunday(year, easter):
+    assert easter_sunday(year) == easter
+
+
+def test_uk_holidays_move_off_weekends():
+    # Christmas 2021 fell on a Saturday, New Year's Day 2022 too.
+    assert {date(2021, 12, 27), date(2021, 12, 28)} <= uk_holidays(2021)
+    assert date(2022, 1, 3) in uk_holidays(2022)
+
+
+def test_sessions():
+    assert LONDON.session(date(2024, 2, 20)) == (
+        datetime(2024, 2, 20, 8, 0),
+        datetime(2024, 2, 20, 16, 30),
+    )
+    assert AMSTERDAM.session(date(2024, 2, 20)) == (
+        datetime(2024, 2, 20, 9, 0),
+        datetime(2024, 2, 20, 17, 30),
+    )
+    # Half day on the Friday before a Christmas Eve on a Saturday.
+    assert LONDON.session(date(2022, 12, 23))[1] == datetime(2022, 12, 23, 12, 30)
+    assert LONDON.session(date(2024, 5, 1)) is not None
+    assert AMSTERDAM.session(date(2024, 5, 1)) is None
+    assert LONDON.session(date(2024, 2, 20), [date(2024, 2, 20)]) is None
+
+
+@pytest.mark.parametrize(
+    "day, minutes",
+    [
+        # Labour Day, only London trades.
+        (date(2024, 5, 1), {"london": 511, "amsterdam": 0}),
+        (date(2024, 12, 24), {"london": 271, "amsterdam": 306}),
+    ],
+)
+def test_blind_walk_follows_venue_sessions(day, minutes):
+    with DMDServer(days=[day], rows=10) as server:
+        lseg = new_plugin(
+            server,
+            discovery="none",
+            start_date=day.isoformat(),
+            end_date=day.isoformat(),
+        )
+        rows = sync_rows(lseg)
+    for table in LONDON_TABLES:
+        assert rows[table] == minutes["london"] * server.rows
+    for table in AMSTERDAM_TABLES:
+        assert rows[table] == minutes["amsterdam"] * server.rows
+    # Every request was for a minute the fixture publishes.
+    assert server.requests["not_found"] == 0
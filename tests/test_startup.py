@@ -0,0 +1,38 @@
+import pytest
+from cloudquery.sdk import plugin
+
+from plugin.lseg.client import csrf_token
+from tests.harness import new_plugin, sync_rows
+
+
+def test_init_and_get_tables_stay_offline(dmd_server):
+    lseg = new_plugin(dmd_server)
+    tables = lseg.get_tables(plugin.TableOptions(tables=["*"], skip_tables=[]))
+    assert len(tables) == 8
+    assert dmd_server.requests == {}
+    sync_rows(lseg)
+    assert dmd_server.requests["login"] == 1
+
+
+@pytest.mark.parametrize(
+    "page, token",
+    [
+        (
+            "<form><input type='text' name='username'/>"
+            "<input type='hidden' name='_csrf' value='a&amp;b'/></form>",
+            "a&b",
+        ),
+        (
+            '<input type=hidden name=other value=x><INPUT TYPE="HIDDEN" NAME="_csrf" VALUE="y">',
+            "y",
+        ),
+        ('<input type="hidden" value="z">', "z"),
+    ],
+)
+def test_csrf_token(page, token):
+    assert csrf_token(page) == token
+
+
+def test_csrf_token_missing():
+    with pytest.raises(Exception, match="no CSRF token"):
+        csrf_token("<form><input type='text' name='username'/></form>")
@@ -0,0 +1,281 @@
+import os
+import threading
+from datetime import date, time, timedelta
+from typing import Optional
+
+import pytest
+
+from plugin.lseg.discovery import PROBE_MARGIN
+from plugin.lseg.sessions import LONDON
+from tests.dmd_server import INSTRUMENTS, DMDServer, isin
+from tests.harness import MINUTES, SYNC_DAY, new_plugin, sync_batches, sync_rows
+
+TABLES = 8
+
+
+def resident_bytes() -> Optional[int]:
+    # None where there is no /proc.
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return None
+
+
+class PeakRSS:
+    """The highest resident set seen while a block runs, sampled every few
+    milliseconds. ru_maxrss would be the whole process's, earlier tests
+    included."""
+
+    def __init__(self, interval: float = 0.005) -> None:
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self.baseline = self.peak = resident_bytes()
+
+    def __enter__(self) -> "PeakRSS":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def _sample(self) -> None:
+        while self.peak is not None and not self._stopped.wait(self._interval):
+            self.peak = max(self.peak, resident_bytes())
+
+
+def run_benchmark(benchmark, server, **spec):
+    plugins = []
+
+    def setup():
+        plugins.append(new_plugin(server, **spec))
+        return (plugins[-1],), {}
+
+    with PeakRSS() as rss:
+        rows = benchmark.pedantic(sync_rows, setup=setup, rounds=3, iterations=1)
+    total = sum(rows.values())
+    assert len(rows) == TABLES
+    assert total == TABLES * MINUTES * server.rows
+
+    # Stage timings accumulate over every round, like the benchmark stats.
+    stages = {
+        "network_seconds": 0.0,
+        "parse_seconds": 0.0,
+        "backpressure_seconds": 0.0,
+        "emit_seconds": 0.0,
+    }
+    for lseg in plugins:
+        for summary in lseg._client.metrics.table_summaries().values():
+            for stage in stages:
+                stages[stage] += summary.get(stage, 0.0)
+    benchmark.extra_info["rows"] = total
+    # No stats when run with --benchmark-disable.
+    if benchmark.stats is not None:
+        benchmark.extra_info["rows_per_second"] = round(total / benchmark.stats["mean"])
+    if rss.peak is not None:
+        # Growth is what the syncs added to what the process held before.
+        benchmark.extra_info["peak_rss_mb"] = round(rss.peak / (1 << 20), 1)
+        benchmark.extra_info["rss_growth_mb"] = round(
+            (rss.peak - rss.baseline) / (1 << 20), 1
+        )
+    benchmark.extra_info.update(
+        {stage: round(seconds / len(plugins), 3) for stage, seconds in stages.items()}
+    )
+    for lseg in plugins:
+        lseg.close()
+
+
+def test_sync_emits_every_table(dmd_server):
+    rows = sync_rows(new_plugin(dmd_server))
+    assert len(rows) == TABLES
+    assert all(count == MINUTES * dmd_server.rows for count in rows.values())
+
+
+@pytest.mark.parametrize("listing", [True, False], ids=["listing", "probe"])
+def test_discovery_fetches_published_files_only(dmd_server, listing):
+    dmd_server.listing = listing
+    dmd_server.extra_minutes = {time(7, 50), time(17, 40)}
+    rows = sync_rows(new_plugin(dmd_server))
+    # Probes reach PROBE_MARGIN either side of the session, London feeds find
+    # the 07:50 file and Amsterdam ones the 17:40 file.
+    extra = 2 if listing else 1
+    assert len(rows) == TABLES
+    assert all(count == (MINUTES + extra) * dmd_server.rows for count in rows.values())
+    assert dmd_server.downloads == TABLES * (MINUTES + extra)
+    if listing:
+        assert dmd_server.requests["not_found"] == 0
+    else:
+        # Each venue's session is 511 minutes long, the rest of the day is
+        # never probed.
+        probed = 511 + 2 * PROBE_MARGIN // timedelta(minutes=1)
+        probes = dmd_server.requests["head"] + dmd_server.requests["not_found"]
+        assert probes == TABLES * probed
+
+
+@pytest.mark.parametrize("discovery", ["auto", "listing"])
+def test_days_missing_from_the_listing_are_synced(discovery):
+    days = [date(2024, 2, 19), SYNC_DAY]
+    with DMDServer(days=days, minutes=MINUTES, unlisted_days=days[:1]) as server:
+        lseg = new_plugin(server, discovery=discovery, start_date=days[0].isoformat())
+        rows = sync_rows(lseg, ["xlon_post_delayed"])
+    assert rows["xlon_post_delayed"] == 2 * MINUTES * server.rows
+
+
+def test_blind_walk_misses_off_hours_files(dmd_server):
+    dmd_server.extra_minutes = {time(7, 50), time(17, 40)}
+    rows = sync_rows(new_plugin(dmd_server, discovery="none"))
+    assert len(rows) == TABLES
+    assert all(count == MINUTES * dmd_server.rows for count in rows.values())
+    assert dmd_server.requests["listing"] == 0
+
+
+@pytest.mark.parametrize("rows", [100, 1000])
+@pytest.mark.parametrize("stream", [False, True], ids=["buffered", "stream"])
+def test_sync_throughput(benchmark, dmd_server, rows, stream):
+    dmd_server.rows = rows
+    run_benchmark(benchmark, dmd_server, stream=stream)
+
+
+def test_sync_throughput_gzip(benchmark, dmd_server):
+    dmd_server.rows = 1000
+    dmd_server.gzip = True
+    run_benchmark(benchmark, dmd_server)
+
+
+@pytest.mark.parametrize("prefetch_window", [1, 8])
+def test_sync_throughput_with_latency(benchmark, dmd_server, prefetch_window):
+    dmd_server.latency = 0.02
+    run_benchmark(benchmark, dmd_server, prefetch_window=prefetch_window)
+
+
+@pytest.mark.parametrize("discovery", ["listing", "none"])
+def test_sync_throughput_by_discovery(benchmark, dmd_server, discovery):
+    dmd_server.listing = discovery == "listing"
+    run_benchmark(benchmark, dmd_server, discovery=discovery)
+
+
+@pytest.mark.parametrize("archives", [False, True], ids=["minute_files", "archives"])
+def test_sync_throughput_by_transfer(benchmark, dmd_server, archives):
+    # Per-request overhead is what a day archive saves.
+    dmd_server.latency = 0.02
+    dmd_server.archives = archives
+    run_benchmark(benchmark, dmd_server, bulk=archives)
+
+
+def test_day_archives_replace_minute_downloads(dmd_server):
+    dmd_server.archives = True
+    dmd_server.extra_minutes = {time(7, 50), time(17, 40)}
+    rows = sync_rows(new_plugin(dmd_server, bulk=True))
+    assert len(rows) == TABLES
+    assert all(count == (MINUTES + 2) * dmd_server.rows for count in rows.values())
+    assert dmd_server.downloads == 0
+    # Tables reading the same feed share its archive.
+    assert 0 < dmd_server.requests["archive"] <= TABLES
+
+
+def test_archives_are_off_by_default(dmd_server):
+    dmd_server.archives = True
+    sync_rows(new_plugin(dmd_server), ["xlon_post_delayed"])
+    assert dmd_server.requests["archive"] == 0
+    assert dmd_server.downloads == MINUTES
+
+
+def test_archive_pages_fall_back_to_minute_files(dmd_server):
+    # A portal page served with a 200 where the archive should be.
+    dmd_server.archive_pages = True
+    rows = sync_rows(new_plugin(dmd_server, bulk=True), ["xlon_post_delayed"])
+    assert rows["xlon_post_delayed"] == MINUTES * dmd_server.rows
+    assert dmd_server.requests["archive"] == 1
+    assert dmd_server.downloads == MINUTES
+
+
+def test_cached_archives_are_read_without_a_request(dmd_server, tmp_path):
+    dmd_server.archives = True
+    spec = {"bulk": True, "cache_dir": str(tmp_path)}
+    for _ in range(2):
+        rows = sync_rows(new_plugin(dmd_server, **spec), ["xlon_post_delayed"])
+        assert rows["xlon_post_delayed"] == MINUTES * dmd_server.rows
+    assert dmd_server.requests["archive"] == 1
+    assert dmd_server.downloads == 0
+
+
+def test_resume_skips_archived_day(dmd_server, tmp_path):
+    dmd_server.archives = True
+    spec = {"state_file": str(tmp_path / "state.json"), "bulk": True}
+    assert sum(sync_rows(new_plugin(dmd_server, **spec)).values()) > 0
+    archives = dmd_server.requests["archive"]
+    assert sync_rows(new_plugin(dmd_server, **spec)) == {}
+    assert dmd_server.requests["archive"] == archives
+    # Rows emitted from an archive have no minute files left to fetch.
+    assert dmd_server.downloads == 0
+
+
+def test_decode_pool_emits_every_table(dmd_server):
+    lseg = new_plugin(dmd_server, decode_workers=2)
+    try:
+        rows = sync_rows(lseg)
+    finally:
+        lseg.close()
+    assert len(rows) == TABLES
+    assert all(count == MINUTES * dmd_server.rows for count in rows.values())
+
+
+@pytest.mark.parametrize("decode_workers", [0, 2])
+def test_sync_throughput_by_decode_workers(benchmark, dmd_server, decode_workers):
+    dmd_server.rows = 1000
+    run_benchmark(benchmark, dmd_server, decode_workers=decode_workers)
+
+
+def test_small_minute_files_are_coalesced(dmd_server):
+    lseg = new_plugin(dmd_server, batch_rows=1000, batch_max_latency_seconds=60)
+    batches = sync_batches(lseg)
+    assert len(batches) == TABLES
+    # 30 minute files of 100 rows each.
+    assert all(rows == [1000, 1000, 1000] for rows in batches.values())
+
+
+def test_resume_after_batched_sync(dmd_server, tmp_path):
+    spec = {"state_file": str(tmp_path / "state.json"), "batch_rows": 1000}
+    assert sum(sync_rows(new_plugin(dmd_server, **spec)).values()) > 0
+    assert sync_rows(new_plugin(dmd_server, **spec)) == {}
+
+
+def test_overlapping_resume_emits_no_duplicates(dmd_server, tmp_path):
+    now = LONDON.now()
+    if now.hour == 0 and now.minute < 45:
+        pytest.skip("the fixture session would start on the previous day")
+    # Today's files, so the second sync re-fetches the last overlap_minutes.
+    dmd_server.days = {now.date()}
+    dmd_server.session_start = (now - timedelta(minutes=40)).time()
+    spec = {
+        "state_file": str(tmp_path / "state.json"),
+        "start_date": None,
+        "end_date": None,
+        "overlap_minutes": 5,
+    }
+    assert sum(sync_rows(new_plugin(dmd_server, **spec)).values()) > 0
+    downloads = dmd_server.downloads
+    assert sync_rows(new_plugin(dmd_server, **spec)) == {}
+    assert dmd_server.downloads == downloads + TABLES * 5
+
+
+def test_instrument_filters_select_rows(dmd_server):
+    isins = [isin(instrument) for instrument in range(20)]
+    by_isin = sync_rows(new_plugin(dmd_server, instruments={"isins": isins}))
+    assert len(by_isin) == TABLES
+    assert sum(by_isin.values()) < TABLES * MINUTES * dmd_server.rows / 5
+    by_id = new_plugin(dmd_server, instruments={"instrument_ids": [[0, 19]]})
+    assert sync_rows(by_id) == by_isin
+    in_pool = new_plugin(dmd_server, instruments={"isins": isins}, decode_workers=1)
+    assert sync_rows(in_pool) == by_isin
+    in_pool.close()
+    # Quotes carry no currency, the filter doesn't apply to them.
+    by_currency = sync_rows(new_plugin(dmd_server, instruments={"currencies": ["EUR"]}))
+    assert by_currency.pop("tqex_pre_trade") == MINUTES * dmd_server.rows
+    euro_isins = [isin(instrument) for instrument in range(0, INSTRUMENTS, 4)]
+    by_euro_isin = sync_rows(new_plugin(dmd_server, instruments={"isins": euro_isins}))
+    del by_euro_isin["tqex_pre_trade"]
+    assert len(by_currency) == TABLES - 1
+    assert by_currency == by_euro_isin
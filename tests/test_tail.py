@@ -0,0 +1,89 @@
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+from cloudquery.sdk import plugin
+from cloudquery.sdk.message import SyncInsertMessage
+
+from plugin.lseg.client import LSEGClient
+from plugin.lseg.sessions import LONDON, SessionCalendar
+from tests.dmd_server import DMDServer
+from tests.harness import new_plugin
+
+# The tables of London venues, whose files the fixture publishes up to now.
+TABLES = [
+    "echo_post_trade",
+    "trqx_post_trade",
+    "trqx_pre_trade",
+    "xlon_post_delayed",
+    "xlon_pre_trade",
+]
+
+
+def wait_for(condition, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+# Fewer slots than tables: tailing tables mustn't wait for one.
+@pytest.mark.parametrize("concurrency", [10, 2])
+def test_tail_emits_new_minute_files_only(monkeypatch, concurrency):
+    now = LONDON.now().replace(second=0, microsecond=0)
+    if now.hour == 0 and now.minute < 15:
+        pytest.skip("the fixture session would start on the previous day")
+    # Tailing only runs on trading days, today has to be one whatever it is.
+    monkeypatch.setattr(
+        SessionCalendar, "is_trading_day", lambda self, day, extra_holidays=(): True
+    )
+    # Published up to two minutes ago; the last minute is already overdue.
+    with DMDServer(
+        days=[now.date()], session_start=(now - timedelta(minutes=10)).time(), minutes=8
+    ) as server:
+        lseg = new_plugin(
+            server,
+            start_date=None,
+            end_date=None,
+            tail=True,
+            publication_delay_seconds=0,
+            poll_interval_seconds=0.05,
+            concurrency=concurrency,
+        )
+        rows = Counter()
+
+        def sync():
+            for message in lseg.sync(plugin.SyncOptions(tables=TABLES, skip_tables=[])):
+                if isinstance(message, SyncInsertMessage):
+                    table = message.record.schema.metadata[b"cq:table_name"].decode()
+                    rows[table] += message.record.num_rows
+
+        thread = threading.Thread(target=sync)
+        thread.start()
+        try:
+            wait_for(
+                lambda: len(rows) == len(TABLES)
+                and all(count == 8 * server.rows for count in rows.values())
+            )
+            downloads = server.downloads
+            server.minutes = 9
+            wait_for(lambda: all(count == 9 * server.rows for count in rows.values()))
+        finally:
+            lseg.close()
+            thread.join(timeout=30)
+        assert not thread.is_alive()
+        assert all(count == 9 * server.rows for count in rows.values())
+        # Only the new minute was downloaded, polls found unchanged listings.
+        assert server.downloads == downloads + len(TABLES)
+        assert server.requests["not_modified"] > 0
+
+
+def test_minutes_close_after_publication_and_overlap(monkeypatch):
+    now = datetime(2024, 2, 20, 12, 0)
+    monkeypatch.setattr(SessionCalendar, "now", lambda self: now)
+    client = LSEGClient("user", "password", overlap_minutes=2, publication_delay=60)
+    # 11:57 is due at 11:59 and may still be republished until 12:01.
+    assert not client.is_closed("LSE-Post-Trade", datetime(2024, 2, 20, 11, 57))
+    assert client.is_closed("LSE-Post-Trade", datetime(2024, 2, 20, 11, 56))
@@ -0,0 +1,114 @@
+import time
+
+import pytest
+from requests import Response
+from requests.exceptions import HTTPError
+
+from plugin.lseg.throttle import ConcurrencyController, Throttle, TokenBucket
+from tests.dmd_server import DMDServer
+from tests.harness import MINUTES, SYNC_DAY, new_plugin, sync_rows
+
+TABLES = 8
+
+
+def respond(controller: ConcurrencyController, latency: float = 0.01, **kwargs):
+    controller.release(controller.acquire(), "feed", latency, **kwargs)
+
+
+def test_window_doubles_until_the_first_backoff_then_grows_linearly():
+    controller = ConcurrencyController(2, 1, 100, latency_tolerance=3.0)
+    for _ in range(6):
+        respond(controller, overloaded=False)
+    assert controller.window == 8
+    respond(controller, overloaded=True)
+    assert controller.window == 4
+    # About one more per window's worth of responses.
+    for _ in range(5):
+        respond(controller, overloaded=False)
+    assert controller.window == 5
+
+
+def test_overload_halves_the_window_once_per_round_trip():
+    controller = ConcurrencyController(8, 1, 8, latency_tolerance=3.0)
+    epochs = [controller.acquire() for _ in range(8)]
+    for epoch in epochs:
+        controller.release(epoch, "feed", None, overloaded=True)
+    assert controller.window == 4
+    assert controller.summary()["backoffs"] == 1
+    for _ in range(10):
+        respond(controller, overloaded=True)
+    assert controller.window == 1
+
+
+def test_latency_spikes_back_off_after_warmup():
+    controller = ConcurrencyController(8, 1, 8, latency_tolerance=3.0)
+    for _ in range(3):
+        respond(controller, latency=0.05, overloaded=False)
+    respond(controller, latency=1.0, overloaded=False)
+    assert controller.window == 8
+    for _ in range(50):
+        respond(controller, latency=0.05, overloaded=False)
+    # Within the slack of the usual latency, not a spike.
+    respond(controller, latency=0.12, overloaded=False)
+    assert controller.window == 8
+    respond(controller, latency=1.0, overloaded=False)
+    assert controller.window == 4
+
+
+def test_token_bucket_spaces_requests_after_a_burst():
+    bucket = TokenBucket(rate=50, burst=5)
+    started = time.monotonic()
+    for _ in range(15):
+        bucket.take()
+    assert time.monotonic() - started >= 0.18
+
+
+def test_retry_after_pauses_every_request():
+    bucket = TokenBucket(rate=0, burst=1)
+    throttle = Throttle(bucket, ConcurrencyController(4, 1, 4, latency_tolerance=3.0))
+    response = Response()
+    response.status_code = 429
+    response.headers["Retry-After"] = "0.2"
+    with pytest.raises(HTTPError):
+        with throttle.request("feed"):
+            raise HTTPError(response=response)
+    assert throttle.controller.window == 2
+    started = time.monotonic()
+    with throttle.request("feed"):
+        pass
+    assert time.monotonic() - started >= 0.15
+
+
+def test_sync_backs_off_a_throttling_endpoint(dmd_server):
+    dmd_server.max_in_flight = 4
+    dmd_server.latency = 0.01
+    lseg = new_plugin(dmd_server, retry_limit=10, backoff_base_seconds=0.01)
+    rows = sync_rows(lseg)
+    assert all(count == MINUTES * dmd_server.rows for count in rows.values())
+    assert len(rows) == TABLES
+    assert dmd_server.requests["throttled"] > 0
+    summary = lseg._client.client.throttle.summary()
+    assert summary["backoffs"] > 0
+    assert summary["window"] < summary["max_in_flight"]
+
+
+@pytest.mark.parametrize(
+    "spec",
+    [{"bulk": False, "discovery": "none"}, {"bulk": True}],
+    ids=["minute_files", "archive"],
+)
+def test_cached_sync_makes_no_requests(tmp_path, spec):
+    # Every minute of the session is published, the whole day is cached.
+    with DMDServer(days=[SYNC_DAY], rows=1, archives=spec["bulk"]) as server:
+        spec = {**spec, "cache_dir": str(tmp_path / "cache"), "initial_in_flight": 2}
+        first = sync_rows(new_plugin(server, **spec), ["xlon_post_delayed"])
+        assert first["xlon_post_delayed"] > 0
+        requests = server.requests["http"]
+        lseg = new_plugin(server, **spec)
+        assert sync_rows(lseg, ["xlon_post_delayed"]) == first
+        # Served from disk without logging in or taking a throttle slot.
+        assert server.requests["http"] == requests
+        assert server.requests["login"] == 1
+        # No response reached the window, it neither grew nor backed off.
+        summary = lseg._client.client.throttle.summary()
+        assert (summary["window"], summary["backoffs"]) == (2, 0)
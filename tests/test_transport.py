@@ -0,0 +1,76 @@
+import socket
+
+import pytest
+from requests.exceptions import ConnectionError, Timeout
+
+from plugin.lseg.transport import HTTP2Adapter, KeepAliveAdapter, new_session
+from tests.harness import MINUTES, new_plugin, sync_rows
+
+TABLE = "xlon_post_delayed"
+
+
+def adapter(lseg, server):
+    return lseg._client.client.session().get_adapter(server.base_url)
+
+
+@pytest.mark.parametrize("stream", [False, True], ids=["buffered", "stream"])
+def test_sync_through_http2_adapter(dmd_server, stream):
+    pytest.importorskip("h2")
+    dmd_server.gzip = True
+    # A relogin half way has to carry the new session cookie over.
+    dmd_server.expire_after = MINUTES // 2
+    lseg = new_plugin(dmd_server, http2=True, stream=stream)
+    rows = sync_rows(lseg, [TABLE])
+    assert rows[TABLE] == MINUTES * dmd_server.rows
+    assert isinstance(adapter(lseg, dmd_server), HTTP2Adapter)
+    assert dmd_server.requests["signed_in"] == 2
+    lseg.close()
+
+
+def test_http2_failures_are_retried_and_back_off(dmd_server):
+    pytest.importorskip("h2")
+    dmd_server.drops = 2
+    lseg = new_plugin(dmd_server, http2=True, backoff_base_seconds=0.01)
+    rows = sync_rows(lseg, [TABLE])
+    assert rows[TABLE] == MINUTES * dmd_server.rows
+    metrics = lseg._client.metrics
+    assert metrics.counter_value("lseg_http_retries", feed="LSE-Post-Trade") == 2
+    assert lseg._client.client.throttle.summary()["backoffs"] > 0
+    lseg.close()
+
+
+def test_http2_errors_are_raised_as_requests_errors():
+    pytest.importorskip("h2")
+    session = new_session(1, 0.2, http2=True)
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        port = listener.getsockname()[1]
+        # Accepted by the backlog but never answered.
+        listener.listen()
+        with pytest.raises(Timeout):
+            session.get(f"http://127.0.0.1:{port}/dmd/login.html")
+    # Nothing listens on the port any more.
+    with pytest.raises(ConnectionError):
+        session.get(f"http://127.0.0.1:{port}/dmd/login.html")
+    session.close()
+
+
+def test_keep_alive_reuses_connections(dmd_server):
+    lseg = new_plugin(dmd_server, concurrency=1, prefetch_window=2)
+    rows = sync_rows(lseg, [TABLE])
+    assert rows[TABLE] == MINUTES * dmd_server.rows
+    keep_alive = adapter(lseg, dmd_server)
+    assert isinstance(keep_alive, KeepAliveAdapter)
+    options = keep_alive.poolmanager.connection_pool_kw["socket_options"]
+    assert (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1) in options
+    # The login, the listing and every minute file over the pool's two
+    # connections.
+    assert dmd_server.requests["connection"] <= 2
+    assert dmd_server.requests["http"] > MINUTES
+
+
+def test_connections_close_without_keep_alive(dmd_server):
+    lseg = new_plugin(dmd_server, keep_alive=False)
+    rows = sync_rows(lseg, [TABLE])
+    assert rows[TABLE] == MINUTES * dmd_server.rows
+    assert dmd_server.requests["connection"] == dmd_server.requests["http"]